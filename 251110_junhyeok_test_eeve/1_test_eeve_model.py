@@ -1,6 +1,9 @@
 # test_eeve_model.py
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import os
 import torch
+from fast_startup import load_model_fast
+from perf_utils import current_rss_mb
+from prompt_cache import PromptCache
 
 print("=" * 60)
 print("EEVE-Korean 모델 테스트 시작")
@@ -9,45 +12,52 @@ print("=" * 60)
 # 모델 이름
 model_name = "yanolja/EEVE-Korean-Instruct-10.8B-v1.0"
 
-print("\n[1/3] 토크나이저 로딩 중...")
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-print("✅ 토크나이저 로드 완료")
+# 로딩 모드: auto(GPU fp16 / CPU bf16), bf16, fp32, int8-dynamic, int8-weight, int4-weight
+LOAD_MODE = os.getenv("EEVE_LOAD_MODE", "auto")
 
-print("\n[2/3] 모델 로딩 중... (처음엔 다운로드로 5-10분 소요)")
-print("모델 크기: 약 22GB")
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    torch_dtype=torch.float16,
-    device_map="auto"
-)
-print("✅ 모델 로드 완료")
+# fast_startup.py convert 로 만든 로컬 shard 디렉터리 (있으면 허브 대신 사용)
+LOCAL_DIR = os.getenv("EEVE_LOCAL_DIR")
+
+print("\n[1/2] 토크나이저 및 모델 로딩 중... (처음엔 다운로드로 5-10분 소요)")
+print(f"모델 크기: 약 22GB (fp16 기준), 로딩 모드: {LOAD_MODE}")
+if not LOCAL_DIR:
+    print("💡 python fast_startup.py convert --out <dir> 로 변환 후 EEVE_LOCAL_DIR=<dir> 로 실행하면 더 빨리 뜹니다.")
+tokenizer, model = load_model_fast(model_name, mode=LOAD_MODE, local_dir=LOCAL_DIR)
 
-print("\n[3/3] GPU 메모리 확인")
+print("\n[2/2] 메모리 확인")
 if torch.cuda.is_available():
     print(f"GPU: {torch.cuda.get_device_name(0)}")
     print(f"사용 중인 VRAM: {torch.cuda.memory_allocated(0) / 1024**3:.2f} GB")
     print(f"예약된 VRAM: {torch.cuda.memory_reserved(0) / 1024**3:.2f} GB")
+else:
+    print(f"RAM (RSS): {current_rss_mb() / 1024:.2f} GB")
+
+# 시스템 프롬프트는 두 테스트가 같으므로 토큰 / prefill 을 한 번만 계산해서 재사용
+SYSTEM_PROMPT = "당신은 친절한 AI 어시스턴트입니다."
+prompt_cache = PromptCache(tokenizer, model)
+
+def system_prefix_cache(input_ids):
+    """input_ids 가 시스템 프롬프트 토큰으로 시작할 때만 공유 prefill 캐시를, 아니면 None 을 돌려준다
+    (kv_session.ChatSession._reuse_prefix 와 같은 조건)"""
+    head_ids = prompt_cache.head_ids(SYSTEM_PROMPT)
+    if head_ids is not None and len(head_ids) < len(input_ids) \
+            and torch.equal(input_ids[:len(head_ids)], head_ids):
+        return prompt_cache.prefill(SYSTEM_PROMPT)
+    return None
 
 # 테스트 1
 print("\n" + "=" * 60)
 print("테스트 1: 자기소개")
 print("=" * 60)
 
-messages = [
-    {"role": "system", "content": "당신은 친절한 AI 어시스턴트입니다."},
-    {"role": "user", "content": "안녕하세요! 간단히 자기소개를 해주세요."}
-]
-
-input_text = tokenizer.apply_chat_template(
-    messages,
-    tokenize=False,
-    add_generation_prompt=True
-)
-
-inputs = tokenizer(input_text, return_tensors="pt").to(model.device)
+input_ids = prompt_cache.encode(SYSTEM_PROMPT, "안녕하세요! 간단히 자기소개를 해주세요.")
+past_key_values = system_prefix_cache(input_ids)
+input_ids = input_ids.unsqueeze(0).to(model.device)
 
 outputs = model.generate(
-    **inputs,
+    input_ids=input_ids,
+    attention_mask=torch.ones_like(input_ids),
+    past_key_values=past_key_values,
     max_new_tokens=200,
     temperature=0.7,
     do_sample=True,
@@ -63,21 +73,14 @@ print("\n" + "=" * 60)
 print("테스트 2: 한국어 이해 및 추론")
 print("=" * 60)
 
-messages = [
-    {"role": "system", "content": "당신은 친절한 AI 어시스턴트입니다."},
-    {"role": "user", "content": "이태원 참사 같은 대규모 사고를 예방하려면 어떤 대책이 필요할까요?"}
-]
-
-input_text = tokenizer.apply_chat_template(
-    messages,
-    tokenize=False,
-    add_generation_prompt=True
-)
-
-inputs = tokenizer(input_text, return_tensors="pt").to(model.device)
+input_ids = prompt_cache.encode(SYSTEM_PROMPT, "이태원 참사 같은 대규모 사고를 예방하려면 어떤 대책이 필요할까요?")
+past_key_values = system_prefix_cache(input_ids)
+input_ids = input_ids.unsqueeze(0).to(model.device)
 
 outputs = model.generate(
-    **inputs,
+    input_ids=input_ids,
+    attention_mask=torch.ones_like(input_ids),
+    past_key_values=past_key_values,
     max_new_tokens=300,
     temperature=0.7,
     do_sample=True,
@@ -88,6 +91,8 @@ response = tokenizer.decode(outputs[0], skip_special_tokens=True)
 response = response.split("assistant")[-1].strip()
 print(f"\n응답:\n{response}")
 
+print("\n" + prompt_cache.summary())
+
 print("\n" + "=" * 60)
 print("✅ 모든 테스트 완료!")
 print("=" * 60)
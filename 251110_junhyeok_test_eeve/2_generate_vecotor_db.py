@@ -3,12 +3,10 @@
 # pip install -U sentence-transformers faiss-cpu transformers safetensors
 # ========================================================
 
-from transformers import AutoTokenizer, AutoModel
-import torch
-import faiss
-import numpy as np
-import pickle
 import os
+from embedding_service import get_embedder
+from parallel_encoder import ParallelEmbedder
+from vector_store import VectorStore, content_hash, iter_documents
 
 # ============================================
 # 1) 편향 데이터 (예시)
@@ -21,48 +19,60 @@ biased_texts = [
     "머신러닝 모델은 파라미터만 늘리면 성능이 무조건 좋아진다.",
 ]
 
-# ============================================
-# 2) 모델 & 토크나이저 로딩 (safetensors)
-# ============================================
-model_name = "jhgan/ko-sroberta-multitask"
-
-print("🔥 토크나이저 및 모델 로딩 중...")
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModel.from_pretrained(model_name, device_map="auto")
-
-# ============================================
-# 3) 문장 → 임베딩
-# ============================================
-def mean_pooling(model_output, attention_mask):
-    token_embeddings = model_output[0]
-    input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-    return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
+# biased_corpus.txt (한 줄에 한 문장) / .jsonl / .json ({"id": ..., "text": ...} 또는 문자열) 이 있으면 그걸 사용
+# (id 가 있으면 문서 key 로 써서 같은 id 의 내용이 바뀌면 수정으로 처리, 없으면 내용 해시가 key)
+CORPUS = os.getenv("VECTOR_CORPUS") or next(
+    (p for p in ("biased_corpus.txt", "biased_corpus.jsonl", "biased_corpus.json") if os.path.exists(p)), None)
+BATCH_SIZE = int(os.getenv("VECTOR_BATCH_SIZE", "64"))
+# 3_use_vecotr.py 질의 임베딩과 같은 길이에서 잘라야 같은 벡터 공간 (ko-sroberta-multitask 는 128)
+MAX_LENGTH = int(os.getenv("VECTOR_MAX_LENGTH", "128"))
+# 인덱스 종류: flat (전체 탐색) / ivf-flat / ivf-pq / hnsw (근사 탐색, ann_index.py 벤치마크 참고)
+INDEX_TYPE = os.getenv("VECTOR_INDEX", "flat")
+NLIST = int(os.getenv("VECTOR_NLIST", "1024"))
+PQ_M = int(os.getenv("VECTOR_PQ_M", "64"))
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+# 임베딩 워커 프로세스 수 (1 이면 이 프로세스에서, 0 이면 코어 수 / VECTOR_THREADS_PER_WORKER)
+WORKERS = int(os.getenv("VECTOR_WORKERS", "1"))
+THREADS_PER_WORKER = int(os.getenv("VECTOR_THREADS_PER_WORKER", "0")) or None
 
-encoded_input = tokenizer(biased_texts, padding=True, truncation=True, return_tensors="pt")
-# 입력을 모델의 device로 옮기기 (GPU or CPU)
-encoded_input = {key: val.to(model.device) for key, val in encoded_input.items()}
+# VECTOR_WORKERS 워커 프로세스는 spawn 으로 이 스크립트를 다시 import 하므로 아래는 직접 실행할 때만
+if __name__ == "__main__":
+    # ============================================
+    # 2) 기존 Vector DB 와 비교
+    # ============================================
+    # 길이가 비슷한 문장끼리 배치로 묶어 mean pooling 임베딩 (모델은 실제로 임베딩할 문장이 있을 때 로딩)
+    # 전에 임베딩한 문장은 embedding_cache.sqlite 에서 꺼내고, 전부 캐시에 있으면 모델을 로딩하지 않음
+    # (EMBEDDING_SERVER_URL 이 있으면 embedding_service.py serve 서버 사용)
+    if WORKERS == 1:
+        embedder = get_embedder(batch_size=BATCH_SIZE, max_length=MAX_LENGTH)
+    else:
+        # 워커 프로세스마다 코어를 나눠 인코더를 올리고, 연속 구간 shard 를 나눠 임베딩한 뒤 원래 순서로 합침
+        embedder = ParallelEmbedder(batch_size=BATCH_SIZE, max_length=MAX_LENGTH, num_workers=WORKERS or None,
+                                    threads_per_worker=THREADS_PER_WORKER)
 
-with torch.no_grad():
-    model_output = model(**encoded_input)
-    sentence_embeddings = mean_pooling(model_output, encoded_input["attention_mask"])
-    # GPU에서 CPU로 변환 후 numpy로
-    sentence_embeddings = sentence_embeddings.cpu().numpy()
+    # 내용 해시 manifest 로 새로 생겼거나 바뀐 문서만 임베딩 (코퍼스에서 사라진 문서는 삭제)
+    # 인덱스 / 문장 .bin / .idx / 해시 manifest 는 biased_db.current 가 가리키는 세대 파일 (3_use_vecotr.py 가 mmap 으로 읽음)
+    # manifest 에 기록된 임베딩 설정 (모델 / max_length / backend) 과 다르면 전부 다시 임베딩
+    store = VectorStore("biased_db", index_type=INDEX_TYPE, nlist=NLIST, pq_m=PQ_M, hnsw_m=HNSW_M,
+                        embedder_info=embedder.info())
+    documents = iter_documents(CORPUS) if CORPUS else ((content_hash(t), t) for t in biased_texts)
+    changed, removed = store.diff(documents, delete_missing=True)
+    store.delete(removed)
 
-print(f"임베딩 shape: {sentence_embeddings.shape}")
-
-# ============================================
-# 4) FAISS Index 생성
-# ============================================
-dimension = sentence_embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(sentence_embeddings)
-print(f"총 벡터 개수: {index.ntotal}")
-
-# ============================================
-# 5) 저장
-# ============================================
-faiss.write_index(index, "biased_db.index")
-with open("biased_texts.pkl", "wb") as f:
-    pickle.dump(biased_texts, f)
+    # ============================================
+    # 3) 바뀐 문서만 임베딩 → FAISS Index 반영
+    # ============================================
+    # 같은 key 는 같은 id 로 교체
+    if changed and WORKERS == 1:
+        store.upsert(changed, embedder)
+    elif changed:
+        with embedder:
+            store.upsert(changed, embedder, chunk_size=embedder.chunk_size)
 
-print("✅ Vector DB 저장 완료: biased_db.index")
\ No newline at end of file
+    # ============================================
+    # 4) 저장
+    # ============================================
+    if changed or removed:
+        store.save()
+    else:
+        print("✅ 변경된 문서가 없어 Vector DB 를 그대로 둡니다.")
@@ -3,64 +3,83 @@
 # =========================================================
 
 # 0) 필요한 라이브러리
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from sentence_transformers import SentenceTransformer
-import torch
-import faiss
-import pickle
+import json
+import os
+import time
+from corpus_encoder import iter_texts
+from model_loader import load_model
+from retriever import Retriever, build_prompts, build_rag_prompt
 
 # =========================================================
 # 1) Vector DB & 임베딩 모델 로드
 # =========================================================
-index = faiss.read_index("biased_db.index")
-with open("biased_texts.pkl", "rb") as f:
-    biased_texts = pickle.load(f)
+# 인덱스와 문장 모두 메모리 맵으로 열어서 검색이 건드린 페이지만 읽음
+# (같은 서버의 여러 프로세스가 페이지 캐시를 공유하므로 프로세스마다 복사본을 올리지 않음)
+# 근사 인덱스(ivf-*, hnsw) 의 질의 설정: 클수록 정확하고 느림 (flat 이면 무시)
+NPROBE = int(os.getenv("VECTOR_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "64"))
 
-embedding_model_name = "jhgan/ko-sroberta-multitask"
-embedding_model = SentenceTransformer(embedding_model_name)
+# 인덱스 id → 문장 (2_generate_vecotor_db.py 가 추가 / 수정 / 삭제하면서 관리)
+# 임베딩은 2_generate_vecotor_db.py 와 같은 경로 (manifest 에 기록된 모델 / max_length / backend, mean pooling)
+# EMBEDDING_SERVER_URL 이 있으면 이미 떠 있는 embedding_service.py 서버를 씀
+start = time.perf_counter()
+retriever = Retriever("biased_db", nprobe=NPROBE, ef_search=EF_SEARCH)
+print(f"✅ Vector DB 열기: 문서 {len(retriever.texts)}개 ({(time.perf_counter() - start) * 1000:.1f}ms)")
 
 def retrieve(query, top_k=3):
-    query_vec = embedding_model.encode([query], convert_to_numpy=True)
-    distances, indices = index.search(query_vec, top_k)
-    return [biased_texts[i] for i in indices[0]]
+    # 문서 수가 top_k 보다 적으면 top_k 개보다 적게 나옴
+    return [text for text, _ in retriever.retrieve(query, top_k)]
+
+# 질문 파일이 있으면 한 번에 검색해서 답변을 JSONL 로 저장 (.txt 한 줄에 하나 / .jsonl {"question": ...})
+QUESTIONS = os.getenv("RAG_QUESTIONS")
+OUTPUT = os.getenv("RAG_OUTPUT", "rag_answers.jsonl")
 
 # =========================================================
 # 2) LLM 로드 (EEVE-Korean 예시)
 # =========================================================
 llm_model_name = "yanolja/EEVE-Korean-Instruct-10.8B-v1.0"
 
+# 로딩 모드: auto(GPU fp16 / CPU bf16), bf16, fp32, int8-dynamic, int8-weight, int4-weight
+LOAD_MODE = os.getenv("EEVE_LOAD_MODE", "auto")
+
 print("🔥 LLM 토크나이저 및 모델 로딩 중...")
-tokenizer = AutoTokenizer.from_pretrained(llm_model_name)
-llm = AutoModelForCausalLM.from_pretrained(
-    llm_model_name,
-    device_map="auto",
-    torch_dtype=torch.float16
-)
-print("✅ LLM 로드 완료")
+tokenizer, llm = load_model(llm_model_name, mode=LOAD_MODE)
 
 # =========================================================
 # 3) RAG용 프롬프트 생성 함수
 # =========================================================
+def generate_answer(prompt, max_new_tokens=150):
+    # LLM 토크나이징 → 답변 생성
+    inputs = tokenizer(prompt, return_tensors="pt").to(llm.device)
+    output_ids = llm.generate(**inputs, max_new_tokens=max_new_tokens)
+    return tokenizer.decode(output_ids[0], skip_special_tokens=True)
+
 def generate_rag_response(query, top_k=3, max_new_tokens=150):
     # 1) Vector DB 검색
     retrieved_texts = retrieve(query, top_k)
     
     # 2) 검색 결과를 프롬프트에 포함
-    context = "\n".join([f"- {t}" for t in retrieved_texts])
-    prompt = f"다음 정보를 참고하여 질문에 답하세요:\n{context}\n\n질문: {query}\n답변:"
+    prompt = build_rag_prompt(query, retrieved_texts)
     
-    # 3) LLM 토크나이징
-    inputs = tokenizer(prompt, return_tensors="pt").to(llm.device)
-    
-    # 4) 답변 생성
-    output_ids = llm.generate(**inputs, max_new_tokens=max_new_tokens)
-    answer = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-    
-    return answer
+    # 3) 답변 생성
+    return generate_answer(prompt, max_new_tokens)
+
+def run_question_file(path, out_path, top_k=3, max_new_tokens=150):
+    # 질문을 묶어서 임베딩 + index.search 한 번 (retrieve_many) → 프롬프트마다 답변 생성
+    count = 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        for record in build_prompts(retriever, iter_texts(path, "question"), top_k):
+            record["answer"] = generate_answer(record["prompt"], max_new_tokens)
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"✅ 질문 {count}개 답변 저장: {out_path}")
 
 # =========================================================
 # 4) 테스트
 # =========================================================
-query = "요즘 스마트폰 게임이 왜 문제인가요?"
-answer = generate_rag_response(query)
-print("\n✅ RAG LLM 답변:\n", answer)
+if QUESTIONS:
+    run_question_file(QUESTIONS, OUTPUT)
+else:
+    query = "요즘 스마트폰 게임이 왜 문제인가요?"
+    answer = generate_rag_response(query)
+    print("\n✅ RAG LLM 답변:\n", answer)
@@ -3,8 +3,45 @@
 # ============================================
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import torch
+from torch.utils.data import DataLoader
 from datasets import Dataset
+import hashlib
+import json
 import os
+from checkpoint import AsyncCheckpointer
+from dpo import DPODataset, compute_reference_logps, train_dpo
+from lora import apply_lora, count_parameters, merge_lora, save_adapter, trainable_parameters
+from perf_utils import peak_rss_mb
+from sft_data import LengthBucketSampler, SFTCollator, tokenize_sft_example
+from token_store import build_token_store
+from train_metrics import StepMetrics, parse_profile
+
+# 배치 크기 / gradient accumulation / 최대 길이
+BATCH_SIZE = int(os.getenv("SFT_BATCH_SIZE", "16"))
+GRAD_ACCUM_STEPS = int(os.getenv("SFT_GRAD_ACCUM", "1"))
+MAX_LENGTH = int(os.getenv("SFT_MAX_LENGTH", "128"))
+# 학습 방식: full (전체 파라미터) / lora (LoRA 어댑터만 학습)
+TRAIN_MODE = os.getenv("SFT_TRAIN_MODE", "full")
+LORA_R = int(os.getenv("LORA_R", "8"))
+LORA_ALPHA = float(os.getenv("LORA_ALPHA", "16"))
+# lora 모드에서 학습 후 어댑터를 원래 가중치에 합쳐 ./sft_detox_model 에도 저장할지 여부
+LORA_MERGE = os.getenv("LORA_MERGE", "1") == "1"
+LEARNING_RATE = float(os.getenv("SFT_LR", "1e-4" if TRAIN_MODE == "lora" else "5e-5"))
+# activation checkpointing: 레이어 출력을 저장하지 않고 backward 때 다시 계산 (긴 시퀀스용, 기본은 512 토큰 이상일 때)
+GRAD_CHECKPOINT = os.getenv("SFT_GRAD_CHECKPOINT", "1" if MAX_LENGTH >= 512 else "0") == "1"
+# optimizer step 마다 체크포인트 저장 (0 이면 저장 안 함), SFT_RESUME=1 이면 중간에 끊긴 학습을 가장 최근 체크포인트에서 재개
+# (학습을 끝까지 마치면 체크포인트를 지우므로 다시 실행하면 처음부터 학습,
+#  데이터셋 / 모델 / 하이퍼파라미터가 다른 체크포인트면 경고 후 SFT_CKPT_DIR-<해시> 에서 처음부터 학습)
+CKPT_DIR = os.getenv("SFT_CKPT_DIR", "./sft_checkpoints")
+CKPT_EVERY = int(os.getenv("SFT_CKPT_EVERY", "50"))
+RESUME = os.getenv("SFT_RESUME", "1") == "1"
+# step 별 지표(JSONL, 빈 값이면 기록 안 함) / profiler 구간 ("건너뛸 step 수,기록할 step 수", 예: "5,3" → 6~8번째 step)
+METRICS_PATH = os.getenv("SFT_METRICS_PATH", "./sft_metrics.jsonl")
+PROFILE = parse_profile(os.getenv("SFT_PROFILE", ""))
+# DPO 설정 (DPO_EPOCHS=0 이면 DPO 단계 생략)
+DPO_BETA = float(os.getenv("DPO_BETA", "0.1"))
+DPO_EPOCHS = int(os.getenv("DPO_EPOCHS", "1"))
+DPO_BATCH_SIZE = int(os.getenv("DPO_BATCH_SIZE", "8"))
 
 # ============================================
 # 1) 데이터셋
@@ -16,59 +53,199 @@ sft_data = [
      "output": "신입 개발자는 다양한 경로로 커리어를 쌓을 수 있습니다."},
 ]
 
-dataset = Dataset.from_list(sft_data)
-
-# ============================================
-# 2) 모델 및 토크나이저
-# ============================================
-model_name = "gpt2"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(model_name)
-
-tokenizer.pad_token = tokenizer.eos_token
-device = torch.device("cpu")
-model.to(device)
-
-def tokenize_fn(example):
-    enc = tokenizer(example["input"], truncation=True, padding="max_length", max_length=32, return_tensors="pt")
-    dec = tokenizer(example["output"], truncation=True, padding="max_length", max_length=32, return_tensors="pt")
-    enc["labels"] = dec["input_ids"]
-    return enc
-
-tokenized_dataset = [tokenize_fn(x) for x in sft_data]
-
-# ============================================
-# 3) 학습 루프 (CPU-safe)
-# ============================================
-optimizer = torch.optim.AdamW(model.parameters(), lr=5e-5)
-num_epochs = 1
+# sft_dataset.json / sft_dataset.jsonl ({"input": ..., "output": ...}) 이 있으면 그걸 사용
+# (token_store 가 스트리밍으로 토크나이징해서 캐시하므로 리스트로 올리지 않음)
+SFT_DATASET = next((p for p in ("sft_dataset.jsonl", "sft_dataset.json") if os.path.exists(p)), None)
 
-print("🔥 SFT 학습 시작...")
-model.train()
-for epoch in range(num_epochs):
-    for batch in tokenized_dataset:
-        input_ids = batch["input_ids"].to(device)
-        attention_mask = batch["attention_mask"].to(device)
-        labels = batch["labels"].to(device)
-
-        outputs = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels)
-        loss = outputs.loss
+dataset = Dataset.from_list(sft_data)
 
+def print_trainable(model):
+    trainable, total = count_parameters(model)
+    print(f"🧮 학습 파라미터: {trainable:,} / {total:,} ({trainable / total * 100:.2f}%)")
+
+def save_trained(model, tokenizer, model_dir, base_model=None):
+    """full 은 모델 전체, lora 는 어댑터를 {model_dir}_lora 에 저장하고 LORA_MERGE 면 합쳐서 전체도 저장"""
+    if TRAIN_MODE == "lora":
+        save_adapter(model, f"{model_dir}_lora", base_model=base_model)
+        tokenizer.save_pretrained(f"{model_dir}_lora")
+        if not LORA_MERGE:
+            return
+        merge_lora(model)
+    os.makedirs(model_dir, exist_ok=True)
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    print(f"✅ 학습된 가중치 저장 완료: {model_dir}")
+
+# token_store 는 spawn 워커로 토크나이징하므로 (학습 스크립트를 fork 하지 않음) 워커가 이 파일을 다시 import 할 때
+# 모델 로딩 / 학습이 다시 실행되지 않도록 __main__ 가드 안에서 실행
+if __name__ == "__main__":
+    # ============================================
+    # 2) 모델 및 토크나이저
+    # ============================================
+    model_name = "gpt2"
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+
+    tokenizer.pad_token = tokenizer.eos_token
+    device = torch.device("cpu")
+    model.to(device)
+
+    # lora 모드: 원래 가중치는 고정하고 attention 레이어에 LoRA 만 추가
+    # (optimizer 상태와 gradient 가 LoRA 파라미터 크기만큼만 필요)
+    if TRAIN_MODE == "lora":
+        apply_lora(model, r=LORA_R, alpha=LORA_ALPHA)
+
+    if GRAD_CHECKPOINT:
+        # 메모리는 레이어 수에 비례하던 activation 대신 레이어 하나 분량, 대신 forward 를 한 번 더 함
+        # (use_reentrant=False: LoRA 처럼 입력 임베딩이 고정돼 있어도 gradient 가 흐름)
+        model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
+        print("🧠 gradient checkpointing 사용")
+
+    print_trainable(model)
+
+    # 입력 + 출력을 한 시퀀스로 이어 붙이고, loss 는 출력 부분에만 걸림
+    # (6_llm_conversation.py 에서 입력 뒤에 이어서 생성하는 방식과 같음)
+    if SFT_DATASET:
+        # 토크나이저 해시로 캐시된 메모리 맵 저장소 (다시 실행하면 토크나이징 생략)
+        tokenized_dataset = build_token_store(SFT_DATASET, tokenizer, max_length=MAX_LENGTH)
+        lengths = tokenized_dataset.lengths
+        # 저장소 이름 = 토크나이저 해시 + 원본 파일 (경로 / 크기 / 수정 시각) + 설정
+        dataset_hash = os.path.basename(tokenized_dataset.store_dir)
+    else:
+        tokenized_dataset = [tokenize_sft_example(tokenizer, x, max_length=MAX_LENGTH) for x in sft_data]
+        lengths = [len(x["input_ids"]) for x in tokenized_dataset]
+        dataset_hash = hashlib.sha256(json.dumps(sft_data, ensure_ascii=False).encode()).hexdigest()[:16]
+
+    # 길이가 비슷한 예제끼리 묶고, 배치 안의 최대 길이까지만 패딩
+    collator = SFTCollator(tokenizer.pad_token_id)
+    sampler = LengthBucketSampler(lengths, BATCH_SIZE)
+    # num_workers=0: 워커 스레드/프로세스 없이 메인 프로세스에서 배치 생성 (아래 segfault 메모 참고)
+    # generator: epoch 마다 iterator 를 만들 때 전역 torch RNG 를 쓰지 않게 해서 재개 후 dropout 난수가 그대로 이어지게 함
+    loader = DataLoader(tokenized_dataset, batch_sampler=sampler, collate_fn=collator, num_workers=0,
+                        generator=torch.Generator())
+
+    # ============================================
+    # 3) 학습 루프 (CPU-safe)
+    # ============================================
+    optimizer = torch.optim.AdamW(trainable_parameters(model), lr=LEARNING_RATE)
+    num_epochs = 1
+
+    # 체크포인트는 optimizer.step() 직후에만 저장하므로 재개 시 accumulation 중간 gradient 는 없음
+    # 재개할 체크포인트가 같은 학습인지 확인하는 값 (하나라도 다르면 resume 이 거부)
+    fingerprint = {
+        "dataset": dataset_hash,
+        "model": model_name,
+        "train_mode": TRAIN_MODE,
+        "lora": [LORA_R, LORA_ALPHA] if TRAIN_MODE == "lora" else None,
+        "max_length": MAX_LENGTH,
+        "batch_size": BATCH_SIZE,
+        "grad_accum_steps": GRAD_ACCUM_STEPS,
+        "lr": LEARNING_RATE,
+        "num_epochs": num_epochs,
+    }
+    checkpointer = AsyncCheckpointer(CKPT_DIR, fingerprint=fingerprint) if CKPT_EVERY > 0 else None
+    start_epoch, start_batch, global_step = 0, 0, 0
+    if checkpointer and RESUME:
+        start_epoch, start_batch, global_step = checkpointer.resume(model, optimizer)
+
+    print(f"🔥 SFT 학습 시작... (예제 {len(tokenized_dataset)}개, 배치 {BATCH_SIZE}, "
+          f"accumulation {GRAD_ACCUM_STEPS})")
+    # data / forward / backward / optimizer 시간, tokens/sec, 패딩 비율, RSS 를 step 마다 기록
+    metrics = StepMetrics(METRICS_PATH, profile=PROFILE)
+    model.train()
+    for epoch in range(start_epoch, num_epochs):
+        # 재개한 epoch 은 이미 학습한 배치를 건너뜀 (배치 순서는 seed + epoch 로 같음)
+        sampler.set_epoch(epoch, start_batch if epoch == start_epoch else 0)
         optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
-        
-        print(f"Epoch {epoch+1}, Loss: {loss.item():.4f}")
-
-print("✅ SFT 학습 완료!")
-
-# ============================================
-# 4) 학습된 가중치 저장
-# ============================================
-os.makedirs("./sft_detox_model", exist_ok=True)
-model.save_pretrained("./sft_detox_model")
-tokenizer.save_pretrained("./sft_detox_model")
-print("✅ 학습된 가중치 저장 완료: ./sft_detox_model")
+        for step, batch in enumerate(metrics.timed(loader), start=sampler.start_batch):
+            batch = {k: v.to(device) for k, v in batch.items()}
+
+            with metrics.phase("forward"):
+                outputs = model(**batch)
+                # accumulation 동안 gradient 가 더해지므로 step 수로 나눠서 평균을 맞춤
+                loss = outputs.loss / GRAD_ACCUM_STEPS
+            with metrics.phase("backward"):
+                loss.backward()
+
+            if (step + 1) % GRAD_ACCUM_STEPS == 0 or step + 1 == len(loader):
+                with metrics.phase("optimizer"):
+                    optimizer.step()
+                    optimizer.zero_grad()
+                global_step += 1
+                if checkpointer and global_step % CKPT_EVERY == 0:
+                    checkpointer.save(model, optimizer, epoch, step + 1, global_step)
+
+            record = metrics.end_step(batch, outputs.loss.item(), epoch=epoch + 1, step=step + 1,
+                                      global_step=global_step)
+            print(f"Epoch {epoch+1}, Step {step+1}/{len(loader)}, Loss: {outputs.loss.item():.4f}, "
+                  f"{record['tokens_per_sec']:.0f} tokens/s")
+
+    if checkpointer:
+        checkpointer.wait()
+    metrics.close()
+    metrics.print_summary()
+    print(f"📦 패딩 비율: {collator.padding_ratio() * 100:.1f}%")
+    print(f"💾 최대 RSS: {peak_rss_mb():.0f}MB")
+    print("✅ SFT 학습 완료!")
+
+    # ============================================
+    # 4) 학습된 가중치 저장
+    # ============================================
+    save_trained(model, tokenizer, "./sft_detox_model")
+    if checkpointer:
+        checkpointer.clear()
+
+    # ============================================
+    # 5) DPO (SFT 모델을 참조 모델로 사용)
+    # ============================================
+    dpo_data = [
+        {"prompt": "요즘 게임은 전부 현질을 유도합니다.",
+         "chosen": "스마트폰 게임에는 결제를 유도하는 시스템이 있습니다.",
+         "rejected": "현질하는 놈들은 다 호구입니다."},
+        {"prompt": "신입 개발자는 대기업 가야 커리어가 열린다.",
+         "chosen": "신입 개발자는 다양한 경로로 커리어를 쌓을 수 있습니다.",
+         "rejected": "중소기업 가는 애들은 실력이 없는 겁니다."},
+    ]
+
+    # dpo_dataset.json / dpo_dataset.jsonl ({"prompt", "chosen", "rejected"}) 이 있으면 그걸 사용
+    DPO_DATASET = next((p for p in ("dpo_dataset.jsonl", "dpo_dataset.json") if os.path.exists(p)), None)
+
+    if DPO_EPOCHS > 0:
+        if DPO_DATASET:
+            dpo_dataset = DPODataset(
+                build_token_store(DPO_DATASET, tokenizer, MAX_LENGTH, input_key="prompt", output_key="chosen"),
+                build_token_store(DPO_DATASET, tokenizer, MAX_LENGTH, input_key="prompt", output_key="rejected"),
+            )
+        else:
+            dpo_dataset = DPODataset.from_examples(tokenizer, dpo_data, max_length=MAX_LENGTH)
+
+        # 어댑터를 합쳤으면 합쳐진 SFT 모델 위에 새 LoRA 를 붙여서 DPO
+        dpo_base = None
+        if TRAIN_MODE == "lora" and LORA_MERGE:
+            apply_lora(model, r=LORA_R, alpha=LORA_ALPHA)
+            dpo_base = "./sft_detox_model"
+        print_trainable(model)
+
+        # 정책을 업데이트하기 전의 SFT 모델로 참조 log-prob 을 한 번만 계산 (디스크 캐시)
+        # → 학습 중에는 정책 모델만 forward
+        ref_logps = compute_reference_logps(model, dpo_dataset, tokenizer.pad_token_id)
+
+        print("🔥 DPO 학습 시작...")
+        train_dpo(
+            model,
+            dpo_dataset,
+            ref_logps,
+            tokenizer.pad_token_id,
+            beta=DPO_BETA,
+            lr=float(os.getenv("DPO_LR", "5e-5" if TRAIN_MODE == "lora" else "5e-6")),
+            batch_size=DPO_BATCH_SIZE,
+            grad_accum_steps=GRAD_ACCUM_STEPS,
+            num_epochs=DPO_EPOCHS
+        )
+        print(f"💾 최대 RSS: {peak_rss_mb():.0f}MB")
+        print("✅ DPO 학습 완료!")
+
+        save_trained(model, tokenizer, "./dpo_detox_model", base_model=dpo_base)
 
 
 """
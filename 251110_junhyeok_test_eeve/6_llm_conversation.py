@@ -1,37 +1,99 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import os
 import torch
+from transformers import StoppingCriteriaList
+from assisted import check_draft_compatible
+from fast_startup import load_model_fast
+from kv_session import ChatSession
+from lora import adapter_base_model, load_adapter
+from memory_plan import plan_memory
+from model_loader import load_model
+from perf_utils import RssMonitor
+from stopping import LineBudgetCriteria, strip_control_chars, truncate_response
 
-print("🔥 모델 A 로딩...")
-tokenizer_a = AutoTokenizer.from_pretrained("yanolja/EEVE-Korean-Instruct-10.8B-v1.0")
-model_a = AutoModelForCausalLM.from_pretrained(
-    "yanolja/EEVE-Korean-Instruct-10.8B-v1.0",
-    torch_dtype=torch.float16,
-    device_map="auto"
+# 로딩 모드: auto(GPU fp16 / CPU bf16), bf16, fp32, int8-dynamic, int8-weight, int4-weight
+LOAD_MODE_A = os.getenv("EEVE_LOAD_MODE", "auto")
+LOAD_MODE_B = os.getenv("DETOX_LOAD_MODE", "fp32")
+# fast_startup.py convert 로 만든 모델 A 로컬 shard 디렉터리 (없으면 허브에서 로딩)
+LOCAL_DIR_A = os.getenv("EEVE_LOCAL_DIR")
+# 모델 A 의 assisted decoding 용 draft 모델 (비워두면 사용 안 함)
+DRAFT_MODEL_A = os.getenv("EEVE_DRAFT_MODEL")
+
+# 두 모델을 한 프로세스에 올릴 RAM 예산 (MB, 비워두면 현재 사용 가능한 RAM 기준)
+MEMORY_BUDGET_MB = os.getenv("MEMORY_BUDGET_MB")
+# 예산 초과 시 offload (레이어 일부를 디스크로) 또는 refuse (로딩 전에 중단)
+MEMORY_ON_EXCEED = os.getenv("MEMORY_ON_EXCEED", "offload")
+OFFLOAD_DIR = os.getenv("OFFLOAD_DIR", "./offload")
+# 모델 B 에 붙일 LoRA 어댑터 (4_SFT_DPO_test.py 의 lora 모드 결과, 예: ./sft_detox_model_lora)
+DETOX_ADAPTER = os.getenv("DETOX_ADAPTER")
+
+MODEL_A = "yanolja/EEVE-Korean-Instruct-10.8B-v1.0"
+# 어댑터를 쓰면 (이미 합쳐진 ./sft_detox_model 이 아니라) 어댑터를 학습한 원본 모델 위에 붙임
+MODEL_B = adapter_base_model(DETOX_ADAPTER) if DETOX_ADAPTER else "./sft_detox_model"
+
+# 로딩 전에 예상 최대 메모리를 계산해서 보여주고, 예산을 넘으면 오프로딩 / 중단
+planned = [("A", MODEL_A, LOAD_MODE_A), ("B", MODEL_B, LOAD_MODE_B)]
+if DRAFT_MODEL_A:
+    planned.insert(1, ("A-draft", DRAFT_MODEL_A, LOAD_MODE_A))
+memory_plan = plan_memory(
+    planned,
+    budget_mb=float(MEMORY_BUDGET_MB) if MEMORY_BUDGET_MB else None,
+    offload_dir=OFFLOAD_DIR,
+    on_exceed=MEMORY_ON_EXCEED
 )
+print(memory_plan.report())
+
+print("🔥 모델 A 로딩...")
+tokenizer_a, model_a = load_model_fast(MODEL_A, mode=LOAD_MODE_A, local_dir=LOCAL_DIR_A,
+                                       **memory_plan.load_kwargs("A"))
+
+draft_model_a = None
+if DRAFT_MODEL_A:
+    print(f"🔥 모델 A draft 로딩: {DRAFT_MODEL_A}")
+    draft_tokenizer_a, draft_model_a = load_model(DRAFT_MODEL_A, mode=LOAD_MODE_A,
+                                                  **memory_plan.load_kwargs("A-draft"))
+    check_draft_compatible(tokenizer_a, draft_tokenizer_a)
 
 print("🔥 모델 B 로딩...")
-tokenizer_b = AutoTokenizer.from_pretrained("./sft_detox_model")
-model_b = AutoModelForCausalLM.from_pretrained("./sft_detox_model")
-model_b.to("cuda" if torch.cuda.is_available() else "cpu")
+tokenizer_b, model_b = load_model(MODEL_B, mode=LOAD_MODE_B, **memory_plan.load_kwargs("B"))
+if DETOX_ADAPTER:
+    # 생성 속도가 원래 모델과 같도록 로드하면서 바로 합침
+    model_b = load_adapter(model_b, DETOX_ADAPTER, merge=True).eval()
+
+# 여러 토론을 한 배치로 돌릴 때는 왼쪽 패딩이 필요함 (생성은 오른쪽 끝에서 이어지므로)
+for tokenizer in (tokenizer_a, tokenizer_b):
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+SYSTEM_PROMPT_A = "당신은 게임과 현질에 대해 토론 중입니다. 2줄 이내의 짧은 답변만 하세요. 새로운 관점을 제시하세요."
 
-model_a.eval()
-model_b.eval()
+# 모델 A 는 시스템 프롬프트가 고정이므로 세션에 KV 캐시를 유지해 두고
+# 매 호출마다 새 발화 토큰만 prefill 한다 (draft 가 있으면 assisted decoding)
+session_a = ChatSession(model_a, tokenizer_a, SYSTEM_PROMPT_A, draft_model=draft_model_a)
 
-def generate_response_a(tokenizer, model, user_input, max_new_tokens=50):
+def generate_response_a(session, user_input, max_new_tokens=50):
     """모델 A: 2줄 이내 답변"""
     
-    messages = [
-        {"role": "system", "content": "당신은 게임과 현질에 대해 토론 중입니다. 2줄 이내의 짧은 답변만 하세요. 새로운 관점을 제시하세요."},
-        {"role": "user", "content": user_input}
-    ]
-    
-    input_text = tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True
+    # 2줄 / 100자를 채우면 그 자리에서 생성 중단
+    return session.chat(
+        user_input,
+        max_new_tokens=max_new_tokens,
+        keep_history=False,
+        max_lines=2,
+        max_chars=100
     )
+
+def generate_response_b(tokenizer, model, user_input, max_new_tokens=50):
+    """모델 B: 2줄 이내 답변"""
+    
+    prompt = f"상대방: {user_input}\n\n당신의 답변 (2줄 이내): "
     
-    inputs = tokenizer(input_text, return_tensors="pt").to(model.device)
+    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=200)
+    inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    prompt_length = inputs["input_ids"].shape[1]
+    
+    # 2줄 / 100자를 채우면 그 자리에서 생성 중단
+    budget = LineBudgetCriteria(tokenizer, prompt_length, normalize=strip_control_chars)
     
     with torch.no_grad():
         outputs = model.generate(
@@ -41,24 +103,63 @@ def generate_response_a(tokenizer, model, user_input, max_new_tokens=50):
             top_p=0.9,
             do_sample=True,
             pad_token_id=tokenizer.eos_token_id,
-            use_cache=False
+            stopping_criteria=StoppingCriteriaList([budget])
         )
     
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    if "assistant" in response:
-        response = response.split("assistant")[-1].strip()
+    # 프롬프트는 디코딩하지 않고 새로 생성된 부분만
+    response = tokenizer.decode(outputs[0, prompt_length:], skip_special_tokens=True)
+    response = strip_control_chars(response.strip())
+    return truncate_response(response)
+
+def generate_responses_a(session, user_inputs, max_new_tokens=50):
+    """모델 A: 여러 토론의 발화를 왼쪽 패딩 배치 하나로 생성
+    
+    (세션의 모델 / 토크나이저 / 시스템 프롬프트를 씀. assisted decoding 은 batch_size=1 만
+    지원하므로 배치 경로에서는 draft 를 쓰지 않음)
+    """
+    
+    if len(user_inputs) == 1:
+        return [generate_response_a(session, user_inputs[0], max_new_tokens)]
+    
+    tokenizer, model = session.tokenizer, session.model
     
-    # 2줄만 추출
-    lines = response.split('\n')[:2]
-    return '\n'.join(lines)[:100]
+    # 시스템 프롬프트 부분은 세션의 프롬프트 캐시에서 토큰을 재사용
+    encoded = [{"input_ids": session.prompt_cache.encode(session.system_prompt, user_input)}
+               for user_input in user_inputs]
+    inputs = tokenizer.pad(encoded, return_tensors="pt").to(model.device)
+    prompt_length = inputs["input_ids"].shape[1]
+    
+    # 예산을 채운 행은 먼저 끝나고, 모든 행이 끝나면 배치 전체가 멈춤
+    budget = LineBudgetCriteria(tokenizer, prompt_length)
+    
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            temperature=0.7,
+            top_p=0.9,
+            do_sample=True,
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=StoppingCriteriaList([budget])
+        )
+    
+    # 패딩 때문에 프롬프트 길이가 모두 같으므로 그 뒤만 디코딩
+    new_tokens = outputs[:, prompt_length:]
+    return [truncate_response(r) for r in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
 
-def generate_response_b(tokenizer, model, user_input, max_new_tokens=50):
-    """모델 B: 2줄 이내 답변"""
+def generate_responses_b(tokenizer, model, user_inputs, max_new_tokens=50):
+    """모델 B: 여러 토론의 발화를 왼쪽 패딩 배치 하나로 생성"""
     
-    prompt = f"상대방: {user_input}\n\n당신의 답변 (2줄 이내): "
+    if len(user_inputs) == 1:
+        return [generate_response_b(tokenizer, model, user_inputs[0], max_new_tokens)]
     
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=200)
+    prompts = [f"상대방: {user_input}\n\n당신의 답변 (2줄 이내): " for user_input in user_inputs]
+    
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=200)
     inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    prompt_length = inputs["input_ids"].shape[1]
+    
+    budget = LineBudgetCriteria(tokenizer, prompt_length, normalize=strip_control_chars)
     
     with torch.no_grad():
         outputs = model.generate(
@@ -67,26 +168,31 @@ def generate_response_b(tokenizer, model, user_input, max_new_tokens=50):
             temperature=0.7,
             top_p=0.9,
             do_sample=True,
-            pad_token_id=tokenizer.eos_token_id,
-            use_cache=False
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=StoppingCriteriaList([budget])
         )
     
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    response = response.replace(prompt, "").strip()
-    response = ''.join(c for c in response if ord(c) >= 0x20 or c in '\n\t')
-    
-    # 2줄만 추출
-    lines = response.split('\n')[:2]
-    return '\n'.join(lines)[:100]
+    new_tokens = outputs[:, prompt_length:]
+    responses = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+    return [truncate_response(strip_control_chars(r.strip())) for r in responses]
 
 print("="*70)
 print("LLM 대화: 요즘 게임과 현질")
 print("="*70)
 
-initial_topic = "요즘 게임은 현질을 유도합니다."
-conversation = []
+# 주제를 여러 개 넣으면 토론 N개를 턴 단위로 나란히 진행하면서
+# 매 턴 A, B 를 각각 배치 한 번씩만 호출함
+topics = [
+    "요즘 게임은 현질을 유도합니다.",
+]
+conversations = [[] for _ in topics]
+
+for i, topic in enumerate(topics):
+    print(f"\n🎯 주제 {i+1}: {topic}")
+print()
 
-print(f"\n🎯 주제: {initial_topic}\n")
+# 토론 중 실제 최대 RSS 기록 (호스트 크기 산정용)
+rss_monitor = RssMonitor().start()
 
 for turn in range(5):
     print(f"{'='*70}")
@@ -95,35 +201,45 @@ for turn in range(5):
     
     # 모델 A
     if turn == 0:
-        prompt_a = initial_topic
+        prompts_a = list(topics)
     else:
         # B의 마지막 답변만 사용
-        prompt_a = conversation[-1]['b']
+        prompts_a = [conversation[-1]['b'] for conversation in conversations]
     
-    response_a = generate_response_a(tokenizer_a, model_a, prompt_a)
-    print(f"A: {response_a}\n")
+    responses_a = generate_responses_a(session_a, prompts_a)
     
     # 모델 B
-    prompt_b = response_a
-    response_b = generate_response_b(tokenizer_b, model_b, prompt_b)
-    print(f"B: {response_b}\n")
+    prompts_b = responses_a
+    responses_b = generate_responses_b(tokenizer_b, model_b, prompts_b)
     
-    conversation.append({
-        "turn": turn + 1,
-        "a": response_a,
-        "b": response_b
-    })
+    for i, conversation in enumerate(conversations):
+        if len(topics) > 1:
+            print(f"[토론 {i+1}]")
+        print(f"A: {responses_a[i]}\n")
+        print(f"B: {responses_b[i]}\n")
+        
+        conversation.append({
+            "turn": turn + 1,
+            "a": responses_a[i],
+            "b": responses_b[i]
+        })
 
 print("="*70)
 print("✅ 대화 완료!")
+print(session_a.prompt_cache.summary())
+peak_mb = rss_monitor.stop()
+print(f"💾 토론 중 최대 RSS: {peak_mb:.0f}MB (예상 {memory_plan.expected_peak_mb:.0f}MB, "
+      f"예산 {memory_plan.budget_mb:.0f}MB)")
 print("="*70)
 
-# 저장
-with open("conversation_log.txt", "w", encoding="utf-8") as f:
-    f.write(f"주제: {initial_topic}\n\n")
-    for turn_data in conversation:
-        f.write(f"=== Turn {turn_data['turn']} ===\n")
-        f.write(f"A: {turn_data['a']}\n")
-        f.write(f"B: {turn_data['b']}\n\n")
-
-print("✅ 로그 저장: conversation_log.txt")
\ No newline at end of file
+# 저장 (토론이 여러 개면 토론마다 번호를 붙여 따로 저장)
+for i, (topic, conversation) in enumerate(zip(topics, conversations)):
+    log_path = "conversation_log.txt" if len(topics) == 1 else f"conversation_log_{i+1}.txt"
+    with open(log_path, "w", encoding="utf-8") as f:
+        f.write(f"주제: {topic}\n\n")
+        for turn_data in conversation:
+            f.write(f"=== Turn {turn_data['turn']} ===\n")
+            f.write(f"A: {turn_data['a']}\n")
+            f.write(f"B: {turn_data['b']}\n\n")
+    
+    print(f"✅ 로그 저장: {log_path}")
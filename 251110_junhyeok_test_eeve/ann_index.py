@@ -0,0 +1,253 @@
+"""
+FAISS 근사 최근접 이웃(ANN) 인덱스 종류 + recall / 지연시간 벤치마크
+
+IndexFlatL2 는 질의마다 모든 벡터와 거리를 계산하므로 코퍼스 크기에 비례해서 느려진다.
+
+- flat: 전체 탐색 (정확, 기본값)
+- ivf-flat: 벡터를 nlist 개 군집으로 나누고 질의와 가까운 nprobe 개 군집만 탐색
+- ivf-pq: ivf-flat + 벡터를 pq_m 개 부분 벡터의 8bit 코드로 압축 (메모리 ↓, 정확도 ↓)
+- hnsw: 근접 그래프 탐색 (efSearch 가 클수록 정확하고 느림, 학습 불필요)
+
+IVF 계열은 군집(및 PQ 코드북)을 학습해야 하므로 앞쪽 벡터 일부(train_size)를 모아
+학습한 뒤 추가한다. 모든 인덱스는 add_with_ids 로 문서 id 를 그대로 벡터 id 로 쓴다.
+
+사용 예:
+    index = create_index("ivf-flat", dim, train_vectors=sample, nlist=1024)
+    index.add_with_ids(vectors, ids)
+    set_search_params(index, nprobe=16)
+    distances, ids = index.search(query, 3)
+
+벤치마크:
+    python ann_index.py --sizes 10000,100000,1000000 --dim 768
+"""
+
+import argparse
+import math
+import time
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+# faiss 권장: 군집 하나당 학습 벡터 39개 이상
+POINTS_PER_CENTROID = 39
+
+
+def train_size(kind, nlist=1024):
+    """학습용으로 모아야 할 벡터 수 (학습이 필요 없으면 0)"""
+    return nlist * POINTS_PER_CENTROID if kind.startswith("ivf") else 0
+
+
+def _pq_m(dim, pq_m):
+    # 부분 벡터 수는 차원의 약수여야 함
+    while dim % pq_m:
+        pq_m -= 1
+    return pq_m
+
+
+def create_index(kind, dim, train_vectors=None, nlist=1024, pq_m=64, hnsw_m=32):
+    """
+    문서 id 로 추가할 수 있는 인덱스 생성 (IVF 계열은 train_vectors 로 학습까지)
+
+    Args:
+        kind (str): flat / ivf-flat / ivf-pq / hnsw
+        dim (int): 벡터 차원
+        train_vectors (np.ndarray): IVF 학습용 벡터 (적으면 nlist / PQ 비트 수를 줄임)
+        nlist (int): IVF 군집 수
+        pq_m (int): PQ 부분 벡터 수 (벡터당 pq_m byte)
+        hnsw_m (int): HNSW 노드당 이웃 수
+
+    Returns:
+        faiss.Index
+    """
+    if kind == "flat":
+        return faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+    if kind == "hnsw":
+        # HNSW 는 id 를 직접 받지 못하므로 IDMap2 로 감쌈 (삭제 시 벡터를 다시 꺼낼 수 있음)
+        return faiss.IndexIDMap2(faiss.IndexHNSWFlat(dim, hnsw_m))
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"지원하지 않는 인덱스 종류입니다: {kind} (가능: {', '.join(INDEX_TYPES)})")
+
+    if train_vectors is None or len(train_vectors) == 0:
+        raise ValueError(f"{kind} 인덱스는 학습용 벡터가 필요합니다.")
+    n = len(train_vectors)
+    # 학습 벡터가 적으면 군집 수를 줄임 (작은 DB 에서도 동작하도록)
+    nlist = max(1, min(nlist, n // POINTS_PER_CENTROID))
+    quantizer = faiss.IndexFlatL2(dim)
+    if kind == "ivf-flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        nbits = max(1, min(8, int(math.log2(n))))
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim, pq_m), nbits)
+    index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+    return index
+
+
+def index_kind(index):
+    """인덱스 객체의 종류 이름"""
+    inner = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(inner, faiss.IndexHNSWFlat):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf-pq"
+    if isinstance(inner, faiss.IndexIVFFlat):
+        return "ivf-flat"
+    return "flat"
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """
+    질의 시점 설정 (해당 인덱스 종류가 아니면 무시)
+
+    Args:
+        nprobe (int): IVF 에서 탐색할 군집 수
+        ef_search (int): HNSW 탐색 후보 수
+    """
+    kind = index_kind(index)
+    if nprobe is not None and kind.startswith("ivf"):
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    if ef_search is not None and kind == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = ef_search
+
+
+def remove_ids(index, ids):
+    """
+    id 로 벡터 삭제. HNSW 는 삭제를 지원하지 않으므로 남은 벡터로 그래프를 다시 만듦
+
+    Returns:
+        faiss.Index: 삭제가 반영된 인덱스 (HNSW 는 새 객체)
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if index_kind(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    inner = faiss.downcast_index(index.index)
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, ids)
+    vectors = inner.reconstruct_n(0, inner.ntotal)[keep]
+    rebuilt = create_index("hnsw", inner.d, hnsw_m=inner.hnsw.nb_neighbors(1))
+    faiss.downcast_index(rebuilt.index).hnsw.efSearch = inner.hnsw.efSearch
+    if len(vectors):
+        rebuilt.add_with_ids(vectors, all_ids[keep])
+    return rebuilt
+
+
+def open_index(path, mmap=True):
+    """
+    저장된 인덱스 열기
+
+    Args:
+        mmap (bool): True 면 벡터 / 역색인 데이터를 파일에서 메모리 맵으로 읽기 전용으로 염
+            → 여는 시간이 거의 0 이고 검색이 건드린 페이지만 메모리에 올라감.
+            같은 호스트의 여러 프로세스가 페이지 캐시를 공유함 (수정하려면 mmap=False)
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    # IO_FLAG_MMAP_IFC: flat / hnsw 의 벡터와 IVF 역색인을 모두 mmap (없는 구버전은 IVF 만 되는 IO_FLAG_MMAP)
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+
+
+def index_memory_mb(index):
+    """직렬화한 크기 (MB) ≈ 인덱스가 차지하는 메모리"""
+    return len(faiss.serialize_index(index)) / 1024**2
+
+
+# ============================================================================
+# 벤치마크
+# ============================================================================
+def synthetic_vectors(n, dim, clusters=1000, latent_dim=32, seed=0):
+    """
+    문장 임베딩처럼 군집이 있고 실제 자유도(latent_dim)가 차원보다 훨씬 낮은 합성 벡터
+    (차원 전체에 균등한 난수는 이웃 구분이 안 돼서 ANN 평가가 비현실적으로 어려움)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, latent_dim), dtype=np.float32) * 3
+    projection = rng.standard_normal((latent_dim, dim), dtype=np.float32) / np.sqrt(latent_dim)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100_000):
+        end = min(n, start + 100_000)
+        latent = centers[rng.integers(0, clusters, end - start)]
+        latent += rng.standard_normal((end - start, latent_dim), dtype=np.float32)
+        vectors[start:end] = latent @ projection
+        vectors[start:end] += 0.05 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    return vectors
+
+
+def _measure(index, queries, k, truth):
+    """질의를 하나씩 보내서 (retrieve() 와 같은 방식) 지연시간과 recall@k 측정"""
+    latencies, found = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q[None], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def benchmark_ann(sizes=(10_000, 100_000), dim=768, num_queries=200, k=10, nlist=None, pq_m=64, hnsw_m=32,
+                  nprobes=(1, 8, 32), ef_searches=(16, 64, 128)):
+    """
+    코퍼스 크기별로 인덱스 종류 / 질의 설정마다 recall@k, p50 / p99 지연시간, 메모리 비교
+
+    Args:
+        nlist (int): IVF 군집 수 (None 이면 4 * sqrt(N))
+
+    Returns:
+        list[dict]: 측정 결과
+    """
+    results = []
+    for n in sizes:
+        # 질의도 같은 분포에서 뽑고 코퍼스에서는 뺌
+        vectors = synthetic_vectors(n + num_queries, dim)
+        vectors, queries = vectors[:n], vectors[n:]
+        ids = np.arange(n, dtype=np.int64)
+        n_list = nlist or int(4 * math.sqrt(n))
+        print(f"\n🔥 N={n:,}, dim={dim}, nlist={n_list}")
+
+        flat = create_index("flat", dim)
+        flat.add_with_ids(vectors, ids)
+        _, truth = flat.search(queries, k)
+
+        for kind in INDEX_TYPES:
+            start = time.perf_counter()
+            sample = vectors[np.random.default_rng(0).choice(n, min(n, train_size(kind, n_list)), replace=False)]
+            index = flat if kind == "flat" else create_index(kind, dim, train_vectors=sample, nlist=n_list,
+                                                             pq_m=pq_m, hnsw_m=hnsw_m)
+            if kind != "flat":
+                index.add_with_ids(vectors, ids)
+            build_sec = time.perf_counter() - start
+            memory_mb = index_memory_mb(index)
+
+            if kind.startswith("ivf"):
+                settings = [{"nprobe": p} for p in nprobes]
+            elif kind == "hnsw":
+                settings = [{"ef_search": ef} for ef in ef_searches]
+            else:
+                settings = [{}]
+            for params in settings:
+                set_search_params(index, **params)
+                recall, p50, p99 = _measure(index, queries, k, truth)
+                results.append({"n": n, "kind": kind, "params": params, "recall": recall, "p50_ms": p50,
+                                "p99_ms": p99, "memory_mb": memory_mb, "build_sec": build_sec})
+                print(f"✅ {kind:<9} {str(params):<18} recall@{k} {recall:.3f}  "
+                      f"p50 {p50:.3f}ms  p99 {p99:.3f}ms  {memory_mb:.1f}MB  (build {build_sec:.1f}초)")
+            del index
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FAISS 인덱스 종류별 recall / 지연시간 벤치마크")
+    parser.add_argument("--sizes", default="10000,100000", help="쉼표로 구분한 코퍼스 크기 (예: 10000,100000,1000000)")
+    parser.add_argument("--dim", type=int, default=768, help="ko-sroberta-multitask 임베딩 차원")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    args = parser.parse_args()
+
+    benchmark_ann(sizes=[int(x) for x in args.sizes.split(",")], dim=args.dim, num_queries=args.queries,
+                  k=args.k, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
@@ -0,0 +1,151 @@
+"""
+작은 draft 모델을 이용한 assisted (speculative) decoding
+
+draft 모델이 토큰 몇 개를 먼저 제안하고, EEVE 는 그 후보들을 forward 한 번으로
+검증한다. 채택된 만큼 EEVE forward 횟수가 줄어든다.
+
+- greedy (do_sample=False) 에서는 결과가 일반 generate 와 토큰 단위로 같다.
+- 샘플링에서는 transformers 의 speculative sampling 으로 분포가 보존된다.
+- transformers 의 assisted generate 는 batch_size=1 만 지원한다.
+
+채택률은 forward 호출 횟수로 계산한다. 검증 1회(타깃 forward 1번)마다
+"채택된 draft 토큰 + 타깃이 직접 고른 토큰 1개" 가 추가되므로
+    채택된 토큰 = 생성 토큰 - 타깃 forward 수
+    채택률     = 채택된 토큰 / draft forward 수 (= 제안한 토큰 수)
+
+사용 예 (CPU, 작은 target/draft 쌍으로 벤치마크):
+    python assisted.py --target gpt2-medium --draft distilgpt2
+"""
+
+import argparse
+import time
+
+import torch
+
+
+class ForwardCounter:
+    """with 블록 안에서 모델 forward 가 몇 번 불렸는지 센다 (model 이 None 이면 0)"""
+
+    def __init__(self, model):
+        self.model = model
+        self.count = 0
+        self.handle = None
+
+    def _hook(self, module, inputs, outputs):
+        self.count += 1
+
+    def __enter__(self):
+        if self.model is not None:
+            self.handle = self.model.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            self.handle.remove()
+        return False
+
+
+def check_draft_compatible(tokenizer, draft_tokenizer):
+    """draft 모델이 같은 어휘(토큰 id)를 쓰는지 확인"""
+    if tokenizer.get_vocab() != draft_tokenizer.get_vocab():
+        raise ValueError("draft 모델의 토크나이저 어휘가 타깃 모델과 다릅니다. "
+                         "같은 토크나이저를 쓰는 draft 모델을 사용하세요.")
+
+
+def acceptance_stats(new_tokens, target_calls, draft_calls):
+    """forward 횟수로 draft 토큰 채택률 계산"""
+    accepted = max(new_tokens - target_calls, 0)
+    return {
+        "target_forwards": target_calls,
+        "draft_forwards": draft_calls,
+        "accepted_tokens": accepted,
+        "acceptance_rate": accepted / draft_calls if draft_calls else 0.0,
+    }
+
+
+def generate_with_stats(model, inputs, draft_model=None, **generate_kwargs):
+    """
+    model.generate 를 돌리고 (draft 가 있으면 assisted 로) 시간과 forward 횟수를 기록
+
+    Returns:
+        tuple: (outputs, stats)
+    """
+    if draft_model is not None:
+        generate_kwargs["assistant_model"] = draft_model
+
+    start = time.perf_counter()
+    with ForwardCounter(model) as target, ForwardCounter(draft_model) as draft:
+        with torch.no_grad():
+            outputs = model.generate(**inputs, **generate_kwargs)
+    elapsed = time.perf_counter() - start
+
+    new_tokens = outputs.shape[1] - inputs["input_ids"].shape[1]
+    stats = acceptance_stats(new_tokens, target.count, draft.count)
+    stats.update({"new_tokens": new_tokens, "seconds": elapsed})
+    return outputs, stats
+
+
+def benchmark_assisted(model, draft_model, tokenizer, prompts, max_new_tokens=64):
+    """
+    greedy 기준으로 일반 generate 와 assisted generate 를 비교
+
+    Returns:
+        dict: 출력 일치 여부, 채택률, 속도 향상
+    """
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    kwargs = {"max_new_tokens": max_new_tokens, "do_sample": False, "pad_token_id": pad_token_id}
+
+    # 첫 호출의 초기화 비용이 비교에 섞이지 않도록 한 번씩 예열
+    warm = tokenizer(prompts[0], return_tensors="pt").to(model.device)
+    generate_with_stats(model, warm, max_new_tokens=2, do_sample=False, pad_token_id=pad_token_id)
+    generate_with_stats(model, warm, draft_model, max_new_tokens=2, do_sample=False, pad_token_id=pad_token_id)
+
+    base_sec, assisted_sec = 0.0, 0.0
+    accepted, proposed = 0, 0
+    identical = True
+    for prompt in prompts:
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        base_out, base_stats = generate_with_stats(model, inputs, **kwargs)
+        assisted_out, stats = generate_with_stats(model, inputs, draft_model, **kwargs)
+
+        identical &= torch.equal(base_out, assisted_out)
+        base_sec += base_stats["seconds"]
+        assisted_sec += stats["seconds"]
+        accepted += stats["accepted_tokens"]
+        proposed += stats["draft_forwards"]
+
+    result = {
+        "identical": identical,
+        "acceptance_rate": accepted / proposed if proposed else 0.0,
+        "baseline_sec": base_sec,
+        "assisted_sec": assisted_sec,
+        "speedup": base_sec / assisted_sec if assisted_sec else 0.0,
+    }
+
+    print("=" * 70)
+    print(f"greedy 출력 일치: {'✅' if identical else '❌'}")
+    print(f"draft 채택률: {result['acceptance_rate'] * 100:.1f}%")
+    print(f"일반: {base_sec:.2f}초 / assisted: {assisted_sec:.2f}초 → {result['speedup']:.2f}배")
+    print("=" * 70)
+    return result
+
+
+if __name__ == "__main__":
+    from model_loader import LOAD_MODES, load_model
+
+    parser = argparse.ArgumentParser(description="assisted decoding 벤치마크")
+    parser.add_argument("--target", default="yanolja/EEVE-Korean-Instruct-10.8B-v1.0")
+    parser.add_argument("--draft", required=True)
+    parser.add_argument("--load-mode", default="auto", choices=LOAD_MODES)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    tokenizer, model = load_model(args.target, mode=args.load_mode)
+    draft_tokenizer, draft_model = load_model(args.draft, mode=args.load_mode)
+    check_draft_compatible(tokenizer, draft_tokenizer)
+
+    benchmark_assisted(model, draft_model, tokenizer, [
+        "요즘 스마트폰 게임이 왜 문제인가요?",
+        "안녕하세요! 간단히 자기소개를 해주세요.",
+        "신입 개발자는 어떤 회사를 가야 할까요?",
+    ], max_new_tokens=args.max_new_tokens)
@@ -0,0 +1,236 @@
+"""
+긴 SFT 학습용 비동기 체크포인트 / 재개
+
+4_SFT_DPO_test.py 는 학습이 끝난 뒤에만 save_pretrained 를 해서 중간에 죽으면 전부 잃었다.
+
+- save(): 학습 파라미터 / optimizer / RNG / 데이터 위치를 CPU 로 복사(스냅샷)만 하고
+  디스크 쓰기는 백그라운드 스레드에서 함 → 학습 루프는 복사 시간만큼만 멈춤
+- 쓰는 중인 체크포인트는 step-XXXXXX.tmp 에 만들고 다 쓴 뒤 이름을 바꿔서
+  중간에 끊긴 체크포인트를 재개에 쓰지 않음. 최근 keep_last 개만 남김
+- resume(): 가장 최근 체크포인트로 모델 / optimizer / RNG 를 되돌리고
+  (epoch, 다음 배치 번호) 를 돌려줌. LengthBucketSampler 는 seed + epoch 로 배치 순서가
+  정해지므로 같은 위치부터 이어서 학습하면 중단 없이 돈 것과 같은 결과가 나옴
+  (DataLoader 에는 별도 generator 를 넘겨야 iterator 생성이 전역 RNG 를 소비하지 않음)
+- fingerprint (데이터셋 / 모델 / 주요 하이퍼파라미터) 를 체크포인트마다 저장하고, 재개할 때
+  지금 실행과 다르면 경고만 하고 {checkpoint_dir}-{fingerprint 해시} 디렉터리에서 처음부터 학습
+  (설정을 바꾼 실행이 예전 실행의 가중치 / 위치에서 이어지지 않고, 예전 체크포인트와 섞이지도 않음)
+- clear(): 학습이 끝나면 체크포인트를 지워서 다음 실행이 끝난 학습을 "재개" 하지 않게 함
+
+쓰기 스레드는 파일 I/O 만 하고 연산(MKL/OpenMP)은 하지 않는다.
+체크포인트는 optimizer.step() 직후 (gradient accumulation 경계) 에만 저장한다.
+
+사용 예:
+    checkpointer = AsyncCheckpointer("./sft_checkpoints", fingerprint={"model": "gpt2", "lr": 5e-5, ...})
+    epoch, start_batch, global_step = checkpointer.resume(model, optimizer)
+    ...
+    checkpointer.save(model, optimizer, epoch, step + 1, global_step)
+    checkpointer.wait()
+    ...  # 학습 결과 저장
+    checkpointer.clear()
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+import torch
+from safetensors.torch import load_file, save_file
+
+MODEL_FILE = "model.safetensors"
+STATE_FILE = "trainer_state.pt"
+FINGERPRINT_FILE = "fingerprint.json"
+_STEP_DIR = re.compile(r"^step-(\d+)$")
+
+
+def _snapshot(obj):
+    """텐서를 CPU 복사본으로 바꾼 사본 (학습이 계속 값을 바꿔도 영향 없음)"""
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(v) for v in obj)
+    return obj
+
+
+def _rng_state():
+    return {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+
+
+def _fingerprint_id(fingerprint):
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def _set_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+
+
+class AsyncCheckpointer:
+    """스냅샷은 학습 스레드에서, 디스크 쓰기는 백그라운드 스레드에서 하는 체크포인트 저장기"""
+
+    def __init__(self, checkpoint_dir, keep_last=2, fingerprint=None):
+        """
+        Args:
+            checkpoint_dir (str): step-XXXXXX 체크포인트들을 만들 디렉터리
+            keep_last (int): 남겨 둘 최근 체크포인트 수
+            fingerprint (dict): 이 학습을 구분하는 값 (데이터셋 해시, 모델 이름, 하이퍼파라미터 등,
+                JSON 으로 저장 가능해야 함). None 이면 검사하지 않음
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.keep_last = keep_last
+        # 저장했다가 읽은 값과 비교하므로 JSON 을 한 번 거친 형태로 둠 (tuple → list 등)
+        self.fingerprint = json.loads(json.dumps(fingerprint)) if fingerprint is not None else None
+        self._thread = None
+        self._error = None
+
+    def latest(self):
+        """다 쓴 체크포인트 중 가장 최근 경로 (없으면 None)"""
+        if not os.path.isdir(self.checkpoint_dir):
+            return None
+        steps = sorted(int(m.group(1)) for m in map(_STEP_DIR.match, os.listdir(self.checkpoint_dir)) if m)
+        if not steps:
+            return None
+        return os.path.join(self.checkpoint_dir, f"step-{steps[-1]:06d}")
+
+    def save(self, model, optimizer, epoch, next_batch, global_step):
+        """
+        현재 학습 상태를 스냅샷하고 백그라운드에서 저장 (이전 저장이 안 끝났으면 기다림)
+
+        Args:
+            epoch (int): 현재 epoch
+            next_batch (int): 이 epoch 에서 다음에 학습할 배치 번호
+            global_step (int): 지금까지 optimizer.step() 횟수
+        """
+        # 스냅샷은 한 번에 하나만 메모리에 둠
+        self.wait()
+
+        start = time.perf_counter()
+        # 고정된 파라미터(LoRA 의 원래 가중치 등)는 원본에서 다시 읽으므로 저장하지 않음
+        weights = {name: p.detach().to("cpu", copy=True).contiguous()
+                   for name, p in model.named_parameters() if p.requires_grad}
+        state = {
+            "optimizer": _snapshot(optimizer.state_dict()),
+            "rng": _rng_state(),
+            "epoch": epoch,
+            "next_batch": next_batch,
+            "global_step": global_step,
+        }
+        snapshot_sec = time.perf_counter() - start
+
+        path = os.path.join(self.checkpoint_dir, f"step-{global_step:06d}")
+        self._thread = threading.Thread(target=self._write, args=(path, weights, state), daemon=False)
+        self._thread.start()
+        print(f"💾 체크포인트 스냅샷: step {global_step} ({snapshot_sec:.2f}초, 쓰기는 백그라운드)")
+
+    def _write(self, path, weights, state):
+        try:
+            tmp_path = path + ".tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            save_file(weights, os.path.join(tmp_path, MODEL_FILE))
+            torch.save(state, os.path.join(tmp_path, STATE_FILE))
+            if self.fingerprint is not None:
+                with open(os.path.join(tmp_path, FINGERPRINT_FILE), "w", encoding="utf-8") as f:
+                    json.dump(self.fingerprint, f, ensure_ascii=False, indent=2)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+            self._prune()
+        except Exception as e:
+            self._error = e
+
+    def _prune(self):
+        names = sorted(n for n in os.listdir(self.checkpoint_dir) if _STEP_DIR.match(n))
+        for name in names[:-self.keep_last]:
+            shutil.rmtree(os.path.join(self.checkpoint_dir, name), ignore_errors=True)
+
+    def wait(self):
+        """진행 중인 저장이 끝날 때까지 기다림 (저장 중 에러가 났으면 여기서 다시 발생)"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"체크포인트 저장 실패: {error}") from error
+
+    def resume(self, model, optimizer, path=None):
+        """
+        체크포인트에서 모델 / optimizer / RNG 를 복원
+
+        Args:
+            path (str): 체크포인트 경로 (None 이면 가장 최근)
+
+        Returns:
+            tuple: (epoch, next_batch, global_step). 체크포인트가 없으면 (0, 0, 0)
+
+        fingerprint 가 지금 실행과 다르면 재개하지 않고 checkpoint_dir 를 이 fingerprint 전용
+        디렉터리로 바꾼다 (그 디렉터리에 같은 설정의 체크포인트가 있으면 거기서 재개).
+        """
+        path = path or self.latest()
+        if path is None:
+            return 0, 0, 0
+        diff = self._fingerprint_diff(path)
+        if diff:
+            fresh_dir = f"{self.checkpoint_dir.rstrip(os.sep)}-{_fingerprint_id(self.fingerprint)}"
+            print(f"⚠️ 체크포인트 {path} 는 다른 설정의 학습입니다 ({diff}). "
+                  f"이 체크포인트는 건너뛰고 이 설정 전용 디렉터리 {fresh_dir} 를 씁니다.")
+            self.checkpoint_dir = fresh_dir
+            path = self.latest()
+            if path is None or self._fingerprint_diff(path):
+                return 0, 0, 0
+
+        weights = load_file(os.path.join(path, MODEL_FILE), device=str(model.device))
+        trainable = [name for name, p in model.named_parameters() if p.requires_grad]
+        missing = [name for name in trainable if name not in weights]
+        if missing:
+            raise ValueError(f"체크포인트에 없는 학습 파라미터가 있습니다: {missing[:3]}...")
+        model.load_state_dict(weights, strict=False)
+
+        # 파이썬 객체(RNG 상태 등)가 들어 있으므로 weights_only=False (직접 만든 파일만 읽음)
+        state = torch.load(os.path.join(path, STATE_FILE), map_location="cpu", weights_only=False)
+        optimizer.load_state_dict(state["optimizer"])
+        _set_rng_state(state["rng"])
+        print(f"✅ 체크포인트에서 재개: {path} (epoch {state['epoch'] + 1}, "
+              f"배치 {state['next_batch']}, step {state['global_step']})")
+        return state["epoch"], state["next_batch"], state["global_step"]
+
+    def _fingerprint_diff(self, path):
+        """지금 실행과 다른 fingerprint 항목 설명 (같으면 빈 문자열)
+
+        다른 설정의 체크포인트와 같은 디렉터리에 섞어 쓰면 _prune 이 새 체크포인트를 지울 수 있음
+        """
+        if self.fingerprint is None:
+            return ""
+        fingerprint_path = os.path.join(path, FINGERPRINT_FILE)
+        saved = None
+        if os.path.exists(fingerprint_path):
+            with open(fingerprint_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        if saved == self.fingerprint:
+            return ""
+        if saved is None:
+            return "fingerprint 없음"
+        keys = sorted(set(saved) | set(self.fingerprint))
+        return ", ".join(f"{k}: {saved.get(k)} → {self.fingerprint.get(k)}"
+                         for k in keys if saved.get(k) != self.fingerprint.get(k))
+
+    def clear(self):
+        """저장 중인 체크포인트를 기다린 뒤 모든 체크포인트를 지움 (학습을 끝까지 마쳤을 때)"""
+        self.wait()
+        if not os.path.isdir(self.checkpoint_dir):
+            return
+        for name in os.listdir(self.checkpoint_dir):
+            if _STEP_DIR.match(name) or name.endswith(".tmp"):
+                shutil.rmtree(os.path.join(self.checkpoint_dir, name), ignore_errors=True)
+        print(f"🧹 학습 완료, 체크포인트 정리: {self.checkpoint_dir}")
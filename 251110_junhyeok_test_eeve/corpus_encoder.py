@@ -0,0 +1,101 @@
+"""
+길이 정렬 청크 인코더 (Vector DB / 질의 임베딩 공통)
+
+문장 전체를 한 번에 토크나이징해서 가장 긴 문장까지 패딩한 텐서 하나로 forward 하면
+크롤링한 코퍼스에서는 메모리가 부족하거나 대부분의 연산을 패딩 토큰에 쓰게 된다.
+iter_embeddings() 는
+
+1. 문장을 스트리밍으로 읽어 chunk (batch_size * bucket_batches 개) 단위로 모으고
+2. chunk 안에서 토큰 길이순으로 정렬해서 batch_size 개씩 배치를 만든 뒤 (배치 안 길이가 비슷함)
+3. torch.no_grad() 로 배치마다 인코딩해서 (원본 순서 번호, 임베딩) 을 차례로 돌려준다.
+
+정렬해서 인코딩해도 원본 순서 번호가 같이 나오므로 호출하는 쪽에서 원래 순서로 되돌릴 수 있고,
+메모리에는 chunk 하나만 올라가므로 코퍼스 크기와 무관하게 일정하다.
+Vector DB 는 embedding_service.Embedder.encode_many() (내부에서 iter_embeddings) 로 임베딩해서
+vector_store.VectorStore.upsert() 로 넣는다.
+
+사용 예:
+    for positions, embeddings in iter_embeddings(iter_texts("biased_corpus.txt"), tokenizer, model):
+        ...   # positions: 원본 순서 번호, embeddings: (배치, dim) float32
+
+    # Vector DB 구축 (2_generate_vecotor_db.py)
+    embedder = embedding_service.get_embedder()
+    store = VectorStore(embedder_info=embedder.info())
+    changed, removed = store.diff(iter_documents("biased_corpus.jsonl"), delete_missing=True)
+    store.upsert(changed, embedder)
+    store.save()
+"""
+
+import itertools
+
+import numpy as np
+import torch
+
+from token_store import iter_examples
+
+
+def iter_texts(path, text_key="text"):
+    """
+    .txt 는 줄 단위, .json (배열) / .jsonl 은 원소 단위로 문장을 하나씩 읽음
+
+    Args:
+        text_key (str): 원소가 dict 일 때 문장이 들어 있는 필드
+    """
+    if path.endswith(".txt"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line.rstrip("\n")
+        return
+    for item in iter_examples(path):
+        yield item if isinstance(item, str) else item[text_key]
+
+
+def mean_pooling(model_output, attention_mask):
+    token_embeddings = model_output[0]
+    input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
+    return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
+
+
+def _sorted_batches(input_ids, batch_size):
+    """chunk 안에서 길이순으로 정렬한 (chunk 내 위치 리스트) 배치들"""
+    order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def iter_embeddings(texts, tokenizer, model, batch_size=64, bucket_batches=50, max_length=256, stats=None):
+    """
+    문장들을 길이 정렬 배치로 인코딩
+
+    Args:
+        texts (iterable[str]): 문장 (리스트 또는 iter_texts 같은 제너레이터)
+        stats (dict): 넘기면 done / real_tokens / padded_tokens 를 누적
+
+    Yields:
+        tuple: (원본 순서 번호 np.ndarray[int64], 임베딩 np.ndarray[float32])
+    """
+    stats = stats if stats is not None else {}
+    for key in ("done", "real_tokens", "padded_tokens"):
+        stats.setdefault(key, 0)
+    it = iter(texts)
+
+    model.eval()
+    while True:
+        chunk = list(itertools.islice(it, batch_size * bucket_batches))
+        if not chunk:
+            return
+        offset = stats["done"]
+
+        # 패딩 없이 토크나이징 → 길이순 배치마다 그 배치 최대 길이까지만 패딩
+        input_ids = tokenizer(chunk, truncation=True, max_length=max_length)["input_ids"]
+        for positions in _sorted_batches(input_ids, batch_size):
+            batch = tokenizer.pad({"input_ids": [input_ids[i] for i in positions]}, return_tensors="pt")
+            batch = {key: val.to(model.device) for key, val in batch.items()}
+            with torch.no_grad():
+                embeddings = mean_pooling(model(**batch), batch["attention_mask"])
+
+            stats["real_tokens"] += int(batch["attention_mask"].sum())
+            stats["padded_tokens"] += batch["attention_mask"].numel()
+            yield (np.asarray(positions, dtype=np.int64) + offset,
+                   np.ascontiguousarray(embeddings.float().cpu().numpy()))
+        stats["done"] += len(chunk)
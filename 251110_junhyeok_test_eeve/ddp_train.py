@@ -0,0 +1,253 @@
+"""
+CPU 멀티 프로세스 데이터 병렬 SFT 학습 (gloo DDP)
+
+4_SFT_DPO_test.py 아래 메모처럼 Trainer 는 DataLoader 워커 스레드 + MKL/OpenMP 스레드
+생성 때문에 커널 5.4 에서 segfault 가 났고, 그래서 단일 프로세스 루프로 돌리고 있다.
+여기서는 크래시 원인을 피하면서 코어를 모두 쓰도록
+
+- 프로세스는 spawn 으로 띄움 (OpenMP 가 초기화된 프로세스를 fork 하지 않음)
+- 프로세스마다 사용할 코어를 나눠 CPU affinity 로 고정하고,
+  intra-op 스레드 수(OMP/MKL/torch)를 그 코어 수로 명시, inter-op 스레드는 1개
+- DataLoader 는 num_workers=0 (추가 스레드/프로세스 없음)
+- 그래디언트 동기화는 gloo 백엔드 DDP
+
+로 N 개 워커를 돌린다. benchmark 는 1 ~ N 프로세스의 samples/sec 를 비교한다.
+
+사용 예:
+    python ddp_train.py train --procs 4 --output ./sft_detox_model
+    python ddp_train.py benchmark --max-procs 4 --samples 512
+"""
+
+import argparse
+import os
+import random
+import socket
+import time
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import DataLoader
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from lora import apply_lora, save_adapter, trainable_parameters
+from sft_data import LengthBucketSampler, SFTCollator, ShardedBatchSampler, tokenize_sft_example
+from token_store import build_token_store
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _setup_worker(rank, world_size, threads, cores, port):
+    """코어 고정 + 스레드 수 명시 + gloo 프로세스 그룹 초기화"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 이미 병렬 연산이 한 번 실행된 뒤면 바꿀 수 없음
+        pass
+    dist.init_process_group("gloo", init_method=f"tcp://127.0.0.1:{port}",
+                            rank=rank, world_size=world_size)
+
+
+def _load_dataset(config, tokenizer, rank):
+    if config.get("examples") is not None:
+        return [tokenize_sft_example(tokenizer, x, max_length=config["max_length"]) for x in config["examples"]]
+
+    # rank 0 이 먼저 토큰 캐시를 만들고 나머지는 만들어진 캐시를 염
+    # (워커 안에서 다시 프로세스를 fork 하지 않도록 workers=1)
+    if rank == 0:
+        store = build_token_store(config["dataset"], tokenizer, max_length=config["max_length"], workers=1)
+    dist.barrier()
+    if rank != 0:
+        store = build_token_store(config["dataset"], tokenizer, max_length=config["max_length"], workers=1)
+    return store
+
+
+def _train_worker(rank, world_size, threads, cores_per_rank, port, config, results):
+    _setup_worker(rank, world_size, threads, cores_per_rank[rank], port)
+    torch.manual_seed(config.get("seed", 42))
+
+    tokenizer = AutoTokenizer.from_pretrained(config["model_name"])
+    tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(config["model_name"])
+    if config.get("lora"):
+        apply_lora(model, r=config.get("lora_r", 8), alpha=config.get("lora_alpha", 16))
+    model.train()
+    ddp_model = DDP(model)
+
+    dataset = _load_dataset(config, tokenizer, rank)
+    lengths = dataset.lengths if hasattr(dataset, "lengths") else [len(x["input_ids"]) for x in dataset]
+    sampler = ShardedBatchSampler(LengthBucketSampler(lengths, config["batch_size"]), rank, world_size)
+    loader = DataLoader(dataset, batch_sampler=sampler, collate_fn=SFTCollator(tokenizer.pad_token_id),
+                        num_workers=0)
+
+    if rank == 0 and len(loader) == 0:
+        print(f"⚠️ 배치 수가 프로세스 수({world_size})보다 적어 학습할 배치가 없습니다.")
+
+    optimizer = torch.optim.AdamW(trainable_parameters(model), lr=config["lr"])
+    accum = config.get("grad_accum_steps", 1)
+
+    samples = 0
+    dist.barrier()
+    start = time.perf_counter()
+    for epoch in range(config.get("epochs", 1)):
+        sampler.set_epoch(epoch)
+        optimizer.zero_grad()
+        for step, batch in enumerate(loader):
+            sync = (step + 1) % accum == 0 or step + 1 == len(loader)
+            # accumulation 중간 step 에서는 all-reduce 를 건너뜀
+            if sync:
+                loss = ddp_model(**batch).loss
+                (loss / accum).backward()
+                optimizer.step()
+                optimizer.zero_grad()
+            else:
+                with ddp_model.no_sync():
+                    loss = ddp_model(**batch).loss
+                    (loss / accum).backward()
+            samples += len(batch["input_ids"])
+
+            if rank == 0 and config.get("verbose", True):
+                print(f"[rank 0/{world_size}] Epoch {epoch+1}, Step {step+1}/{len(loader)}, "
+                      f"Loss: {loss.item():.4f}")
+    dist.barrier()
+    elapsed = time.perf_counter() - start
+
+    total = torch.tensor([samples], dtype=torch.long)
+    dist.all_reduce(total)
+
+    if rank == 0:
+        output_dir = config.get("output_dir")
+        if output_dir:
+            if config.get("lora"):
+                save_adapter(model, f"{output_dir}_lora")
+            else:
+                model.save_pretrained(output_dir)
+                tokenizer.save_pretrained(output_dir)
+                print(f"✅ 학습된 가중치 저장 완료: {output_dir}")
+        results.put({
+            "procs": world_size,
+            "threads": threads,
+            "samples": int(total.item()),
+            "seconds": elapsed,
+            "samples_per_sec": total.item() / elapsed,
+        })
+    dist.destroy_process_group()
+
+
+def launch(config, procs, threads=None):
+    """
+    procs 개 프로세스로 DDP 학습 실행
+
+    Args:
+        config (dict): model_name, dataset 또는 examples, batch_size, lr, max_length 등
+        procs (int): 프로세스 수
+        threads (int): 프로세스당 intra-op 스레드 수 (None 이면 코어를 균등 분할)
+
+    Returns:
+        dict: 전체 samples/sec 등
+    """
+    cores = _available_cores()
+    threads = threads or max(1, len(cores) // procs)
+    # 코어가 충분하면 rank 마다 겹치지 않는 코어 묶음을 할당
+    if len(cores) >= procs * threads:
+        cores_per_rank = [cores[r * threads:(r + 1) * threads] for r in range(procs)]
+    else:
+        cores_per_rank = [None] * procs
+
+    # 자식 프로세스가 torch 를 import 할 때 읽으므로 spawn 전에 설정
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    ctx = mp.get_context("spawn")
+    results = ctx.SimpleQueue()
+    mp.start_processes(
+        _train_worker,
+        args=(procs, threads, cores_per_rank, _free_port(), config, results),
+        nprocs=procs,
+        join=True,
+        start_method="spawn"
+    )
+    return results.get()
+
+
+def benchmark_scaling(config, max_procs, samples=256):
+    """
+    같은 합성 데이터로 1 ~ max_procs 프로세스의 학습 처리량 비교
+
+    Returns:
+        list[dict]: 프로세스 수별 결과
+    """
+    rng = random.Random(0)
+    words = ["게임", "현질", "개발자", "커리어", "스마트폰", "결제", "회사", "토론"]
+    config = dict(config, verbose=False, output_dir=None, examples=[
+        {"input": " ".join(rng.choices(words, k=rng.randint(3, 12))),
+         "output": " ".join(rng.choices(words, k=rng.randint(5, 20)))}
+        for _ in range(samples)
+    ])
+
+    results = []
+    for procs in range(1, max_procs + 1):
+        result = launch(config, procs)
+        results.append(result)
+        print(f"✅ {procs} 프로세스: {result['samples_per_sec']:.1f} samples/s")
+
+    base = results[0]["samples_per_sec"]
+    print("\n" + "=" * 70)
+    print(f"{'프로세스':<10}{'스레드/프로세스':>16}{'samples/s':>12}{'속도 향상':>10}{'효율':>10}")
+    print("=" * 70)
+    for r in results:
+        speedup = r["samples_per_sec"] / base
+        print(f"{r['procs']:<10}{r['threads']:>16}{r['samples_per_sec']:>12.1f}"
+              f"{speedup:>10.2f}{speedup / r['procs'] * 100:>9.0f}%")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CPU 데이터 병렬 SFT 학습")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("train", "benchmark"):
+        p = sub.add_parser(name)
+        p.add_argument("--model", default="gpt2")
+        p.add_argument("--batch-size", type=int, default=int(os.getenv("SFT_BATCH_SIZE", "16")))
+        p.add_argument("--grad-accum", type=int, default=int(os.getenv("SFT_GRAD_ACCUM", "1")))
+        p.add_argument("--max-length", type=int, default=int(os.getenv("SFT_MAX_LENGTH", "128")))
+        p.add_argument("--lr", type=float, default=5e-5)
+        p.add_argument("--lora", action="store_true")
+    sub.choices["train"].add_argument("--procs", type=int, default=2)
+    sub.choices["train"].add_argument("--threads", type=int, default=None)
+    sub.choices["train"].add_argument("--dataset", default="sft_dataset.json")
+    sub.choices["train"].add_argument("--epochs", type=int, default=1)
+    sub.choices["train"].add_argument("--output", default="./sft_detox_model")
+    sub.choices["benchmark"].add_argument("--max-procs", type=int, default=len(_available_cores()))
+    sub.choices["benchmark"].add_argument("--samples", type=int, default=256)
+    args = parser.parse_args()
+
+    config = {
+        "model_name": args.model,
+        "batch_size": args.batch_size,
+        "grad_accum_steps": args.grad_accum,
+        "max_length": args.max_length,
+        "lr": args.lr,
+        "lora": args.lora,
+    }
+    if args.command == "train":
+        config.update({"dataset": args.dataset, "epochs": args.epochs, "output_dir": args.output})
+        result = launch(config, args.procs, args.threads)
+        print(f"✅ 학습 완료: {result['samples']}개, {result['samples_per_sec']:.1f} samples/s "
+              f"({result['procs']} 프로세스 x {result['threads']} 스레드)")
+    else:
+        benchmark_scaling(config, args.max_procs, args.samples)
@@ -0,0 +1,211 @@
+"""
+DPO (Direct Preference Optimization) 학습 + 참조 모델 log-prob 캐시
+
+(prompt, chosen, rejected) 쌍으로 정책 모델이 chosen 을 rejected 보다 선호하도록 학습한다.
+
+    loss = -log σ(β · [(log π(chosen) - log π_ref(chosen)) - (log π(rejected) - log π_ref(rejected))])
+
+참조 모델(π_ref)은 학습 중 고정이므로 예제마다 log π_ref 를 학습 전에 한 번만 계산해서
+디스크(.npy)에 저장해 둔다. 학습 루프는 정책 모델만 forward 하므로 step 당 forward 가 절반이 된다.
+참조 모델은 DPO 를 시작하기 전의 SFT 모델이므로, 정책 모델을 업데이트하기 전에 같은
+모델로 계산하면 두 번째 모델을 메모리에 올릴 필요도 없다.
+
+사용 예:
+    dataset = DPODataset.from_examples(tokenizer, dpo_data)
+    ref_logps = compute_reference_logps(model, dataset, tokenizer.pad_token_id)
+    train_dpo(model, dataset, ref_logps, tokenizer.pad_token_id, beta=0.1)
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from sft_data import IGNORE_INDEX, LengthBucketSampler, SFTCollator, tokenize_sft_example
+
+CACHE_DIR = "./dpo_cache"
+
+
+class DPODataset:
+    """chosen / rejected 토큰 데이터셋 두 개를 예제 단위로 묶음"""
+
+    def __init__(self, chosen, rejected):
+        """
+        Args:
+            chosen: tokenize_sft_example 형식 ({"input_ids", "labels"}) 의 리스트 또는 TokenStore
+            rejected: chosen 과 같은 순서 / 길이의 데이터셋
+        """
+        if len(chosen) != len(rejected):
+            raise ValueError(f"chosen({len(chosen)}) 과 rejected({len(rejected)}) 개수가 다릅니다.")
+        self.chosen = chosen
+        self.rejected = rejected
+
+    @classmethod
+    def from_examples(cls, tokenizer, examples, max_length=128):
+        """{"prompt", "chosen", "rejected"} 리스트를 토크나이징"""
+        chosen = [tokenize_sft_example(tokenizer, {"input": e["prompt"], "output": e["chosen"]}, max_length)
+                  for e in examples]
+        rejected = [tokenize_sft_example(tokenizer, {"input": e["prompt"], "output": e["rejected"]}, max_length)
+                    for e in examples]
+        return cls(chosen, rejected)
+
+    def __len__(self):
+        return len(self.chosen)
+
+    def __getitem__(self, i):
+        return {"index": i, "chosen": self.chosen[i], "rejected": self.rejected[i]}
+
+    @property
+    def lengths(self):
+        """길이 버킷용: chosen / rejected 중 긴 쪽"""
+        return [max(len(self.chosen[i]["input_ids"]), len(self.rejected[i]["input_ids"]))
+                for i in range(len(self))]
+
+    def fingerprint(self):
+        """토큰 내용이 같으면 같은 해시 (참조 log-prob 캐시 키)"""
+        h = hashlib.sha256()
+        for i in range(len(self)):
+            for item in (self.chosen[i], self.rejected[i]):
+                h.update(json.dumps(item, separators=(",", ":")).encode())
+        return h.hexdigest()[:16]
+
+
+class DPOCollator:
+    """[chosen..., rejected...] 순서로 한 배치에 이어 붙여 정책 forward 한 번으로 처리"""
+
+    def __init__(self, pad_token_id):
+        self.collator = SFTCollator(pad_token_id)
+
+    def __call__(self, items):
+        batch = self.collator([x["chosen"] for x in items] + [x["rejected"] for x in items])
+        batch["index"] = torch.tensor([x["index"] for x in items])
+        return batch
+
+
+def sequence_logps(model, batch):
+    """
+    labels 가 있는 위치(응답 토큰)의 log-prob 합
+
+    Returns:
+        torch.Tensor: [batch] 시퀀스별 log-prob
+    """
+    logits = model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+    labels = batch["labels"][:, 1:]
+    logits = logits[:, :-1]
+
+    mask = labels != IGNORE_INDEX
+    token_logps = torch.gather(
+        logits.log_softmax(-1), 2, labels.clamp(min=0).unsqueeze(-1)
+    ).squeeze(-1)
+    return (token_logps * mask).sum(-1)
+
+
+def dpo_loss(policy_chosen, policy_rejected, ref_chosen, ref_rejected, beta=0.1):
+    """
+    Returns:
+        tuple: (loss, 통계 dict). reward_accuracy 는 chosen 보상이 더 큰 비율
+    """
+    chosen_rewards = beta * (policy_chosen - ref_chosen)
+    rejected_rewards = beta * (policy_rejected - ref_rejected)
+    loss = -F.logsigmoid(chosen_rewards - rejected_rewards).mean()
+    return loss, {
+        "reward_accuracy": (chosen_rewards > rejected_rewards).float().mean().item(),
+        "reward_margin": (chosen_rewards - rejected_rewards).mean().item(),
+    }
+
+
+def _model_fingerprint(model):
+    """모델 이름 + 파라미터 합계 (SFT 를 다시 하면 바뀜)"""
+    h = hashlib.sha256(str(model.config._name_or_path).encode())
+    with torch.no_grad():
+        for name, p in model.named_parameters():
+            h.update(f"{name}:{p.float().sum().item():.6e}".encode())
+    return h.hexdigest()[:16]
+
+
+def compute_reference_logps(ref_model, dataset, pad_token_id, batch_size=16, cache_dir=CACHE_DIR):
+    """
+    참조 모델의 예제별 (chosen, rejected) log-prob 을 계산해서 디스크에 저장 (있으면 불러옴)
+
+    Returns:
+        np.ndarray: [N, 2] float32 (0열 chosen, 1열 rejected)
+    """
+    key = hashlib.sha256((_model_fingerprint(ref_model) + dataset.fingerprint()).encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"ref_logps-{key}.npy")
+    if os.path.exists(path):
+        print(f"✅ 참조 log-prob 캐시 사용: {path}")
+        return np.load(path, mmap_mode="r")
+
+    print(f"🔄 참조 모델 log-prob 계산 중... (예제 {len(dataset)}개)")
+    start = time.perf_counter()
+    ref_logps = np.zeros((len(dataset), 2), dtype=np.float32)
+    sampler = LengthBucketSampler(dataset.lengths, batch_size, shuffle=False)
+    loader = DataLoader(dataset, batch_sampler=sampler, collate_fn=DPOCollator(pad_token_id), num_workers=0)
+
+    was_training = ref_model.training
+    ref_model.eval()
+    with torch.no_grad():
+        for batch in loader:
+            index = batch.pop("index").numpy()
+            batch = {k: v.to(ref_model.device) for k, v in batch.items()}
+            logps = sequence_logps(ref_model, batch).float().cpu().numpy()
+            ref_logps[index, 0] = logps[:len(index)]
+            ref_logps[index, 1] = logps[len(index):]
+    ref_model.train(was_training)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # 다 쓴 뒤에 이름을 바꿔서 중간에 끊긴 파일을 캐시로 쓰지 않게 함
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, ref_logps)
+    os.replace(tmp_path, path)
+    print(f"✅ 참조 log-prob 저장: {path} ({time.perf_counter() - start:.1f}초)")
+    return ref_logps
+
+
+def train_dpo(model, dataset, ref_logps, pad_token_id, beta=0.1, lr=5e-6, batch_size=8,
+              grad_accum_steps=1, num_epochs=1):
+    """
+    정책 모델만 forward 하는 DPO 학습 루프 (CPU-safe, num_workers=0)
+
+    Returns:
+        list[dict]: step 별 loss / reward_accuracy / reward_margin
+    """
+    sampler = LengthBucketSampler(dataset.lengths, batch_size)
+    loader = DataLoader(dataset, batch_sampler=sampler, collate_fn=DPOCollator(pad_token_id), num_workers=0)
+    # LoRA 처럼 일부만 학습하는 경우 고정된 파라미터는 optimizer 상태를 만들지 않음
+    optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=lr)
+
+    # 참조 log-prob 은 dropout 없이 계산했으므로 정책 쪽도 dropout 을 끔 (TRL 기본값과 같음)
+    for module in model.modules():
+        if isinstance(module, torch.nn.Dropout):
+            module.p = 0.0
+
+    history = []
+    model.train()
+    for epoch in range(num_epochs):
+        sampler.set_epoch(epoch)
+        optimizer.zero_grad()
+        for step, batch in enumerate(loader):
+            index = batch.pop("index").numpy()
+            batch = {k: v.to(model.device) for k, v in batch.items()}
+            ref = torch.from_numpy(np.asarray(ref_logps[index])).to(model.device)
+
+            logps = sequence_logps(model, batch)
+            n = len(index)
+            loss, stats = dpo_loss(logps[:n], logps[n:], ref[:, 0], ref[:, 1], beta=beta)
+            (loss / grad_accum_steps).backward()
+
+            if (step + 1) % grad_accum_steps == 0 or step + 1 == len(loader):
+                optimizer.step()
+                optimizer.zero_grad()
+
+            stats["loss"] = loss.item()
+            history.append(stats)
+            print(f"[DPO] Epoch {epoch+1}, Step {step+1}/{len(loader)}, Loss: {stats['loss']:.4f}, "
+                  f"보상 정확도: {stats['reward_accuracy'] * 100:.0f}%, 마진: {stats['reward_margin']:.3f}")
+    return history
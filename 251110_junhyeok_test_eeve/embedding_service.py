@@ -0,0 +1,348 @@
+"""
+Vector DB 구축 / 검색이 함께 쓰는 문장 임베딩 서비스
+
+2_generate_vecotor_db.py 는 AutoModel + mean_pooling 으로, 3_use_vecotr.py 는 SentenceTransformer 로
+같은 jhgan/ko-sroberta-multitask 를 따로 로딩해서 임베딩했다. 스크립트마다 모델을 올리고,
+두 경로의 벡터가 같다는 보장도 없었다 (SentenceTransformer 는 128 토큰에서 자르는데 빌드는 256).
+
+- Embedder.encode_many(): 길이 정렬 배치 (corpus_encoder.iter_embeddings) + mean pooling 한 가지 경로
+- EmbeddingCache: 내용 해시 → 벡터를 sqlite 파일에 저장. 이미 임베딩한 문장은 모델을 거치지 않고,
+  캐시에 다 있으면 모델을 아예 로딩하지 않는다 (인덱스 종류만 바꿔서 다시 빌드할 때 등)
+- serve / EmbeddingClient: 모델을 한 번만 올려 둔 로컬 HTTP 프로세스를 여러 스크립트가 같이 씀
+- check_parity(): Embedder 와 SentenceTransformer 벡터가 같은지 확인
+- backend: torch (기본) / onnx / onnx-int8 (onnx_encoder.py, GPU 없는 서버용 ONNX Runtime 백엔드)
+
+사용 예:
+    embedder = get_embedder()          # EMBEDDING_SERVER_URL 이 있으면 서버, 없으면 이 프로세스에서 로딩
+    vectors = embedder.encode_many(["문장1", "문장2"])   # (2, 768) float32
+
+    python embedding_service.py serve --port 8100
+    EMBEDDING_SERVER_URL=http://127.0.0.1:8100 python 3_use_vecotr.py
+
+    python embedding_service.py parity
+"""
+
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from corpus_encoder import iter_embeddings
+from vector_store import content_hash
+
+MODEL_NAME = "jhgan/ko-sroberta-multitask"
+# ko-sroberta-multitask 의 SentenceTransformer 설정 (sentence_bert_config.json) max_seq_length
+MAX_LENGTH = 128
+CACHE_PATH = os.getenv("EMBEDDING_CACHE", "embedding_cache.sqlite")
+BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+class EmbeddingCache:
+    """(모델, max_length, 내용 해시) → float32 벡터 를 저장하는 sqlite 파일 (여러 프로세스가 같이 써도 됨)"""
+
+    def __init__(self, path=CACHE_PATH, namespace=""):
+        """
+        Args:
+            path (str): sqlite 파일
+            namespace (str): 모델 / 설정이 다르면 벡터가 달라지므로 key 에 함께 넣음
+        """
+        self.namespace = namespace
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                          "(namespace TEXT, hash TEXT, vector BLOB, PRIMARY KEY (namespace, hash))")
+
+    def get_many(self, hashes):
+        """
+        Returns:
+            dict: 캐시에 있는 해시 → 벡터
+        """
+        found = {}
+        hashes = list(hashes)
+        # sqlite 의 변수 개수 제한 (기본 999) 안에서 나눠서 조회
+        for start in range(0, len(hashes), 500):
+            part = hashes[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE namespace = ? AND hash IN ({','.join('?' * len(part))})",
+                [self.namespace] + part)
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        """items: (해시, 벡터)"""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                                  [(self.namespace, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items])
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings WHERE namespace = ?",
+                                 (self.namespace,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class Embedder:
+    """AutoModel + mean pooling 문장 임베딩 (모델은 캐시에 없는 문장이 처음 나올 때 로딩)"""
+
+    def __init__(self, model_name=MODEL_NAME, cache_path=CACHE_PATH, batch_size=64, max_length=MAX_LENGTH,
+                 device_map="auto", backend=BACKEND, onnx_path=None):
+        """
+        Args:
+            model_name (str): HF 모델 이름 또는 경로
+            cache_path (str): 임베딩 캐시 sqlite 파일 (None 이면 캐시 사용 안 함)
+            batch_size (int): forward 한 번에 넣을 문장 수
+            max_length (int): 문장 최대 토큰 수 (SentenceTransformer 와 같아야 벡터가 같음)
+            backend (str): torch / onnx / onnx-int8 (onnx_encoder.load_encoder)
+            onnx_path (str): onnx 백엔드에서 쓸 이미 내보낸 .onnx 파일 (None 이면 필요할 때 내보냄)
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.device_map = device_map
+        self.backend = backend
+        self.onnx_path = onnx_path
+        self.tokenizer = None
+        self.model = None
+        # int8 은 벡터가 조금 달라지므로 torch 와 캐시를 나눔 (torch 는 이전 캐시 key 그대로)
+        namespace = f"{model_name}:{max_length}" + (f":{backend}" if backend != "torch" else "")
+        self.cache = EmbeddingCache(cache_path, namespace) if cache_path else None
+
+    def _load(self):
+        from transformers import AutoTokenizer
+        from onnx_encoder import load_encoder
+
+        print(f"🔥 임베딩 모델 로딩: {self.model_name} ({self.backend})")
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = load_encoder(self.model_name, backend=self.backend, device_map=self.device_map,
+                                  onnx_path=self.onnx_path)
+
+    def encode_many(self, texts):
+        """
+        Args:
+            texts (list[str]): 문장들 (같은 문장은 한 번만 임베딩)
+
+        Returns:
+            np.ndarray: (len(texts), dim) float32
+        """
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.cache.get_many(set(hashes)) if self.cache is not None else {}
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in vectors:
+                missing[h] = text
+
+        if missing:
+            computed = list(zip(missing, self._embed(list(missing.values()))))
+            vectors.update(computed)
+            if self.cache is not None:
+                self.cache.put_many(computed)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[h] for h in hashes]).astype(np.float32, copy=False)
+
+    def _embed(self, texts):
+        """캐시에 없는 문장들 → (len(texts), dim), texts 순서 그대로"""
+        if self.model is None:
+            self._load()
+        out = [None] * len(texts)
+        for positions, embeddings in iter_embeddings(texts, self.tokenizer, self.model, batch_size=self.batch_size,
+                                                     max_length=self.max_length):
+            for p, e in zip(positions.tolist(), embeddings):
+                out[p] = e
+        return np.stack(out)
+
+    def encode(self, text):
+        """문장 하나 → (dim,)"""
+        return self.encode_many([text])[0]
+
+    def info(self):
+        return {"model": self.model_name, "max_length": self.max_length, "backend": self.backend}
+
+
+# ============================================================================
+# 로컬 서버 / 클라이언트
+# ============================================================================
+def _pack(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return {"shape": list(vectors.shape), "data": base64.b64encode(vectors.tobytes()).decode("ascii")}
+
+
+def _unpack(body):
+    return np.frombuffer(base64.b64decode(body["data"]), dtype=np.float32).reshape(body["shape"])
+
+
+def make_handler(embedder):
+    """Embedder 를 쓰는 HTTP 핸들러 클래스 생성 (GET /health, POST /embed)"""
+    # 모델 forward 와 sqlite 연결은 요청 스레드끼리 나눠 쓰지 않음
+    lock = threading.Lock()
+
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/health":
+                self._send(404, {"error": "Not Found"})
+                return
+            self._send(200, embedder.info())
+
+        def do_POST(self):
+            if self.path != "/embed":
+                self._send(404, {"error": "Not Found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts = json.loads(self.rfile.read(length))["texts"]
+            except (ValueError, KeyError):
+                self._send(400, {"error": "Bad Request"})
+                return
+            try:
+                with lock:
+                    vectors = embedder.encode_many(texts)
+            except Exception as e:
+                print(f"⚠️ 임베딩 에러: {e}")
+                self._send(500, {"error": "Internal Server Error"})
+                return
+            self._send(200, _pack(vectors))
+
+        def _send(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingHandler
+
+
+class EmbeddingClient:
+    """embedding_service.py serve 로 띄운 서버에 encode_many 를 보내는 클라이언트 (Embedder 와 같은 사용법)"""
+
+    def __init__(self, url, timeout=600):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def info(self):
+        with urllib.request.urlopen(self.url + "/health", timeout=5) as resp:
+            return json.loads(resp.read())
+
+    def encode_many(self, texts):
+        request = urllib.request.Request(self.url + "/embed",
+                                         data=json.dumps({"texts": list(texts)}, ensure_ascii=False).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+            return _unpack(json.loads(resp.read()))
+
+    def encode(self, text):
+        return self.encode_many([text])[0]
+
+
+def get_embedder(url=None, model_name=MODEL_NAME, max_length=MAX_LENGTH, backend=BACKEND, **kwargs):
+    """
+    EMBEDDING_SERVER_URL (또는 url) 서버가 살아 있고 모델 설정이 같으면 EmbeddingClient,
+    아니면 이 프로세스에서 쓰는 Embedder
+
+    Args:
+        **kwargs: Embedder 설정 (cache_path, batch_size, device_map)
+    """
+    url = url or os.getenv("EMBEDDING_SERVER_URL")
+    if url:
+        client = EmbeddingClient(url)
+        try:
+            info = client.info()
+        except (urllib.error.URLError, OSError) as e:
+            print(f"⚠️ 임베딩 서버({url}) 에 연결할 수 없어 직접 로딩합니다: {e}")
+        else:
+            if info == {"model": model_name, "max_length": max_length, "backend": backend}:
+                print(f"✅ 임베딩 서버 사용: {url}")
+                return client
+            print(f"⚠️ 임베딩 서버 설정({info}) 이 달라 직접 로딩합니다.")
+    return Embedder(model_name, max_length=max_length, backend=backend, **kwargs)
+
+
+# ============================================================================
+# SentenceTransformer 와 벡터 비교
+# ============================================================================
+PARITY_TEXTS = [
+    "요즘 스마트폰 게임은 전부 현질을 유도하는 쓰레기 시스템이라고 본다.",
+    "어떤 문제든 정부가 개입하면 상황이 더 나빠진다.",
+    "짧은 문장",
+    # max_length 보다 긴 문장 (자르는 위치까지 같아야 함)
+    "대형 IT 기업은 사용자 데이터를 항상 불법적으로 이용한다. " * 20,
+]
+
+
+def check_parity(texts=PARITY_TEXTS, model_name=MODEL_NAME, atol=1e-4, backend=BACKEND):
+    """
+    같은 문장을 Embedder (AutoModel + mean pooling) 와 SentenceTransformer 로 임베딩해서 비교
+
+    Returns:
+        float: 최대 절대 오차 (atol 을 넘으면 AssertionError)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    expected = st_model.encode(texts, convert_to_numpy=True)
+    embedder = Embedder(model_name, cache_path=None, max_length=st_model.max_seq_length, device_map="cpu",
+                        backend=backend)
+    actual = embedder.encode_many(texts)
+
+    max_diff = float(np.abs(actual - expected).max())
+    cosine = np.sum(actual * expected, axis=1) / (np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1))
+    print(f"🔎 SentenceTransformer 대비 최대 오차 {max_diff:.2e}, 최소 cosine {cosine.min():.6f} "
+          f"(max_seq_length {st_model.max_seq_length})")
+    assert max_diff <= atol, f"임베딩이 다릅니다: 최대 오차 {max_diff:.2e} > {atol:.0e}"
+    print("✅ 두 경로의 임베딩이 같습니다.")
+    return max_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description="문장 임베딩 서비스")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="모델을 올려 둔 로컬 임베딩 서버")
+    serve.add_argument("--model", default=MODEL_NAME)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8100)
+    serve.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    serve.add_argument("--batch-size", type=int, default=64)
+    serve.add_argument("--backend", default=BACKEND, choices=("torch", "onnx", "onnx-int8"))
+    serve.add_argument("--cache", default=CACHE_PATH, help="임베딩 캐시 sqlite 파일 (빈 값이면 사용 안 함)")
+
+    parity = sub.add_parser("parity", help="SentenceTransformer 와 벡터 비교")
+    parity.add_argument("--model", default=MODEL_NAME)
+    parity.add_argument("--backend", default=BACKEND, choices=("torch", "onnx", "onnx-int8"))
+    args = parser.parse_args()
+
+    if args.command == "parity":
+        check_parity(model_name=args.model, backend=args.backend)
+        return
+
+    embedder = Embedder(args.model, cache_path=args.cache or None, batch_size=args.batch_size,
+                        max_length=args.max_length, backend=args.backend)
+    # 첫 요청이 모델 로딩을 기다리지 않도록 미리 올려 둠
+    start = time.perf_counter()
+    embedder._load()
+    print(f"✅ 모델 로딩 완료 ({time.perf_counter() - start:.1f}초)")
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(embedder))
+    print(f"🚀 임베딩 서버 시작: http://{args.host}:{args.port} (POST /embed)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n종료합니다.")
+
+
+if __name__ == "__main__":
+    main()
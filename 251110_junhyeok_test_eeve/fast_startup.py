@@ -0,0 +1,205 @@
+"""
+모델 시작(startup) 시간 단축
+
+스크립트를 실행할 때마다 EEVE 로딩이 가장 오래 걸린다. 여기서는
+
+1. convert_to_local(): HF 허브 캐시의 가중치를 원하는 dtype 으로 한 번 변환해서
+   로컬 디렉터리에 safetensors shard 로 저장 (다음부터는 dtype 변환 / 허브 확인 없음)
+2. load_model_fast(): 로컬 shard 를 safetensors mmap 으로 열어 필요한 텐서만
+   레이어 단위로 읽고 (low_cpu_mem_usage), 짧은 warmup forward 까지 끝낸 모델 반환
+   (모델을 한 번 올려 두고 여러 호출자가 쓰려면 local_llm_server.py)
+3. benchmark_startup(): 새 프로세스에서 "첫 토큰까지 걸린 시간" 을
+   토크나이저 / 가중치 / warmup / 첫 토큰으로 나눠 측정
+
+사용 예:
+    # 한 번만: bf16 으로 변환해서 로컬에 저장
+    python fast_startup.py convert --model yanolja/EEVE-Korean-Instruct-10.8B-v1.0 --out ./eeve-bf16 --dtype bf16
+
+    # 허브 캐시 vs 로컬 shard 시작 시간 비교
+    python fast_startup.py benchmark --model yanolja/EEVE-Korean-Instruct-10.8B-v1.0 --local ./eeve-bf16
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from model_loader import load_model
+
+CONVERT_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}
+MARKER_FILE = "fast_startup.json"
+WARMUP_PROMPT = "안녕하세요"
+
+
+# ============================================================================
+# 로컬 변환
+# ============================================================================
+def is_converted(local_dir):
+    """convert_to_local() 로 만든 디렉터리인지 확인"""
+    return os.path.exists(os.path.join(local_dir, MARKER_FILE))
+
+
+def convert_to_local(model_name, local_dir, dtype="bf16", max_shard_size="2GB"):
+    """
+    모델을 지정한 dtype 의 safetensors shard 로 로컬 디렉터리에 저장
+
+    양자화 모드(int8/int4)는 커스텀 모듈이라 저장하지 않는다.
+    로컬 shard 를 load_model_fast(..., mode=...) 로 올릴 때 다시 양자화한다.
+
+    Args:
+        model_name (str): HF 모델 이름 또는 경로
+        local_dir (str): 저장할 디렉터리
+        dtype (str): fp16 / bf16 / fp32
+        max_shard_size (str): shard 하나의 최대 크기
+
+    Returns:
+        str: local_dir
+    """
+    if dtype not in CONVERT_DTYPES:
+        raise ValueError(f"변환 dtype 은 {', '.join(CONVERT_DTYPES)} 중 하나여야 합니다: {dtype}")
+
+    print(f"🔄 변환 중: {model_name} → {local_dir} ({dtype}, shard {max_shard_size})")
+    start = time.perf_counter()
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name, torch_dtype=CONVERT_DTYPES[dtype], low_cpu_mem_usage=True
+    )
+
+    os.makedirs(local_dir, exist_ok=True)
+    tokenizer.save_pretrained(local_dir)
+    model.save_pretrained(local_dir, safe_serialization=True, max_shard_size=max_shard_size)
+
+    with open(os.path.join(local_dir, MARKER_FILE), "w", encoding="utf-8") as f:
+        json.dump({"source": model_name, "dtype": dtype}, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ 변환 완료: {time.perf_counter() - start:.1f}초")
+    return local_dir
+
+
+# ============================================================================
+# 빠른 로딩 + warmup
+# ============================================================================
+def warmup(model, tokenizer, new_tokens=2):
+    """
+    짧은 generate 한 번으로 커널 선택 / 메모리 할당 등 첫 호출 비용을 미리 지불
+
+    Returns:
+        float: warmup 에 걸린 시간(초)
+    """
+    inputs = tokenizer(WARMUP_PROMPT, return_tensors="pt").to(model.device)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    start = time.perf_counter()
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=new_tokens, do_sample=False, pad_token_id=pad_token_id)
+    return time.perf_counter() - start
+
+
+def load_model_fast(model_name, mode="auto", local_dir=None, warm=True, **kwargs):
+    """
+    로컬 shard 가 있으면 그걸 mmap 으로 올리고 warmup 까지 끝낸 모델 반환
+
+    Args:
+        model_name (str): HF 모델 이름 (local_dir 이 없거나 변환 전일 때 사용)
+        mode (str): load_model 의 로딩 모드
+        local_dir (str): convert_to_local() 로 만든 디렉터리 (없으면 model_name 그대로)
+        warm (bool): warmup forward 실행 여부
+        **kwargs: load_model 에 넘길 추가 인자
+
+    Returns:
+        tuple: (tokenizer, model). model.load_report 에 warmup_sec 추가
+    """
+    source = model_name
+    if local_dir and is_converted(local_dir):
+        source = local_dir
+        # 허브 확인 없이 로컬 파일만 사용
+        kwargs.setdefault("local_files_only", True)
+        kwargs.setdefault("use_safetensors", True)
+    elif local_dir:
+        print(f"⚠️ {local_dir} 에 변환된 가중치가 없어 {model_name} 에서 로딩합니다.")
+
+    # safetensors 는 mmap 으로 열리므로 레이어 단위로 필요한 텐서만 읽음
+    kwargs.setdefault("low_cpu_mem_usage", True)
+
+    tokenizer, model = load_model(source, mode=mode, **kwargs)
+
+    model.load_report["warmup_sec"] = warmup(model, tokenizer) if warm else 0.0
+    if warm:
+        print(f"🔥 warmup 완료: {model.load_report['warmup_sec']:.2f}초")
+    return tokenizer, model
+
+
+# ============================================================================
+# 시작 시간 벤치마크
+# ============================================================================
+def _startup_one(model_name, mode, local_dir, prompt):
+    start = time.perf_counter()
+    tokenizer, model = load_model_fast(model_name, mode=mode, local_dir=local_dir)
+    report = dict(model.load_report)
+
+    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    first = time.perf_counter()
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=1, do_sample=False, pad_token_id=pad_token_id)
+    report["first_token_sec"] = time.perf_counter() - first
+    report["total_sec"] = time.perf_counter() - start
+    return report
+
+
+def benchmark_startup(model_name, mode="auto", local_dir=None,
+                      prompt="안녕하세요! 간단히 자기소개를 해주세요."):
+    """
+    새 프로세스에서 첫 토큰이 나올 때까지의 시간을 단계별로 측정
+    (local_dir 이 있으면 허브 캐시 로딩과 로컬 shard 로딩을 둘 다 측정)
+
+    Returns:
+        list[dict]: 소스별 측정 결과
+    """
+    sources = [("hub", None)] + ([("local", local_dir)] if local_dir else [])
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for label, path in sources:
+        # 페이지 캐시 외에는 아무 것도 공유하지 않는 깨끗한 프로세스에서 측정
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            report = pool.submit(_startup_one, model_name, mode, path, prompt).result()
+        report["source"] = label
+        results.append(report)
+
+    print("\n" + "=" * 70)
+    print(f"{'소스':<8}{'토크나이저':>10}{'가중치':>10}{'warmup':>10}{'첫 토큰':>10}{'합계(초)':>12}")
+    print("=" * 70)
+    for r in results:
+        print(f"{r['source']:<8}{r['tokenizer_sec']:>10.2f}{r['weights_sec']:>10.2f}"
+              f"{r['warmup_sec']:>10.2f}{r['first_token_sec']:>10.2f}{r['total_sec']:>12.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    from model_loader import LOAD_MODES
+
+    parser = argparse.ArgumentParser(description="모델 시작 시간 단축 / 측정")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert = sub.add_parser("convert", help="로컬 safetensors shard 로 변환")
+    convert.add_argument("--model", default="yanolja/EEVE-Korean-Instruct-10.8B-v1.0")
+    convert.add_argument("--out", required=True)
+    convert.add_argument("--dtype", default="bf16", choices=list(CONVERT_DTYPES))
+    convert.add_argument("--max-shard-size", default="2GB")
+
+    bench = sub.add_parser("benchmark", help="첫 토큰까지 걸리는 시간 측정")
+    bench.add_argument("--model", default="yanolja/EEVE-Korean-Instruct-10.8B-v1.0")
+    bench.add_argument("--local", default=None)
+    bench.add_argument("--load-mode", default="auto", choices=LOAD_MODES)
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        convert_to_local(args.model, args.out, dtype=args.dtype, max_shard_size=args.max_shard_size)
+    else:
+        benchmark_startup(args.model, mode=args.load_mode, local_dir=args.local)
@@ -0,0 +1,275 @@
+"""
+KV 캐시를 턴 사이에 재사용하는 대화 세션
+
+매 턴마다 전체 채팅 템플릿을 처음부터 다시 인코딩하지 않고,
+이전 턴까지 계산해 둔 past_key_values 를 그대로 들고 있다가
+새로 추가된 토큰(새 사용자 발화 + 생성 프롬프트)만 prefill 한다.
+
+- 시스템 프롬프트는 첫 턴에 한 번만 계산되고 계속 재사용된다.
+- 캐시는 "이전에 계산한 토큰열"과 "이번 입력 토큰열"의 공통 접두사까지만
+  남기고 잘라내므로(crop) 위치 정보(RoPE)가 어긋나지 않는다.
+- 메모리 상한(max_cache_tokens / max_cache_mb)을 넘으면 가장 오래된 턴부터
+  버리는 슬라이딩 윈도우로 동작한다. 시스템 프롬프트는 항상 유지된다.
+  한 번 버릴 때 상한의 evict_ratio 까지 넉넉히 비워서, 상한 근처에서
+  매 턴 전체 윈도우를 다시 prefill 하는 일이 없도록 한다.
+- chat_stream() 은 생성 중인 토큰을 바로바로 넘겨주고 TTFT / tokens/sec 를 잰다.
+- draft_model 을 주면 assisted decoding 으로 생성하고 draft 채택률을 기록한다.
+- 입력 토큰은 PromptCache 로 만든다. 시스템 프롬프트 부분은 다시 토크나이징하지 않고,
+  캐시가 비어 있을 때는 공유 prefill 캐시에서 시작한다.
+"""
+
+import threading
+import time
+
+import torch
+from transformers import DynamicCache, StoppingCriteriaList, TextIteratorStreamer
+
+from assisted import ForwardCounter, acceptance_stats
+from prompt_cache import PromptCache
+from stopping import LineBudgetCriteria, truncate_response
+
+
+def kv_bytes_per_token(model):
+    """
+    토큰 1개가 KV 캐시에서 차지하는 바이트 수 (모든 레이어의 K, V 합)
+
+    Args:
+        model: HuggingFace CausalLM 모델
+
+    Returns:
+        int: 토큰당 바이트 수
+    """
+    config = model.config
+    n_heads = config.num_attention_heads
+    n_kv_heads = getattr(config, "num_key_value_heads", None) or n_heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // n_heads
+    dtype_bytes = torch.tensor([], dtype=model.dtype).element_size()
+    return 2 * config.num_hidden_layers * n_kv_heads * head_dim * dtype_bytes
+
+
+class TimedStreamer(TextIteratorStreamer):
+    """첫 번째 생성 토큰이 나온 시각을 기록하는 스트리머"""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.first_token_time = None
+
+    def put(self, value):
+        is_prompt = self.skip_prompt and self.next_tokens_are_prompt
+        super().put(value)
+        if not is_prompt and self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+
+class ChatSession:
+    """past_key_values 를 유지하는 대화 세션"""
+
+    def __init__(self, model, tokenizer, system_prompt, max_cache_tokens=2048,
+                 max_cache_mb=None, evict_ratio=0.5, draft_model=None, prompt_cache=None,
+                 **generate_kwargs):
+        """
+        Args:
+            model: HuggingFace CausalLM 모델
+            tokenizer: 채팅 템플릿을 가진 토크나이저
+            system_prompt (str): 고정 시스템 프롬프트
+            max_cache_tokens (int): 캐시에 유지할 최대 토큰 수
+            max_cache_mb (float): 캐시 메모리 상한 (MB, 없으면 토큰 수만 사용)
+            evict_ratio (float): 상한 초과 시 이 비율까지 오래된 턴을 버림
+            draft_model: assisted decoding 용 작은 draft 모델 (같은 토크나이저)
+            prompt_cache (PromptCache): 여러 세션이 공유할 프롬프트 캐시 (없으면 새로 만듦)
+            **generate_kwargs: model.generate() 에 그대로 넘길 샘플링 옵션
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.system_prompt = system_prompt
+        self.history = []
+
+        self.max_cache_tokens = max_cache_tokens
+        if max_cache_mb is not None:
+            mb_tokens = int(max_cache_mb * 1024**2 // kv_bytes_per_token(model))
+            self.max_cache_tokens = min(self.max_cache_tokens, mb_tokens)
+        self.evict_ratio = evict_ratio
+        self.draft_model = draft_model
+        self.prompt_cache = prompt_cache or PromptCache(tokenizer, model)
+
+        self.generate_kwargs = {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "do_sample": True,
+            "pad_token_id": tokenizer.eos_token_id,
+        }
+        self.generate_kwargs.update(generate_kwargs)
+
+        self.cache = DynamicCache()
+        self.cached_ids = torch.empty(0, dtype=torch.long)
+        self.last_stats = {}
+
+    def reset(self):
+        """대화 이력 초기화 (시스템 프롬프트 캐시는 다음 턴에 재사용됨)"""
+        self.history = []
+
+    def _build_messages(self, user_input):
+        messages = [{"role": "system", "content": self.system_prompt}]
+        messages.extend(self.history)
+        messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def _encode(self, messages):
+        return self.prompt_cache.encode_messages(messages)
+
+    def _fit_window(self, user_input, max_new_tokens):
+        """메모리 상한을 넘으면 오래된 턴(user/assistant 쌍)을 버린다"""
+        input_ids = self._encode(self._build_messages(user_input))
+        if len(input_ids) + max_new_tokens <= self.max_cache_tokens:
+            return input_ids
+
+        target = self.max_cache_tokens * self.evict_ratio
+        while len(input_ids) + max_new_tokens > target and self.history:
+            self.history = self.history[2:]
+            input_ids = self._encode(self._build_messages(user_input))
+        return input_ids
+
+    def _reuse_prefix(self, input_ids):
+        """캐시된 토큰열과 공통 접두사 길이만큼만 캐시를 남긴다"""
+        n = min(len(self.cached_ids), len(input_ids) - 1)
+        if n > 0:
+            mismatch = (self.cached_ids[:n] != input_ids[:n]).nonzero()
+            if len(mismatch) > 0:
+                n = mismatch[0].item()
+
+        if n == 0:
+            # 처음이거나 시스템 프롬프트부터 달라졌으면 공유 prefill 캐시에서 시작
+            head_ids = self.prompt_cache.head_ids(self.system_prompt)
+            if head_ids is not None and len(head_ids) < len(input_ids) \
+                    and torch.equal(input_ids[:len(head_ids)], head_ids):
+                self.cache = self.prompt_cache.prefill(self.system_prompt)
+                self.cached_ids = head_ids
+                n = len(head_ids)
+            else:
+                self.cache = DynamicCache()
+        elif n < self.cache.get_seq_length():
+            self.cache.crop(n)
+        return n
+
+    def cache_memory_mb(self):
+        """현재 KV 캐시 크기 (MB)"""
+        return self.cache.get_seq_length() * kv_bytes_per_token(self.model) / 1024**2
+
+    def chat(self, user_input, max_new_tokens=100, keep_history=True,
+             max_lines=None, max_chars=None, **generate_kwargs):
+        """
+        새 사용자 발화에 대한 응답 생성
+
+        Args:
+            user_input (str): 사용자 발화
+            max_new_tokens (int): 최대 생성 토큰 수
+            keep_history (bool): False 면 이번 턴을 이력에 남기지 않음
+                (시스템 프롬프트 캐시만 재사용하는 단발성 호출)
+            max_lines (int): 지정하면 이 줄 수를 채우는 순간 생성을 멈추고 잘라냄
+            max_chars (int): 지정하면 이 글자 수를 채우는 순간 생성을 멈추고 잘라냄
+            **generate_kwargs: 이번 호출에만 적용할 generate 옵션
+
+        Returns:
+            str: 모델 응답
+        """
+        if not keep_history:
+            self.reset()
+
+        input_ids = self._fit_window(user_input, max_new_tokens)
+        reused = self._reuse_prefix(input_ids)
+
+        kwargs = dict(self.generate_kwargs)
+        kwargs.update(generate_kwargs)
+        if self.draft_model is not None:
+            kwargs["assistant_model"] = self.draft_model
+
+        budget = None
+        if max_lines is not None or max_chars is not None:
+            budget = LineBudgetCriteria(
+                self.tokenizer,
+                len(input_ids),
+                max_lines=max_lines,
+                max_chars=max_chars
+            )
+            criteria = StoppingCriteriaList(kwargs.pop("stopping_criteria", []))
+            criteria.append(budget)
+            kwargs["stopping_criteria"] = criteria
+
+        device = self.model.device
+        with ForwardCounter(self.model) as target, ForwardCounter(self.draft_model) as draft:
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    input_ids=input_ids.unsqueeze(0).to(device),
+                    attention_mask=torch.ones(1, len(input_ids), dtype=torch.long, device=device),
+                    past_key_values=self.cache,
+                    max_new_tokens=max_new_tokens,
+                    use_cache=True,
+                    **kwargs
+                )
+
+        new_tokens = outputs[0, len(input_ids):]
+        response = self.tokenizer.decode(new_tokens, skip_special_tokens=True).strip()
+        if budget is not None:
+            response = truncate_response(response, budget.max_lines, budget.max_chars)
+
+        # 마지막으로 생성된 토큰은 아직 forward 되지 않았으므로 캐시 길이만큼만 기록
+        self.cached_ids = outputs[0, :self.cache.get_seq_length()].cpu()
+
+        if keep_history:
+            self.history.append({"role": "user", "content": user_input})
+            self.history.append({"role": "assistant", "content": response})
+
+        self.last_stats = {
+            "prompt_tokens": len(input_ids),
+            "reused_tokens": reused,
+            "prefill_tokens": len(input_ids) - reused,
+            "new_tokens": len(new_tokens),
+            "cache_tokens": self.cache.get_seq_length(),
+        }
+        if self.draft_model is not None:
+            self.last_stats.update(acceptance_stats(len(new_tokens), target.count, draft.count))
+        return response
+
+    def chat_stream(self, user_input, max_new_tokens=100, keep_history=True, **generate_kwargs):
+        """
+        chat() 과 같지만, 생성은 워커 스레드에서 돌리고 텍스트 조각을 나오는 대로 돌려준다
+
+        다 돌고 나면 last_stats 에 ttft(초), tokens_per_sec 가 추가된다.
+
+        Yields:
+            str: 새로 디코딩된 텍스트 조각
+        """
+        streamer = TimedStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        result = {}
+
+        def worker():
+            try:
+                result["response"] = self.chat(
+                    user_input, max_new_tokens, keep_history, streamer=streamer, **generate_kwargs
+                )
+            except Exception as e:
+                result["error"] = e
+                streamer.end()
+
+        start = time.perf_counter()
+        thread = threading.Thread(target=worker)
+        thread.start()
+
+        started = False
+        for text in streamer:
+            # chat() 의 strip() 과 맞추기 위해 앞쪽 공백은 버림
+            if not started:
+                text = text.lstrip()
+                started = bool(text)
+            if text:
+                yield text
+
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+
+        end = time.perf_counter()
+        first = streamer.first_token_time or end
+        new_tokens = self.last_stats["new_tokens"]
+        self.last_stats["ttft"] = first - start
+        self.last_stats["tokens_per_sec"] = (new_tokens - 1) / (end - first) if new_tokens > 1 and end > first else 0.0
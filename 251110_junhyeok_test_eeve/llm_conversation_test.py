@@ -1,44 +1,51 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
+import os
+from assisted import check_draft_compatible
+from fast_startup import load_model_fast
+from kv_session import ChatSession
+from model_loader import load_model
+
+# 로딩 모드: auto(GPU fp16 / CPU bf16), bf16, fp32, int8-dynamic, int8-weight, int4-weight
+LOAD_MODE = os.getenv("EEVE_LOAD_MODE", "auto")
+# fast_startup.py convert 로 만든 로컬 shard 디렉터리 (없으면 허브에서 로딩)
+LOCAL_DIR = os.getenv("EEVE_LOCAL_DIR")
+# assisted decoding 용 draft 모델 (같은 토크나이저를 쓰는 작은 모델, 비워두면 사용 안 함)
+DRAFT_MODEL = os.getenv("EEVE_DRAFT_MODEL")
 
 print("🔥 모델 로딩...")
 model_name = "yanolja/EEVE-Korean-Instruct-10.8B-v1.0"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    torch_dtype=torch.float16,
-    device_map="auto"
+# 첫 질문이 느리지 않도록 warmup 까지 끝내고 대화 시작
+tokenizer, model = load_model_fast(model_name, mode=LOAD_MODE, local_dir=LOCAL_DIR)
+
+draft_model = None
+if DRAFT_MODEL:
+    print(f"🔥 draft 모델 로딩: {DRAFT_MODEL}")
+    draft_tokenizer, draft_model = load_model(DRAFT_MODEL, mode=LOAD_MODE)
+    check_draft_compatible(tokenizer, draft_tokenizer)
+
+# 시스템 프롬프트와 이전 턴의 KV 캐시를 유지하는 세션
+# (MAX_CACHE_TOKENS 를 넘으면 오래된 턴부터 버림)
+MAX_CACHE_TOKENS = 2048
+session = ChatSession(
+    model,
+    tokenizer,
+    "당신은 친절한 AI 어시스턴트입니다.",
+    max_cache_tokens=MAX_CACHE_TOKENS,
+    draft_model=draft_model
 )
-model.eval()
 
 def chat(user_input, max_new_tokens=100):
-    messages = [
-        {"role": "system", "content": "당신은 친절한 AI 어시스턴트입니다."},
-        {"role": "user", "content": user_input}
-    ]
-    
-    input_text = tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True
-    )
-    
-    inputs = tokenizer(input_text, return_tensors="pt").to(model.device)
-    
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            temperature=0.7,
-            top_p=0.9,
-            do_sample=True,
-            pad_token_id=tokenizer.eos_token_id,
-            use_cache=False
-        )
+    """생성되는 토큰을 바로 출력하고, 끝나면 TTFT / 생성 속도를 함께 보여줌"""
+    chunks = []
+    for text in session.chat_stream(user_input, max_new_tokens=max_new_tokens):
+        print(text, end="", flush=True)
+        chunks.append(text)
     
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    response = response.split("assistant")[-1].strip()
-    return response
+    stats = session.last_stats
+    line = f"\n   ⏱️ TTFT {stats['ttft']:.2f}s | {stats['tokens_per_sec']:.1f} tok/s ({stats['new_tokens']} 토큰)"
+    if draft_model is not None:
+        line += f" | draft 채택률 {stats['acceptance_rate'] * 100:.0f}%"
+    print(line)
+    return "".join(chunks).strip()
 
 print("="*70)
 print("모델과 대화하기 (종료: 'quit')")
@@ -58,7 +65,6 @@ while True:
     
     print("🤖 모델: ", end="", flush=True)
     response = chat(user_input)
-    print(response)
     
     conversation.append({"user": user_input, "model": response})
 
@@ -0,0 +1,401 @@
+"""
+로컬 LLM 추론 서버 (continuous batching)
+
+EEVE 같은 큰 모델을 스크립트마다 새로 로딩하지 않고, 프로세스 하나가 모델을
+한 번만 올려 두고 CLOVA Studio HCX-003 과 같은 형태의 chat-completions
+엔드포인트로 여러 호출자에게 응답한다.
+
+요청 큐는 iteration 단위로 배치를 구성한다 (continuous batching).
+- 새 요청은 들어오는 즉시 prefill 하고 다음 decode 스텝부터 배치에 합류
+- 매 decode 스텝마다 배치 안의 모든 시퀀스가 forward 한 번을 공유
+- 끝난 요청은 그 스텝에서 바로 빠지고 응답을 돌려받음
+
+사용 예:
+    python local_llm_server.py --model gpt2 --port 8000
+    python local_llm_server.py --model ./sft_detox_model
+
+    # 4_test_dialogue.py 등 CLOVA 클라이언트는 URL 만 바꾸면 그대로 동작
+    # (4_test_dialogue.py 는 URL 이 localhost / 127.0.0.1 이면 CLOVA_API_KEY 없이도 이 서버를 호출)
+    CLOVA_API_URL=http://127.0.0.1:8000/testapp/v1/chat-completions/HCX-003
+"""
+
+import argparse
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+from transformers import DynamicCache
+
+from model_loader import LOAD_MODES, load_model
+
+
+class GenerationRequest:
+    """배치 스케줄러에 들어가는 생성 요청 하나"""
+
+    def __init__(self, input_ids, max_tokens=256, temperature=0.5, top_p=0.8,
+                 top_k=0, repeat_penalty=0.0, stop_before=None):
+        """
+        Args:
+            input_ids (list[int]): 프롬프트 토큰
+            max_tokens (int): 최대 생성 토큰 수
+            temperature (float): 0 이면 greedy
+            top_p (float): nucleus 샘플링 임계값
+            top_k (int): 0 이면 사용하지 않음
+            repeat_penalty (float): CLOVA 기준 0~10 값
+                (HF repetition_penalty 1.0~1.2 로 선형 변환해서 적용)
+            stop_before (list[str]): 이 문자열이 나오면 그 앞에서 생성 종료
+        """
+        self.input_ids = list(input_ids)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.repetition_penalty = 1.0 + repeat_penalty / 50
+        self.stop_before = stop_before or []
+
+        self.output_ids = []
+        self.text = ""
+        self.stop_reason = None
+        self.done = threading.Event()
+
+
+def sample_next_token(logits, request):
+    """요청별 샘플링 옵션으로 다음 토큰 하나를 고른다"""
+    logits = logits.float()
+
+    if request.repetition_penalty != 1.0 and request.output_ids:
+        seen = torch.tensor(request.input_ids + request.output_ids, device=logits.device).unique()
+        scores = logits[seen]
+        logits[seen] = torch.where(scores > 0, scores / request.repetition_penalty,
+                                   scores * request.repetition_penalty)
+
+    if request.temperature <= 0:
+        return int(logits.argmax())
+
+    logits = logits / request.temperature
+    if request.top_k > 0:
+        kth = torch.topk(logits, min(request.top_k, logits.size(-1))).values[-1]
+        logits[logits < kth] = -float("inf")
+    if request.top_p < 1.0:
+        sorted_logits, sorted_idx = torch.sort(logits, descending=True)
+        cum_probs = sorted_logits.softmax(-1).cumsum(-1)
+        remove = cum_probs - sorted_logits.softmax(-1) > request.top_p
+        logits[sorted_idx[remove]] = -float("inf")
+
+    return int(torch.multinomial(logits.softmax(-1), 1))
+
+
+class ContinuousBatcher:
+    """iteration 단위로 요청을 합치고 빼는 배치 스케줄러"""
+
+    def __init__(self, model, tokenizer, max_batch_size=8):
+        """
+        Args:
+            model: HuggingFace CausalLM 모델
+            tokenizer: 해당 모델의 토크나이저
+            max_batch_size (int): 한 스텝에 함께 decode 할 최대 시퀀스 수
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue()
+        # 위치 임베딩 길이 (프롬프트 + 생성 토큰이 이를 넘으면 forward 가 실패함)
+        self.max_positions = getattr(model.config, "max_position_embeddings", None)
+
+        # 배치 상태: 왼쪽 패딩된 레이어별 (key, value) 와 attention mask
+        self.active = []
+        self.admitting = None
+        self.past = None
+        self.attention_mask = None
+        self.steps = 0
+
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        """요청을 큐에 넣고 생성이 끝날 때까지 기다린다"""
+        self.queue.put(request)
+        request.done.wait()
+        return request
+
+    def _loop(self):
+        while True:
+            try:
+                if not self.active:
+                    self._admit(self.queue.get())
+                while len(self.active) < self.max_batch_size:
+                    try:
+                        self._admit(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if self.active:
+                    self._decode_step()
+            except Exception as e:
+                # 모델 에러가 나도 서버 스레드는 살려두고, 진행 중이던 요청만 실패 처리
+                print(f"⚠️ 배치 처리 에러: {e}")
+                failed = self.active + ([self.admitting] if self.admitting else [])
+                for request in failed:
+                    request.stop_reason = "error"
+                    request.done.set()
+                self.active, self.admitting = [], None
+                self.past, self.attention_mask = None, None
+
+    def _fit_to_context(self, request):
+        """
+        프롬프트 + max_tokens 가 max_position_embeddings 를 넘으면 프롬프트 앞부분(오래된 대화) 을 잘라낸다
+
+        Returns:
+            bool: 받을 수 있는 요청이면 True (max_tokens 만으로도 넘치면 False)
+        """
+        if not self.max_positions:
+            return True
+        limit = self.max_positions - request.max_tokens
+        if limit < 1:
+            return False
+        if len(request.input_ids) > limit:
+            print(f"⚠️ 프롬프트 {len(request.input_ids)} 토큰 → 마지막 {limit} 토큰만 사용 "
+                  f"(max_position_embeddings {self.max_positions}, max_tokens {request.max_tokens})")
+            request.input_ids = request.input_ids[-limit:]
+        return True
+
+    @torch.no_grad()
+    def _admit(self, request):
+        """새 요청을 prefill 하고 배치 캐시 왼쪽에 패딩을 붙여 합친다"""
+        if not self._fit_to_context(request):
+            request.stop_reason = "rejected"
+            request.done.set()
+            return
+
+        device = self.model.device
+        input_ids = torch.tensor([request.input_ids], device=device)
+        try:
+            out = self.model(input_ids=input_ids, use_cache=True)
+            finished = self._append_token(request, out.logits[0, -1])
+        except Exception as e:
+            # prefill 은 요청 하나만 쓰므로 그 요청만 실패 처리하고 배치는 그대로 진행
+            print(f"⚠️ prefill 에러: {e}")
+            request.stop_reason = "error"
+            request.done.set()
+            return
+        if finished:
+            return
+
+        # 여기서부터 배치 캐시를 바꾸므로 에러가 나면 _loop 가 배치 전체를 실패 처리
+        self.admitting = request
+
+        past = out.past_key_values.to_legacy_cache()
+        mask = torch.ones(1, input_ids.shape[1], dtype=torch.long, device=device)
+
+        if self.past is None:
+            self.past, self.attention_mask = past, mask
+        else:
+            length = max(self.attention_mask.shape[1], mask.shape[1])
+            self.past = tuple(
+                (torch.cat([_pad_left(bk, length), _pad_left(k, length)]),
+                 torch.cat([_pad_left(bv, length), _pad_left(v, length)]))
+                for (bk, bv), (k, v) in zip(self.past, past)
+            )
+            self.attention_mask = torch.cat([
+                _pad_left(self.attention_mask, length, dim=1),
+                _pad_left(mask, length, dim=1),
+            ])
+        self.admitting = None
+        self.active.append(request)
+
+    @torch.no_grad()
+    def _decode_step(self):
+        """배치 안의 모든 시퀀스를 한 토큰씩 진행"""
+        device = self.model.device
+        last_tokens = torch.tensor([[r.output_ids[-1]] for r in self.active], device=device)
+        position_ids = self.attention_mask.sum(dim=1, keepdim=True)
+        self.attention_mask = torch.cat([
+            self.attention_mask,
+            torch.ones(len(self.active), 1, dtype=torch.long, device=device),
+        ], dim=1)
+
+        out = self.model(
+            input_ids=last_tokens,
+            attention_mask=self.attention_mask,
+            position_ids=position_ids,
+            past_key_values=DynamicCache.from_legacy_cache(self.past),
+            use_cache=True,
+        )
+        self.past = out.past_key_values.to_legacy_cache()
+        self.steps += 1
+
+        keep = [i for i, r in enumerate(self.active)
+                if not self._append_token(r, out.logits[i, -1])]
+        if len(keep) < len(self.active):
+            self._select(keep)
+
+    def _select(self, keep):
+        """끝난 시퀀스를 배치에서 빼고, 모두 패딩뿐인 왼쪽 열은 잘라낸다"""
+        self.active = [self.active[i] for i in keep]
+        if not keep:
+            self.past, self.attention_mask = None, None
+            return
+
+        idx = torch.tensor(keep, device=self.attention_mask.device)
+        mask = self.attention_mask[idx]
+        start = int(mask.any(dim=0).nonzero()[0])
+        self.attention_mask = mask[:, start:]
+        self.past = tuple((k[idx, :, start:], v[idx, :, start:]) for k, v in self.past)
+
+    def _append_token(self, request, logits):
+        """토큰 하나를 붙이고, 생성이 끝났으면 True 를 돌려준다"""
+        token = sample_next_token(logits, request)
+
+        if token == self.tokenizer.eos_token_id:
+            request.stop_reason = "end_token"
+        else:
+            request.output_ids.append(token)
+            request.text = self.tokenizer.decode(request.output_ids, skip_special_tokens=True)
+            for stop in request.stop_before:
+                if stop and stop in request.text:
+                    request.text = request.text[:request.text.index(stop)]
+                    request.stop_reason = "stop_before"
+                    break
+            else:
+                if len(request.output_ids) >= request.max_tokens:
+                    request.stop_reason = "length"
+
+        if request.stop_reason is None:
+            return False
+        request.done.set()
+        return True
+
+
+def _pad_left(tensor, length, dim=2):
+    """dim 축을 length 가 되도록 왼쪽에 0 을 채운다"""
+    pad = length - tensor.shape[dim]
+    if pad == 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = pad
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+def build_prompt_ids(tokenizer, messages):
+    """CLOVA 형식 messages 를 모델 입력 토큰으로 변환"""
+    if tokenizer.chat_template:
+        input_text = tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+    else:
+        # gpt2, ./sft_detox_model 처럼 채팅 템플릿이 없는 모델
+        lines = [f"{m['role']}: {m['content']}" for m in messages]
+        input_text = "\n".join(lines) + "\nassistant: "
+    return tokenizer(input_text)["input_ids"]
+
+
+def parse_request(payload, tokenizer):
+    """
+    CLOVA 형식 요청 body → GenerationRequest
+
+    Raises:
+        ValueError / KeyError / TypeError / AttributeError: messages 나 파라미터 형식이 잘못됐을 때
+    """
+    messages = payload["messages"]
+    if not isinstance(messages, list) or not messages:
+        raise ValueError("messages 는 비어 있지 않은 리스트여야 합니다")
+    for m in messages:
+        if not isinstance(m.get("role"), str) or not isinstance(m.get("content"), str):
+            raise ValueError("message 마다 문자열 role / content 가 필요합니다")
+    stop_before = payload.get("stopBefore", [])
+    if not isinstance(stop_before, list) or not all(isinstance(s, str) for s in stop_before):
+        raise ValueError("stopBefore 는 문자열 리스트여야 합니다")
+    return GenerationRequest(
+        build_prompt_ids(tokenizer, messages),
+        max_tokens=int(payload.get("maxTokens", 256)),
+        temperature=float(payload.get("temperature", 0.5)),
+        top_p=float(payload.get("topP", 0.8)),
+        top_k=int(payload.get("topK", 0)),
+        repeat_penalty=float(payload.get("repeatPenalty", 0.0)),
+        stop_before=stop_before,
+    )
+
+
+def make_handler(batcher):
+    """ContinuousBatcher 를 쓰는 HTTP 핸들러 클래스 생성"""
+
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if "/chat-completions/" not in self.path:
+                self._send(404, {"status": {"code": "40400", "message": "Not Found"}})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = parse_request(json.loads(self.rfile.read(length)), batcher.tokenizer)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # JSON 이 아니거나, JSON 이어도 messages / 파라미터 형식이 CLOVA 요청과 다를 때
+                self._send(400, {"status": {"code": "40000", "message": "Bad Request"}})
+                return
+
+            request = batcher.submit(request)
+            if request.stop_reason == "rejected":
+                self._send(400, {"status": {"code": "40000", "message": "maxTokens exceeds model context"}})
+                return
+            if request.stop_reason == "error":
+                self._send(500, {"status": {"code": "50000", "message": "Internal Server Error"}})
+                return
+
+            self._send(200, {
+                "status": {"code": "20000", "message": "OK"},
+                "result": {
+                    "message": {"role": "assistant", "content": request.text.strip()},
+                    "stopReason": request.stop_reason,
+                    "inputLength": len(request.input_ids),
+                    "outputLength": len(request.output_ids),
+                    "aiFilter": [],
+                    "usage": {
+                        "inputTokens": len(request.input_ids),
+                        "outputTokens": len(request.output_ids),
+                        "totalTokens": len(request.input_ids) + len(request.output_ids),
+                    },
+                },
+            })
+
+        def _send(self, code, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ChatCompletionsHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 chat-completions 서버")
+    parser.add_argument("--model", default="yanolja/EEVE-Korean-Instruct-10.8B-v1.0")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--load-mode", default="auto", choices=LOAD_MODES)
+    args = parser.parse_args()
+
+    print(f"🔥 모델 로딩: {args.model}")
+    tokenizer, model = load_model(args.model, mode=args.load_mode)
+
+    batcher = ContinuousBatcher(model, tokenizer, max_batch_size=args.max_batch_size)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher))
+
+    url = f"http://{args.host}:{args.port}/testapp/v1/chat-completions/HCX-003"
+    print(f"🚀 서버 시작: {url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n종료합니다.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+LoRA (Low-Rank Adaptation) 파인튜닝
+
+4_SFT_DPO_test.py 는 모든 파라미터를 AdamW 로 학습해서 optimizer 상태(exp_avg, exp_avg_sq)와
+gradient 까지 가중치의 약 4배 메모리가 필요했다. LoRA 는 원래 가중치를 고정하고
+대상 Linear 마다 작은 행렬 두 개(A: r x in, B: out x r)만 학습한다.
+
+    y = W x + (alpha / r) · B A x
+
+- apply_lora(): 대상 Linear / Conv1D 를 LoRALinear 로 감싸고 나머지 파라미터는 고정
+- save_adapter() / load_adapter(): LoRA 가중치만 (수 MB) safetensors 로 저장 / 불러오기
+- merge_lora(): B A 를 원래 가중치에 더해서 일반 모델로 되돌림 (추론 속도 / 저장 형식이 원본과 같음)
+
+사용 예:
+    apply_lora(model, r=8, alpha=16)
+    optimizer = torch.optim.AdamW(trainable_parameters(model), lr=1e-4)
+    ...
+    save_adapter(model, "./sft_detox_model_lora")
+    merge_lora(model).save_pretrained("./sft_detox_model")
+"""
+
+import json
+import math
+import os
+
+import torch
+import torch.nn as nn
+from safetensors.torch import load_file, save_file
+from transformers.pytorch_utils import Conv1D
+
+# GPT-2 (attn.c_attn, attn.c_proj) / Llama 계열 (q/k/v/o_proj) 의 attention 기본 대상
+# (GPT-2 는 MLP 출력도 mlp.c_proj 이므로 attention 만 고르도록 부모 모듈 이름까지 씀)
+DEFAULT_TARGETS = ("attn.c_attn", "attn.c_proj", "q_proj", "k_proj", "v_proj", "o_proj")
+ADAPTER_CONFIG = "adapter_config.json"
+ADAPTER_WEIGHTS = "adapter_model.safetensors"
+
+
+class LoRALinear(nn.Module):
+    """고정된 Linear / Conv1D 에 학습 가능한 저랭크 보정(B A)을 더함"""
+
+    def __init__(self, base, r=8, alpha=16, dropout=0.05):
+        """
+        Args:
+            base (nn.Linear | Conv1D): 원래 레이어 (가중치는 고정)
+            r (int): 랭크
+            alpha (float): 스케일 (실제 배율은 alpha / r)
+            dropout (float): LoRA 입력에 적용할 dropout
+        """
+        super().__init__()
+        self.base = base
+        # Conv1D 의 weight 는 [in, out], Linear 는 [out, in]
+        if isinstance(base, Conv1D):
+            in_features, out_features = base.weight.shape
+        else:
+            out_features, in_features = base.weight.shape
+        self.r = r
+        self.scaling = alpha / r
+
+        weight = base.weight
+        self.lora_A = nn.Parameter(torch.empty(r, in_features, dtype=weight.dtype, device=weight.device))
+        self.lora_B = nn.Parameter(torch.zeros(out_features, r, dtype=weight.dtype, device=weight.device))
+        # B 가 0 이므로 처음에는 원래 모델과 출력이 같음
+        nn.init.kaiming_uniform_(self.lora_A, a=math.sqrt(5))
+        self.dropout = nn.Dropout(dropout)
+
+    def forward(self, x):
+        delta = self.dropout(x) @ self.lora_A.t() @ self.lora_B.t()
+        return self.base(x) + delta * self.scaling
+
+    def merged(self):
+        """B A 를 더한 원래 타입의 레이어"""
+        delta = (self.lora_B @ self.lora_A) * self.scaling
+        with torch.no_grad():
+            if isinstance(self.base, Conv1D):
+                self.base.weight += delta.t().to(self.base.weight.dtype)
+            else:
+                self.base.weight += delta.to(self.base.weight.dtype)
+        return self.base
+
+    def extra_repr(self):
+        return f"r={self.r}, scaling={self.scaling}"
+
+
+def _is_target(name, target_modules):
+    """모듈 이름이 대상 이름 (마지막 부분 또는 "attn.c_proj" 처럼 점으로 이은 뒷부분) 으로 끝나는지"""
+    return any(name == t or name.endswith("." + t) for t in target_modules)
+
+
+def _replace(model, name, module):
+    parent_name, _, child_name = name.rpartition(".")
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child_name, module)
+
+
+def apply_lora(model, r=8, alpha=16, dropout=0.05, target_modules=DEFAULT_TARGETS):
+    """
+    모델 파라미터를 모두 고정하고 대상 레이어에 LoRA 추가
+
+    Args:
+        target_modules (tuple): 모듈 이름이 이 중 하나로 끝나면 대상
+            ("c_proj" 는 GPT-2 의 attn.c_proj / mlp.c_proj 모두, "attn.c_proj" 는 attention 것만)
+
+    Returns:
+        int: LoRA 를 붙인 레이어 수
+    """
+    # merge_lora() 가 되돌릴 수 있도록 고정하기 전의 학습 여부를 기록
+    model.lora_requires_grad = {name: p.requires_grad for name, p in model.named_parameters()}
+    for p in model.parameters():
+        p.requires_grad = False
+
+    names = [name for name, m in model.named_modules()
+             if isinstance(m, (nn.Linear, Conv1D)) and _is_target(name, target_modules)]
+    if not names:
+        raise ValueError(f"LoRA 대상 레이어가 없습니다: {target_modules}")
+
+    for name in names:
+        lora = LoRALinear(model.get_submodule(name), r=r, alpha=alpha, dropout=dropout)
+        # 새 모듈은 train 모드로 만들어지므로 모델의 train/eval 상태를 따라가게 함
+        _replace(model, name, lora.train(model.training))
+
+    model.lora_config = {"r": r, "alpha": alpha, "dropout": dropout, "target_modules": list(target_modules)}
+    return len(names)
+
+
+def trainable_parameters(model):
+    """optimizer 에 넘길 학습 대상 파라미터"""
+    return [p for p in model.parameters() if p.requires_grad]
+
+
+def count_parameters(model):
+    """
+    Returns:
+        tuple: (학습 파라미터 수, 전체 파라미터 수)
+    """
+    trainable = sum(p.numel() for p in trainable_parameters(model))
+    total = sum(p.numel() for p in model.parameters())
+    return trainable, total
+
+
+def save_adapter(model, path, base_model=None):
+    """
+    LoRA 가중치와 설정만 저장
+
+    Args:
+        base_model (str): 어댑터를 붙일 원본 모델 경로 (None 이면 model 을 로딩한 경로)
+    """
+    os.makedirs(path, exist_ok=True)
+    state = {name: p.detach().contiguous() for name, p in model.named_parameters() if "lora_" in name}
+    save_file(state, os.path.join(path, ADAPTER_WEIGHTS))
+
+    config = dict(model.lora_config, base_model=base_model or model.config._name_or_path)
+    with open(os.path.join(path, ADAPTER_CONFIG), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+    size_mb = sum(t.numel() * t.element_size() for t in state.values()) / 1024**2
+    print(f"✅ LoRA 어댑터 저장: {path} ({len(state)}개 텐서, {size_mb:.1f}MB)")
+
+
+def adapter_base_model(path):
+    """save_adapter() 로 저장한 어댑터를 붙여야 하는 원본 모델 경로"""
+    with open(os.path.join(path, ADAPTER_CONFIG), "r", encoding="utf-8") as f:
+        return json.load(f)["base_model"]
+
+
+def load_adapter(model, path, merge=False):
+    """
+    save_adapter() 로 저장한 LoRA 를 모델에 붙임
+
+    Args:
+        merge (bool): True 면 붙인 뒤 바로 원래 가중치에 합침 (추론용)
+
+    Raises:
+        ValueError: model 이 어댑터를 학습한 원본 모델이 아닐 때
+            (예: 이미 합쳐진 ./sft_detox_model 에 같은 어댑터를 한 번 더 더하는 경우)
+    """
+    with open(os.path.join(path, ADAPTER_CONFIG), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    loaded = model.config._name_or_path
+    if os.path.normpath(config["base_model"]) != os.path.normpath(loaded):
+        raise ValueError(f"어댑터 {path} 는 {config['base_model']} 용인데 {loaded} 에 붙이려고 합니다.")
+    apply_lora(model, r=config["r"], alpha=config["alpha"], dropout=config["dropout"],
+               target_modules=tuple(config["target_modules"]))
+
+    state = load_file(os.path.join(path, ADAPTER_WEIGHTS), device=str(model.device))
+    missing = [name for name, _ in model.named_parameters() if "lora_" in name and name not in state]
+    if missing:
+        raise ValueError(f"어댑터에 없는 LoRA 가중치가 있습니다: {missing[:3]}...")
+    model.load_state_dict(state, strict=False)
+    print(f"✅ LoRA 어댑터 로드: {path}")
+
+    return merge_lora(model) if merge else model
+
+
+def merge_lora(model):
+    """LoRALinear 를 B A 가 더해진 원래 레이어로 바꾸고 파라미터 학습 여부를 apply_lora() 이전으로 되돌림"""
+    names = [name for name, m in model.named_modules() if isinstance(m, LoRALinear)]
+    for name in names:
+        _replace(model, name, model.get_submodule(name).merged())
+    previous = getattr(model, "lora_requires_grad", {})
+    for name, p in model.named_parameters():
+        p.requires_grad = previous.get(name, p.requires_grad)
+    for attr in ("lora_config", "lora_requires_grad"):
+        if hasattr(model, attr):
+            delattr(model, attr)
+    return model
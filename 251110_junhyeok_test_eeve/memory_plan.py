@@ -0,0 +1,237 @@
+"""
+여러 모델을 한 프로세스에 올릴 때의 RAM 예산 계획
+
+6_llm_conversation.py 는 EEVE(모델 A)와 SFT GPT-2(모델 B)를 한 프로세스에 올리는데
+예전에는 device_map="auto" 가 배치를 조용히 정했다. 여기서는 로딩 전에
+
+1. 가중치 없이(meta 디바이스) 모델 구조만 만들어 로딩 모드별 상주 크기 / 로딩 중 최대 크기 추정
+2. 모델을 순서대로 올린다고 보고 예상 최대 RSS 계산
+3. 예산을 넘으면 (on_exceed="offload") 양자화하지 않는 가장 큰 모델부터
+   레이어 일부를 디스크로 오프로딩하도록 device_map 을 직접 만들고,
+   그래도 안 되거나 on_exceed="refuse" 면 로딩 전에 MemoryError
+
+를 한다. GPU 가 있으면 모델은 GPU 에 올라가므로 RAM 계획은 보고만 한다.
+
+사용 예:
+    plan = plan_memory([("A", "yanolja/EEVE-Korean-Instruct-10.8B-v1.0", "bf16"),
+                        ("B", "./sft_detox_model", "fp32")], budget_mb=24000)
+    print(plan.report())
+    tokenizer, model = load_model("./sft_detox_model", mode="fp32", **plan.load_kwargs("B"))
+"""
+
+import os
+
+import torch
+import torch.nn as nn
+from transformers import AutoConfig, AutoModelForCausalLM
+from transformers.pytorch_utils import Conv1D
+
+from perf_utils import available_ram_mb, current_rss_mb
+
+try:
+    from accelerate import infer_auto_device_map
+    ACCELERATE_AVAILABLE = True
+except ImportError:
+    print("⚠️ accelerate 가 설치되지 않아 디스크 오프로딩을 쓸 수 없습니다.")
+    print("설치 명령: pip install accelerate")
+    ACCELERATE_AVAILABLE = False
+
+# 모드별 (Linear 가중치, 나머지 파라미터) 의 파라미터당 byte 수
+# int4 는 0.5 byte + group(128) 별 bf16 scale
+BYTES_PER_PARAM = {
+    "fp16": (2, 2),
+    "bf16": (2, 2),
+    "fp32": (4, 4),
+    "int8-dynamic": (1, 4),
+    "int8-weight": (1, 2),
+    "int4-weight": (0.5 + 2 / 128, 2),
+}
+QUANTIZED_MODES = ("int8-dynamic", "int8-weight", "int4-weight")
+
+# KV 캐시 / 활성값 등 실행 중 추가로 쓰는 메모리 (상주 크기 대비 비율)
+RUNTIME_MARGIN = 0.1
+
+
+def _resolve_mode(mode):
+    if mode == "auto":
+        return "fp16" if torch.cuda.is_available() else "bf16"
+    return mode
+
+
+def _meta_model(model_name, dtype):
+    """가중치를 읽지 않고 구조만 가진 모델 (파라미터는 meta 텐서)"""
+    config = AutoConfig.from_pretrained(model_name)
+    with torch.device("meta"):
+        return AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+
+
+def estimate_model_mb(model_name, mode="auto"):
+    """
+    로딩 모드별 모델 메모리 추정
+
+    Returns:
+        dict: resident_mb (로딩 후 상주), load_peak_mb (로딩 중 최대), params, model (meta 모델)
+    """
+    mode = _resolve_mode(mode)
+    dtype = {"fp16": torch.float16, "fp32": torch.float32}.get(mode, torch.bfloat16)
+    model = _meta_model(model_name, dtype)
+
+    linear_ids, linear_numel = set(), 0
+    for module in model.modules():
+        if isinstance(module, (nn.Linear, Conv1D)):
+            # 임베딩과 공유(tie)된 lm_head 도 양자화할 때는 따로 복사되므로 여기서 셈
+            linear_ids.add(id(module.weight))
+            linear_numel += module.weight.numel()
+    embedding_ids = {id(p) for m in model.modules() if isinstance(m, nn.Embedding) for p in m.parameters()}
+
+    params = list(model.parameters())
+    other_numel = sum(p.numel() for p in params if id(p) not in linear_ids or id(p) in embedding_ids)
+    total_numel = sum(p.numel() for p in params)
+
+    linear_bytes, other_bytes = BYTES_PER_PARAM[mode]
+    if mode in QUANTIZED_MODES:
+        resident = linear_numel * linear_bytes + other_numel * other_bytes
+        # 양자화 모드는 bf16 으로 먼저 올린 뒤 레이어 단위로 바꿈
+        load_peak = max(total_numel * 2, resident)
+    else:
+        resident = load_peak = total_numel * linear_bytes
+
+    return {
+        "mode": mode,
+        "dtype": dtype,
+        "params": total_numel,
+        "resident_mb": resident / 1024**2,
+        "load_peak_mb": load_peak / 1024**2,
+        "model": model,
+    }
+
+
+class MemoryPlan:
+    """plan_memory() 결과. 모델별 배치와 from_pretrained 인자를 가지고 있음"""
+
+    def __init__(self, entries, budget_mb, base_mb):
+        self.entries = entries
+        self.budget_mb = budget_mb
+        self.base_mb = base_mb
+
+    @property
+    def expected_peak_mb(self):
+        return _expected_peak(self.entries, self.base_mb)
+
+    def load_kwargs(self, label):
+        """load_model / load_model_fast 에 넘길 추가 인자"""
+        entry = next(e for e in self.entries if e["label"] == label)
+        if entry["device_map"] is None:
+            return {}
+        return {"device_map": entry["device_map"], "offload_folder": entry["offload_folder"]}
+
+    def report(self):
+        lines = ["=" * 70, f"💾 메모리 계획 (예산 {self.budget_mb:.0f}MB, 현재 프로세스 {self.base_mb:.0f}MB)", "=" * 70]
+        for e in self.entries:
+            line = (f"[{e['label']}] {e['model_name']} ({e['mode']}, {e['params'] / 1e9:.2f}B) "
+                    f"RAM {e['ram_mb']:.0f}MB")
+            if e["disk_mb"]:
+                line += f" + 디스크 {e['disk_mb']:.0f}MB (레이어 {e['disk_modules']}개 오프로딩)"
+            lines.append(line)
+        lines.append(f"예상 최대 RSS: {self.expected_peak_mb:.0f}MB")
+        lines.append("=" * 70)
+        return "\n".join(lines)
+
+
+def _expected_peak(entries, base_mb):
+    """모델을 순서대로 올린다고 할 때의 최대 RSS"""
+    peak = loaded = base_mb
+    for e in entries:
+        peak = max(peak, loaded + e["load_peak_mb"])
+        loaded += e["ram_mb"] * (1 + RUNTIME_MARGIN)
+    return max(peak, loaded)
+
+
+def _offload(entry, ram_mb, offload_dir):
+    """ram_mb 안에 들어가는 레이어만 RAM 에 두고 나머지는 디스크로 보내는 device_map"""
+    model = entry["model"]
+    device_map = infer_auto_device_map(
+        model,
+        max_memory={"cpu": int(ram_mb * 1024**2)},
+        no_split_module_classes=getattr(model, "_no_split_modules", None),
+        dtype=entry["dtype"]
+    )
+    sizes = {name: p.numel() * p.element_size() / 1024**2 for name, p in model.named_parameters()}
+    on_disk = [name for name, device in device_map.items() if device == "disk"]
+    disk_mb = sum(size for name, size in sizes.items()
+                  if any(m == "" or name == m or name.startswith(m + ".") for m in on_disk))
+
+    entry.update({
+        "device_map": device_map,
+        "offload_folder": os.path.join(offload_dir, entry["label"]),
+        "disk_modules": len(on_disk),
+        "disk_mb": disk_mb,
+        "ram_mb": entry["resident_mb"] - disk_mb,
+        "load_peak_mb": entry["resident_mb"] - disk_mb,
+    })
+
+
+def plan_memory(models, budget_mb=None, offload_dir="./offload", on_exceed="offload"):
+    """
+    RAM 예산 안에서 모델들의 배치를 정한다
+
+    Args:
+        models (list): (label, model_name, mode) 목록. 이 순서대로 로딩한다고 가정
+        budget_mb (float): RAM 예산 (None 이면 현재 프로세스 + 사용 가능한 RAM 의 90%)
+        offload_dir (str): 디스크 오프로딩 디렉터리
+        on_exceed (str): 예산 초과 시 "offload" (디스크로 일부 내림) 또는 "refuse" (바로 에러)
+
+    Returns:
+        MemoryPlan
+
+    Raises:
+        MemoryError: 예산 안에 배치할 수 없을 때 (로딩 전에 실패)
+    """
+    if on_exceed not in ("offload", "refuse"):
+        raise ValueError(f"on_exceed 는 offload 또는 refuse 여야 합니다: {on_exceed}")
+
+    base_mb = current_rss_mb()
+    if budget_mb is None:
+        budget_mb = base_mb + available_ram_mb() * 0.9
+
+    entries = []
+    for label, model_name, mode in models:
+        estimate = estimate_model_mb(model_name, mode)
+        estimate.update({
+            "label": label,
+            "model_name": model_name,
+            "ram_mb": estimate["resident_mb"],
+            "disk_mb": 0.0,
+            "disk_modules": 0,
+            "device_map": None,
+            "offload_folder": None,
+        })
+        entries.append(estimate)
+
+    plan = MemoryPlan(entries, budget_mb, base_mb)
+    if torch.cuda.is_available() or plan.expected_peak_mb <= budget_mb:
+        return plan
+
+    over = plan.expected_peak_mb - budget_mb
+    if on_exceed == "refuse":
+        raise MemoryError(f"예상 최대 RSS {plan.expected_peak_mb:.0f}MB 가 예산 {budget_mb:.0f}MB 를 "
+                          f"{over:.0f}MB 초과합니다.\n{plan.report()}")
+
+    # 양자화 모드는 로딩 후에 레이어를 바꾸므로 오프로딩과 같이 쓸 수 없음
+    candidates = sorted([e for e in entries if e["mode"] not in QUANTIZED_MODES],
+                        key=lambda e: e["resident_mb"], reverse=True)
+    if not ACCELERATE_AVAILABLE:
+        candidates = []
+
+    for entry in candidates:
+        others = sum(e["ram_mb"] * (1 + RUNTIME_MARGIN) for e in entries if e is not entry)
+        ram_mb = (budget_mb - base_mb - others) / (1 + RUNTIME_MARGIN)
+        if ram_mb <= 0:
+            continue
+        _offload(entry, ram_mb, offload_dir)
+        if plan.expected_peak_mb <= budget_mb:
+            print(f"⚠️ 예산 초과 → [{entry['label']}] 레이어 {entry['disk_modules']}개를 디스크로 오프로딩")
+            return plan
+
+    raise MemoryError(f"디스크 오프로딩으로도 예산 {budget_mb:.0f}MB 안에 들어가지 않습니다. "
+                      f"예산을 늘리거나 int8-weight / int4-weight 모드를 쓰세요.\n{plan.report()}")
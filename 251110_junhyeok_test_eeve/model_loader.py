@@ -0,0 +1,253 @@
+"""
+로컬 CausalLM 공통 로딩 함수 (정밀도 / 양자화 모드 선택)
+
+모든 스크립트가 torch_dtype=torch.float16 + device_map="auto" 를 하드코딩하고 있었는데,
+CPU 에서는 fp16 이 느리거나 지원되지 않고, EEVE 10.8B 를 fp32 로 올리면 RAM 에
+들어가지 않는다. 여기서는 모드 이름 하나로 로딩 방식을 고른다.
+
+모드:
+    auto          GPU 가 있으면 fp16, 없으면 bf16
+    fp16 / bf16 / fp32
+    int8-dynamic  Linear 가중치 int8 + 활성값 동적 양자화 (torch 내장, CPU 전용)
+    int8-weight   가중치만 int8 (채널별 scale), 연산은 bf16
+    int4-weight   가중치만 int4 (group 별 scale, 2개씩 packing), 연산은 bf16
+
+양자화 모드는 bf16 으로 먼저 올린 뒤 Linear 를 하나씩 바꾸므로
+최대 메모리는 대략 bf16 모델 크기 수준이다.
+
+사용 예:
+    tokenizer, model = load_model("yanolja/EEVE-Korean-Instruct-10.8B-v1.0", mode="int8-weight")
+    print(model.load_report)
+
+    # 모드별 로딩 시간 / RSS / tokens/sec 비교
+    python model_loader.py --model gpt2 --modes fp32 bf16 int8-dynamic int8-weight int4-weight
+"""
+
+import argparse
+import gc
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers.pytorch_utils import Conv1D
+
+from perf_utils import current_rss_mb, measure_tokens_per_sec
+
+LOAD_MODES = ("auto", "fp16", "bf16", "fp32", "int8-dynamic", "int8-weight", "int4-weight")
+
+
+class WeightOnlyLinear(nn.Module):
+    """가중치만 int8/int4 로 저장하고 forward 때 복원해서 쓰는 Linear"""
+
+    def __init__(self, linear, bits=8, group_size=128):
+        """
+        Args:
+            linear (nn.Linear): 원본 Linear
+            bits (int): 8 또는 4
+            group_size (int): int4 에서 scale 을 공유하는 입력 채널 수
+        """
+        super().__init__()
+        if bits not in (4, 8):
+            raise ValueError(f"bits 는 4 또는 8 이어야 합니다: {bits}")
+
+        weight = linear.weight.detach().float()
+        self.out_features, self.in_features = weight.shape
+        self.bits = bits
+        self.compute_dtype = linear.weight.dtype
+
+        if bits == 8:
+            # 출력 채널별 대칭 양자화
+            scales = weight.abs().amax(dim=1, keepdim=True).clamp(min=1e-8) / 127
+            qweight = torch.round(weight / scales).clamp(-127, 127).to(torch.int8)
+        else:
+            # 입력 채널을 group_size 로 묶어 그룹별 scale, 0~15 값 두 개를 1 byte 에 저장
+            self.group_size = group_size
+            pad = (-self.in_features) % group_size
+            weight = F.pad(weight, (0, pad)).view(self.out_features, -1, group_size)
+            scales = weight.abs().amax(dim=2, keepdim=True).clamp(min=1e-8) / 7
+            q = (torch.round(weight / scales).clamp(-8, 7) + 8).to(torch.uint8)
+            q = q.view(self.out_features, -1)
+            qweight = q[:, 0::2] | (q[:, 1::2] << 4)
+
+        self.register_buffer("qweight", qweight)
+        self.register_buffer("scales", scales.to(self.compute_dtype))
+        if linear.bias is not None:
+            self.bias = nn.Parameter(linear.bias.detach().clone(), requires_grad=False)
+        else:
+            self.bias = None
+
+    def dequantize(self):
+        if self.bits == 8:
+            return self.qweight.to(self.compute_dtype) * self.scales
+
+        low = self.qweight & 0x0F
+        high = self.qweight >> 4
+        q = torch.stack([low, high], dim=-1).view(self.out_features, -1, self.group_size)
+        weight = (q.to(self.compute_dtype) - 8) * self.scales
+        return weight.view(self.out_features, -1)[:, :self.in_features]
+
+    def forward(self, x):
+        return F.linear(x, self.dequantize().to(x.dtype), self.bias)
+
+    def extra_repr(self):
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits={self.bits}"
+
+
+def _as_linear(module):
+    """GPT-2 의 Conv1D (weight 가 [in, out]) 를 같은 연산의 nn.Linear 로 변환"""
+    if isinstance(module, nn.Linear):
+        return module
+    linear = nn.Linear(module.weight.shape[0], module.weight.shape[1], bias=module.bias is not None,
+                       dtype=module.weight.dtype)
+    linear.weight = nn.Parameter(module.weight.detach().t().contiguous())
+    if module.bias is not None:
+        linear.bias = nn.Parameter(module.bias.detach())
+    return linear
+
+
+def _replace_linears(model, convert):
+    """모델 안의 Linear / Conv1D 를 하나씩 convert(module) 결과로 교체"""
+    names = [name for name, m in model.named_modules() if isinstance(m, (nn.Linear, Conv1D))]
+    for name in names:
+        parent_name, _, child_name = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        # 레이어 하나 바꿀 때마다 원본을 바로 놓아줘서 최대 메모리를 낮게 유지
+        setattr(parent, child_name, convert(_as_linear(getattr(parent, child_name))))
+    gc.collect()
+    return len(names)
+
+
+def quantize_dynamic_int8(model):
+    """Linear 를 torch 내장 동적 int8 Linear 로 교체 (나머지는 fp32)"""
+    import torch.ao.nn.quantized.dynamic as nnqd
+    from torch.ao.quantization import default_dynamic_qconfig
+
+    def convert(linear):
+        linear = linear.float()
+        linear.qconfig = default_dynamic_qconfig
+        return nnqd.Linear.from_float(linear)
+
+    # lm_head 가 임베딩과 가중치를 공유(tie)하는 경우가 있으므로 교체 전에 끊어둠
+    model.config.tie_word_embeddings = False
+    _replace_linears(model, convert)
+    # 동적 양자화 Linear 는 fp32 를 입출력하므로 임베딩/LayerNorm 등 나머지도 fp32 로
+    return model.float()
+
+
+def quantize_weight_only(model, bits=8, group_size=128):
+    """Linear 가중치를 int8/int4 로 압축 (연산 dtype 은 그대로)"""
+    model.config.tie_word_embeddings = False
+    _replace_linears(model, lambda linear: WeightOnlyLinear(linear, bits=bits, group_size=group_size))
+    return model
+
+
+def _model_size_mb(model):
+    tensors = list(model.parameters()) + list(model.buffers())
+    # 동적 양자화 Linear 의 가중치는 parameter/buffer 가 아니라 packed 형태로 들어 있음
+    # (LinearPackedParams 자체도 _packed_params 를 가지므로 weight() 가 있는 모듈만)
+    tensors += [m.weight() for m in model.modules()
+                if hasattr(m, "_packed_params") and callable(getattr(m, "weight", None))]
+    return sum(t.numel() * t.element_size() for t in tensors) / 1024**2
+
+
+def load_model(model_name, mode="auto", **kwargs):
+    """
+    토크나이저와 모델을 지정한 정밀도 모드로 로딩
+
+    Args:
+        model_name (str): HF 모델 이름 또는 로컬 경로
+        mode (str): LOAD_MODES 중 하나
+        **kwargs: from_pretrained 에 그대로 넘길 추가 인자
+
+    Returns:
+        tuple: (tokenizer, model). model.load_report 에 로딩 시간/메모리 기록
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"알 수 없는 로딩 모드: {mode} (가능: {', '.join(LOAD_MODES)})")
+
+    cuda = torch.cuda.is_available()
+    if mode == "auto":
+        mode = "fp16" if cuda else "bf16"
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, **{
+        k: kwargs[k] for k in ("local_files_only", "revision") if k in kwargs
+    })
+    tokenizer_sec = time.perf_counter() - start
+
+    dtype = {"fp16": torch.float16, "fp32": torch.float32}.get(mode, torch.bfloat16)
+    quantized = mode in ("int8-dynamic", "int8-weight", "int4-weight")
+    if quantized:
+        # 양자화 모드는 CPU 에서 레이어 단위로 변환
+        kwargs.setdefault("low_cpu_mem_usage", True)
+    elif cuda:
+        kwargs.setdefault("device_map", "auto")
+
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype, **kwargs)
+
+    if mode == "int8-dynamic":
+        model = quantize_dynamic_int8(model)
+    elif mode == "int8-weight":
+        model = quantize_weight_only(model, bits=8)
+    elif mode == "int4-weight":
+        model = quantize_weight_only(model, bits=4)
+    model.eval()
+
+    model.load_report = {
+        "mode": mode,
+        "load_sec": time.perf_counter() - start,
+        "tokenizer_sec": tokenizer_sec,
+        "weights_sec": time.perf_counter() - start - tokenizer_sec,
+        "rss_mb": current_rss_mb() - rss_before,
+        "weights_mb": _model_size_mb(model),
+    }
+    report = model.load_report
+    print(f"✅ 모델 로드 완료 [{mode}] {report['load_sec']:.1f}초, "
+          f"RSS +{report['rss_mb']:.0f}MB (가중치 {report['weights_mb']:.0f}MB)")
+    return tokenizer, model
+
+
+def _benchmark_one(model_name, mode, max_new_tokens):
+    tokenizer, model = load_model(model_name, mode=mode)
+    report = dict(model.load_report)
+    report["tokens_per_sec"] = measure_tokens_per_sec(model, tokenizer, max_new_tokens=max_new_tokens)
+    return report
+
+
+def benchmark_load_modes(model_name, modes, max_new_tokens=32):
+    """
+    모드마다 새 프로세스에서 로딩해서 로딩 시간 / RSS / 생성 속도 비교
+
+    Returns:
+        list[dict]: 모드별 측정 결과
+    """
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for mode in modes:
+        # 이전 모드의 메모리가 섞이지 않도록 모드마다 깨끗한 프로세스 사용
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results.append(pool.submit(_benchmark_one, model_name, mode, max_new_tokens).result())
+
+    print("\n" + "=" * 70)
+    print(f"{'모드':<14}{'로딩(초)':>10}{'RSS(MB)':>12}{'가중치(MB)':>12}{'tok/s':>10}")
+    print("=" * 70)
+    for r in results:
+        print(f"{r['mode']:<14}{r['load_sec']:>10.1f}{r['rss_mb']:>12.0f}"
+              f"{r['weights_mb']:>12.0f}{r['tokens_per_sec']:>10.2f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="로딩 모드별 성능 비교")
+    parser.add_argument("--model", default="yanolja/EEVE-Korean-Instruct-10.8B-v1.0")
+    parser.add_argument("--modes", nargs="+", default=["bf16", "int8-dynamic", "int8-weight", "int4-weight"])
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    benchmark_load_modes(args.model, args.modes, args.max_new_tokens)
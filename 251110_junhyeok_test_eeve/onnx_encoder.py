@@ -0,0 +1,253 @@
+"""
+ko-sroberta 임베딩 인코더의 ONNX Runtime (fp32 / int8 동적 양자화) CPU 백엔드
+
+GPU 가 없는 인덱싱 서버에서는 2_generate_vecotor_db.py / 3_use_vecotr.py 의 임베딩
+(PyTorch fp32 인코더) 이 가장 느린 구간이다. 여기서는
+
+1. export_onnx(): AutoModel 을 ONNX 로 내보냄 (입력 input_ids / attention_mask, 출력 last_hidden_state,
+   배치 / 길이는 동적 축)
+2. quantize_onnx(): onnxruntime 동적 양자화로 MatMul 가중치를 int8 로 (활성값은 실행 중 양자화)
+3. OnnxEncoder: ONNX Runtime 세션을 AutoModel 처럼 호출할 수 있게 감쌈
+   → corpus_encoder.iter_embeddings / mean_pooling 을 그대로 써서 토크나이징 / 길이 정렬 / pooling 이 같음
+
+embedding_service.Embedder(backend="onnx" / "onnx-int8") 또는 EMBEDDING_BACKEND 환경 변수로 고르고,
+처음 쓸 때 onnx_models/ 아래에 한 번 내보낸 뒤 재사용한다.
+
+사용 예:
+    python onnx_encoder.py export --model jhgan/ko-sroberta-multitask --int8
+
+    # torch / onnx / onnx-int8 의 문장/s 와 torch 대비 cosine 차이
+    python onnx_encoder.py benchmark --model jhgan/ko-sroberta-multitask --num-texts 512
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    print("⚠️ onnxruntime 이 설치되지 않아 ONNX 임베딩 백엔드를 쓸 수 없습니다.")
+    print("설치 명령: pip install onnx onnxruntime")
+    ONNX_AVAILABLE = False
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_DIR = "onnx_models"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def onnx_dir(model_name, root=ONNX_DIR):
+    """모델마다 내보낸 파일을 저장할 디렉터리 (jhgan/ko-sroberta-multitask → onnx_models/jhgan--ko-sroberta-multitask)"""
+    return os.path.join(root, model_name.strip("/").replace("/", "--"))
+
+
+def export_onnx(model_name, out_dir, opset=17):
+    """
+    AutoModel 을 ONNX 로 내보냄 (임시 파일에 쓴 뒤 이름 변경)
+
+    Returns:
+        str: 저장한 .onnx 경로
+    """
+    from transformers import AutoModel
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, FP32_FILE)
+    print(f"🔥 ONNX 로 내보내는 중: {model_name} → {path}")
+    start = time.perf_counter()
+    model = AutoModel.from_pretrained(model_name, torch_dtype=torch.float32).eval()
+    # pooling 은 corpus_encoder.mean_pooling 으로 밖에서 하므로 last_hidden_state 만 출력
+    model.config.return_dict = False
+
+    dummy = torch.ones(2, 8, dtype=torch.long)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (dummy, dummy), path + ".tmp",
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"},
+                          "last_hidden_state": {0: "batch", 1: "seq"}},
+            opset_version=opset,
+            dynamo=False,
+        )
+    os.replace(path + ".tmp", path)
+    print(f"✅ ONNX 저장: {path} ({os.path.getsize(path) / 1024**2:.0f}MB, {time.perf_counter() - start:.1f}초)")
+    return path
+
+
+def quantize_onnx(src, dst):
+    """
+    MatMul 가중치를 int8 로 동적 양자화 (파일 크기 약 1/4, CPU 에서 int8 GEMM 사용)
+
+    Returns:
+        str: dst
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    # 이름 변경 전 임시 파일도 .onnx 확장자여야 함 (onnx 저장 형식 판단)
+    tmp = dst + ".tmp.onnx"
+    quantize_dynamic(src, tmp, weight_type=QuantType.QInt8)
+    os.replace(tmp, dst)
+    print(f"✅ int8 양자화 저장: {dst} ({os.path.getsize(dst) / 1024**2:.0f}MB)")
+    return dst
+
+
+def ensure_onnx(model_name, int8=False, root=ONNX_DIR):
+    """내보낸 파일이 없으면 만들고 경로를 돌려줌"""
+    out_dir = onnx_dir(model_name, root)
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    if not os.path.exists(fp32_path):
+        export_onnx(model_name, out_dir)
+    if not int8:
+        return fp32_path
+    int8_path = os.path.join(out_dir, INT8_FILE)
+    if not os.path.exists(int8_path):
+        quantize_onnx(fp32_path, int8_path)
+    return int8_path
+
+
+class OnnxEncoder:
+    """ONNX Runtime 세션을 AutoModel 처럼 model(input_ids=..., attention_mask=...) 로 호출 (CPU 전용)"""
+
+    device = torch.device("cpu")
+
+    def __init__(self, path, num_threads=None):
+        """
+        Args:
+            path (str): .onnx 파일
+            num_threads (int): 연산 스레드 수 (None 이면 torch 와 같게)
+        """
+        if not ONNX_AVAILABLE:
+            raise ImportError("onnxruntime 이 필요합니다: pip install onnx onnxruntime")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def eval(self):
+        return self
+
+    def __call__(self, input_ids, attention_mask, **kwargs):
+        hidden = self.session.run(None, {"input_ids": input_ids.numpy().astype(np.int64),
+                                         "attention_mask": attention_mask.numpy().astype(np.int64)})[0]
+        # mean_pooling 은 model_output[0] 을 씀
+        return (torch.from_numpy(hidden),)
+
+
+def load_encoder(model_name, backend="torch", device_map="auto", onnx_path=None):
+    """
+    Args:
+        onnx_path (str): 이미 ensure_onnx() 로 만든 .onnx 파일 (None 이면 여기서 ensure_onnx)
+
+    Returns:
+        AutoModel 또는 OnnxEncoder (둘 다 iter_embeddings 에 그대로 넘길 수 있음)
+    """
+    if backend == "torch":
+        from transformers import AutoModel
+        return AutoModel.from_pretrained(model_name, device_map=device_map)
+    if backend not in BACKENDS:
+        raise ValueError(f"지원하지 않는 임베딩 백엔드입니다: {backend} (가능: {', '.join(BACKENDS)})")
+    return OnnxEncoder(onnx_path or ensure_onnx(model_name, int8=backend == "onnx-int8"))
+
+
+# ============================================================================
+# 벤치마크
+# ============================================================================
+SAMPLE_TEXTS = [
+    "요즘 스마트폰 게임은 전부 현질을 유도하는 쓰레기 시스템이라고 본다.",
+    "어떤 문제든 정부가 개입하면 상황이 더 나빠진다.",
+    "대형 IT 기업은 사용자 데이터를 항상 불법적으로 이용한다.",
+    "신입 개발자는 대기업을 가야 커리어가 열린다.",
+    "머신러닝 모델은 파라미터만 늘리면 성능이 무조건 좋아진다.",
+    "오늘 날씨가 맑아서 한강 공원에 산책하러 갔다.",
+    "이 식당은 가격에 비해 양이 많고 맛도 괜찮은 편이다.",
+    "회의 시간을 오후 3시로 옮겨도 괜찮을까요?",
+    "지하철 2호선이 고장으로 20분 정도 지연되고 있습니다.",
+    "아이들이 스마트폰을 너무 오래 보면 시력이 나빠질 수 있다.",
+    "새로 나온 노트북은 배터리가 하루 종일 간다고 한다.",
+    "주말마다 도서관에서 공부하는 습관을 들이고 있어요.",
+    "환율이 오르면 수입 물가도 따라서 오르는 경향이 있다.",
+    "운동을 꾸준히 하면 스트레스 해소에 도움이 된다.",
+    "그 영화는 결말이 너무 뻔해서 조금 실망스러웠다.",
+    "택배가 아직 도착하지 않아서 고객센터에 문의했습니다.",
+]
+
+
+def sample_texts(num_texts=512):
+    """고정된 한국어 문장으로 길이가 다양한 num_texts 개 문장 (encode_many 가 중복을 합치지 않도록 모두 다름)"""
+    texts = []
+    for i in range(num_texts):
+        # 1~4 문장을 이어 붙여 짧은 / 긴 입력이 섞이게 함
+        parts = [SAMPLE_TEXTS[(i + j * 7) % len(SAMPLE_TEXTS)] for j in range(i % 4 + 1)]
+        texts.append(" ".join(parts) + f" ({i})")
+    return texts
+
+
+def benchmark_backends(model_name, backends=BACKENDS, num_texts=512, batch_size=32, max_length=128, repeat=2):
+    """
+    같은 문장을 백엔드마다 임베딩해서 문장/s 와 torch 대비 cosine 차이 비교
+
+    Returns:
+        list[dict]: 백엔드별 결과
+    """
+    from embedding_service import Embedder
+
+    texts = sample_texts(num_texts)
+    reference = None
+    results = []
+    for backend in ("torch",) + tuple(b for b in backends if b != "torch"):
+        embedder = Embedder(model_name, cache_path=None, batch_size=batch_size, max_length=max_length,
+                            device_map="cpu", backend=backend)
+        embedder.encode_many(texts[:batch_size])  # 모델 로딩 / ONNX 내보내기 + 워밍업
+
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            vectors = embedder.encode_many(texts)
+            best = min(best, time.perf_counter() - start)
+
+        if reference is None:
+            reference = vectors
+        cosine = np.sum(vectors * reference, axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1))
+        result = {"backend": backend, "texts_per_sec": num_texts / best, "min_cosine": float(cosine.min()),
+                  "mean_cosine": float(cosine.mean())}
+        results.append(result)
+        if backend in backends:
+            print(f"✅ {backend:<9} {result['texts_per_sec']:7.1f} 문장/s  "
+                  f"torch 대비 cosine 평균 {result['mean_cosine']:.6f} / 최소 {result['min_cosine']:.6f}")
+        del embedder
+    return [r for r in results if r["backend"] in backends]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX Runtime 임베딩 백엔드")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="ONNX 로 내보내기 (+ int8 양자화)")
+    export.add_argument("--model", default="jhgan/ko-sroberta-multitask")
+    export.add_argument("--int8", action="store_true")
+
+    bench = sub.add_parser("benchmark", help="백엔드별 문장/s 와 cosine 차이")
+    bench.add_argument("--model", default="jhgan/ko-sroberta-multitask")
+    bench.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    bench.add_argument("--num-texts", type=int, default=512)
+    bench.add_argument("--batch-size", type=int, default=32)
+    bench.add_argument("--max-length", type=int, default=128)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        ensure_onnx(args.model, int8=args.int8)
+    else:
+        print(f"🔥 {args.model}: 문장 {args.num_texts}개, batch {args.batch_size}, 스레드 {torch.get_num_threads()}")
+        benchmark_backends(args.model, backends=args.backends, num_texts=args.num_texts,
+                           batch_size=args.batch_size, max_length=args.max_length)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+여러 프로세스로 나눠서 하는 코퍼스 임베딩 (CPU 코어 전체 사용)
+
+2_generate_vecotor_db.py 의 임베딩은 프로세스 하나에서 돈다. 배치 하나의 forward 를 여러
+스레드로 나누는 것(intra-op) 은 코어가 많아질수록 동기화 비용 때문에 잘 늘지 않는다.
+ParallelEmbedder 는 ddp_train.py 와 같은 방식으로
+
+- onnx 백엔드면 부모 프로세스에서 한 번만 ONNX 내보내기 / 양자화를 끝내 두고 (워커끼리 같은 파일을 쓰지 않음)
+- 워커 프로세스 N 개를 spawn 으로 띄우고 (OpenMP 가 초기화된 프로세스를 fork 하지 않음)
+- 워커마다 코어를 threads_per_worker 개씩 나눠 CPU affinity 로 고정 + torch 스레드 수를 명시한 뒤
+  인코더를 한 벌씩 올려 두고
+- encode_many() 가 받은 문장을 shard_size 개씩 연속 구간(shard) 으로 잘라 워커에 나눠 주면
+  워커는 shard 의 벡터를 .npy 파일로 쓰고
+- 모두 끝나면 shard 순서대로 이어 붙여서 (merge) 원래 문장 순서의 벡터를 돌려준다.
+
+Embedder 를 상속하므로 임베딩 캐시 (부모 프로세스에서만 씀) / VectorStore.upsert 는 그대로 쓴다.
+문장마다 임베딩은 배치 구성과 무관하므로 (같은 배치의 패딩은 attention mask 로 가림)
+단일 프로세스 빌드와 같은 인덱스가 나온다 (float 오차 수준).
+
+사용 예:
+    with ParallelEmbedder(num_workers=8, threads_per_worker=4) as embedder:
+        store.upsert(changed, embedder, chunk_size=embedder.chunk_size)
+
+    # 워커 수별 문장/s + 단일 프로세스 빌드와 비교
+    python parallel_encoder.py --workers 1,8,16,32 --num-texts 20000
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+import torch
+
+from ddp_train import _available_cores
+from embedding_service import BACKEND, CACHE_PATH, MAX_LENGTH, MODEL_NAME, Embedder
+from onnx_encoder import ensure_onnx
+
+# 워커 프로세스 안의 인코더 (_init_worker 에서 로딩)
+_worker_embedder = None
+
+
+def _init_worker(core_groups, model_name, batch_size, max_length, backend, onnx_path):
+    """코어 고정 + 스레드 수 명시 + 인코더 로딩"""
+    global _worker_embedder
+    cores, threads = core_groups.get()
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    # 캐시는 부모 프로세스만 씀 (워커는 캐시에 없는 문장만 받음)
+    _worker_embedder = Embedder(model_name, cache_path=None, batch_size=batch_size, max_length=max_length,
+                                device_map="cpu", backend=backend, onnx_path=onnx_path)
+    _worker_embedder._load()
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _embed_shard(path, texts):
+    """shard 하나를 임베딩해서 path (.npy) 에 저장 (임시 파일에 쓴 뒤 이름 변경)"""
+    vectors = _worker_embedder._embed(texts)
+    np.save(path + ".tmp.npy", vectors)
+    os.replace(path + ".tmp.npy", path)
+    return path
+
+
+class ParallelEmbedder(Embedder):
+    """워커 프로세스 N 개가 shard 를 나눠 임베딩하는 Embedder"""
+
+    def __init__(self, model_name=MODEL_NAME, cache_path=CACHE_PATH, batch_size=64, max_length=MAX_LENGTH,
+                 backend=BACKEND, num_workers=None, threads_per_worker=None, shard_size=1024, shard_dir=None):
+        """
+        Args:
+            num_workers (int): 워커 프로세스 수 (None 이면 코어 수 / threads_per_worker)
+            threads_per_worker (int): 워커마다 쓸 코어 (= torch 스레드) 수 (None 이면 코어를 워커 수로 나눔)
+            shard_size (int): 워커에 한 번에 넘길 문장 수 (작을수록 워커 간 부하가 고르게 나뉨)
+            shard_dir (str): shard 벡터 파일을 쓸 디렉터리 (None 이면 시스템 임시 디렉터리)
+        """
+        super().__init__(model_name, cache_path=cache_path, batch_size=batch_size, max_length=max_length,
+                         device_map="cpu", backend=backend)
+        cores = _available_cores()
+        if num_workers is None:
+            num_workers = max(1, len(cores) // (threads_per_worker or 1))
+        if threads_per_worker is None:
+            threads_per_worker = max(1, len(cores) // num_workers)
+        # 코어가 모자라면 고정하지 않고 스레드 수만 정함
+        if num_workers * threads_per_worker <= len(cores):
+            self.core_groups = [cores[i * threads_per_worker:(i + 1) * threads_per_worker] for i in range(num_workers)]
+        else:
+            self.core_groups = [None] * num_workers
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.shard_size = shard_size
+        self.shard_dir = shard_dir
+        self.pool = None
+
+    @property
+    def chunk_size(self):
+        """VectorStore.upsert 에 넘길 chunk 크기 (워커마다 shard 2개씩)"""
+        return self.num_workers * self.shard_size * 2
+
+    def _load(self):
+        print(f"🔥 임베딩 워커 {self.num_workers}개 시작 (워커당 스레드 {self.threads_per_worker}, "
+              f"{self.model_name}, {self.backend})")
+        start = time.perf_counter()
+        # 워커가 동시에 같은 .onnx 를 내보내지 않도록 여기서 한 번만 만들고 경로를 넘김
+        onnx_path = None
+        if self.backend in ("onnx", "onnx-int8"):
+            onnx_path = self.onnx_path or ensure_onnx(self.model_name, int8=self.backend == "onnx-int8")
+        ctx = multiprocessing.get_context("spawn")
+        core_groups = ctx.Queue()
+        for cores in self.core_groups:
+            core_groups.put((cores, self.threads_per_worker))
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(core_groups, self.model_name, self.batch_size, self.max_length, self.backend, onnx_path),
+        )
+        # 워커마다 작업을 하나씩 보내서 모델 로딩을 지금 끝내 둠
+        for f in [self.pool.submit(_worker_ready) for _ in range(self.num_workers)]:
+            f.result()
+        print(f"✅ 임베딩 워커 준비: {self.num_workers}개, {time.perf_counter() - start:.1f}초")
+
+    def _embed(self, texts):
+        if self.pool is None:
+            self._load()
+        work_dir = tempfile.mkdtemp(prefix="embed-shards-", dir=self.shard_dir)
+        try:
+            futures = [self.pool.submit(_embed_shard, os.path.join(work_dir, f"shard-{k:05d}.npy"),
+                                        texts[start:start + self.shard_size])
+                       for k, start in enumerate(range(0, len(texts), self.shard_size))]
+            # merge: shard 는 연속 구간이므로 shard 순서대로 이어 붙이면 원래 순서
+            return np.concatenate([np.load(f.result()) for f in futures])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# ============================================================================
+# 벤치마크
+# ============================================================================
+def _build_index(vectors):
+    index = faiss.IndexIDMap(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+    return index
+
+
+def benchmark_parallel(model_name=MODEL_NAME, workers=(1, 2, 4), num_texts=4096, batch_size=64,
+                       max_length=MAX_LENGTH, backend="torch", threads_per_worker=None, shard_size=256):
+    """
+    워커 수별 문장/s 를 재고, 단일 프로세스 (Embedder) 빌드 인덱스와 벡터 / 검색 결과 비교
+
+    Returns:
+        list[dict]: 워커 수별 결과
+    """
+    from onnx_encoder import sample_texts
+
+    texts = sample_texts(num_texts)
+    cores = len(_available_cores())
+
+    single = Embedder(model_name, cache_path=None, batch_size=batch_size, max_length=max_length,
+                      device_map="cpu", backend=backend)
+    torch.set_num_threads(cores)
+    single._embed(texts[:batch_size])  # 모델 로딩 + 워밍업
+    start = time.perf_counter()
+    reference = single._embed(texts)
+    single_sec = time.perf_counter() - start
+    print(f"✅ 단일 프로세스 (스레드 {cores}) {num_texts / single_sec:8.1f} 문장/s")
+    reference_index = _build_index(reference)
+    _, expected = reference_index.search(reference[:256], 5)
+    del single
+
+    results = []
+    for n in workers:
+        threads = threads_per_worker or max(1, cores // n)
+        with ParallelEmbedder(model_name, cache_path=None, batch_size=batch_size, max_length=max_length,
+                              backend=backend, num_workers=n, threads_per_worker=threads,
+                              shard_size=shard_size) as embedder:
+            embedder._embed(texts[:n * batch_size])  # 모델 로딩 + 워밍업
+            start = time.perf_counter()
+            vectors = embedder._embed(texts)
+            sec = time.perf_counter() - start
+
+        # 병합한 벡터로 만든 인덱스가 단일 프로세스 인덱스와 같은지
+        index = _build_index(vectors)
+        max_diff = float(np.abs(index.index.reconstruct_n(0, index.ntotal) - reference).max())
+        _, found = index.search(reference[:256], 5)
+        same = float((found == expected).all(axis=1).mean())
+        result = {"workers": n, "threads_per_worker": threads, "texts_per_sec": num_texts / sec,
+                  "speedup": single_sec / sec, "max_diff": max_diff, "same_search": same}
+        results.append(result)
+        print(f"✅ 워커 {n:>2} x 스레드 {threads:<2} {result['texts_per_sec']:8.1f} 문장/s  "
+              f"(단일 대비 x{result['speedup']:.2f}, 벡터 최대 오차 {max_diff:.1e}, "
+              f"검색 결과 일치 {same * 100:.1f}%)")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="멀티 프로세스 코퍼스 임베딩 벤치마크")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--workers", default="1,2,4", help="쉼표로 구분한 워커 수 (예: 1,8,16,32)")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="없으면 코어 수 / 워커 수")
+    parser.add_argument("--num-texts", type=int, default=4096)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    parser.add_argument("--shard-size", type=int, default=256)
+    parser.add_argument("--backend", default="torch", choices=("torch", "onnx", "onnx-int8"))
+    args = parser.parse_args()
+
+    benchmark_parallel(args.model, workers=[int(x) for x in args.workers.split(",")], num_texts=args.num_texts,
+                       batch_size=args.batch_size, max_length=args.max_length, backend=args.backend,
+                       threads_per_worker=args.threads_per_worker, shard_size=args.shard_size)
@@ -0,0 +1,110 @@
+"""
+메모리 / 속도 측정용 공통 함수
+"""
+
+import os
+import resource
+import sys
+import threading
+import time
+
+import torch
+
+
+def current_rss_mb():
+    """현재 프로세스의 상주 메모리(RSS, MB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError):
+        # /proc 이 없는 환경(macOS 등)에서는 최대 RSS 로 대신함
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """프로세스 시작 이후 최대 RSS (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # 리눅스는 KB, macOS 는 byte 단위
+    if sys.platform == "darwin":
+        return peak / 1024**2
+    return peak / 1024
+
+
+def available_ram_mb():
+    """지금 새로 할당할 수 있는 RAM (MB, /proc/meminfo 의 MemAvailable)"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    # /proc 이 없는 환경에서는 전체 물리 메모리로 대신함
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**2
+
+
+class RssMonitor:
+    """백그라운드 스레드로 RSS 를 주기적으로 재서 구간 안의 최대값을 기록"""
+
+    def __init__(self, interval=0.2):
+        """
+        Args:
+            interval (float): 측정 간격(초)
+        """
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def start(self):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        return self.peak_mb
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def measure_tokens_per_sec(model, tokenizer, prompt="안녕하세요! 간단히 자기소개를 해주세요.",
+                           max_new_tokens=32):
+    """
+    greedy 로 max_new_tokens 개를 끝까지 생성해서 생성 속도 측정
+
+    Returns:
+        float: 초당 생성 토큰 수
+    """
+    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+    start = time.perf_counter()
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            min_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=pad_token_id
+        )
+    elapsed = time.perf_counter() - start
+
+    new_tokens = outputs.shape[1] - inputs["input_ids"].shape[1]
+    return new_tokens / elapsed
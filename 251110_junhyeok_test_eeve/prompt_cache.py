@@ -0,0 +1,184 @@
+"""
+시스템 프롬프트 토큰 / prefill 캐시
+
+chat(), generate_response_a, 1_test_eeve_model.py 는 매번 같은 시스템 프롬프트
+("당신은 친절한 AI 어시스턴트입니다." 등)에 대해 apply_chat_template 과
+토크나이징을 처음부터 다시 한다. 여기서는 시스템 프롬프트마다
+
+    head: 채팅 템플릿에서 첫 사용자 발화 직전까지 (시스템 프롬프트 + 사용자 헤더)
+    tail: 사용자 발화 뒤에 붙는 부분 (턴 종료 + assistant 생성 프롬프트)
+
+를 한 번만 계산해 두고, 매 턴에는 "새 사용자 발화 + tail" 만 토크나이징해서 붙인다.
+모델을 주면 head 에 대한 KV 캐시(prefill 결과)도 한 번만 계산해서 복사해 준다.
+
+head 와 나머지를 따로 토크나이징한 결과가 한 번에 토크나이징한 결과와 다르면
+(토크나이저가 경계에서 토큰을 합치는 경우) 그 시스템 프롬프트는 캐시하지 않고
+항상 전체를 토크나이징한다.
+"""
+
+import copy
+
+import torch
+from transformers import DynamicCache
+
+_PLACEHOLDER = "\u0000USER\u0000"
+_PROBE = "안녕하세요. 토크나이저 경계 확인용 문장입니다."
+
+
+class PromptCache:
+    """시스템 프롬프트별 head 토큰 / prefill KV 캐시"""
+
+    def __init__(self, tokenizer, model=None):
+        """
+        Args:
+            tokenizer: 채팅 템플릿을 가진 토크나이저
+            model: prefill() 을 쓸 때 필요한 CausalLM 모델
+        """
+        self.tokenizer = tokenizer
+        self.model = model
+        self.entries = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.prefill_hits = 0
+        self.prefill_misses = 0
+        self.saved_prefill_tokens = 0
+
+    def _render(self, messages):
+        return self.tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True
+        )
+
+    def _tokenize_full(self, messages):
+        return self.tokenizer(self._render(messages), return_tensors="pt")["input_ids"][0]
+
+    def _tokenize_rest(self, text):
+        return self.tokenizer(text, add_special_tokens=False, return_tensors="pt")["input_ids"][0]
+
+    def _entry(self, system_prompt):
+        """시스템 프롬프트의 head/tail 을 찾아 캐시 (처음 한 번만 템플릿 렌더링)"""
+        entry = self.entries.get(system_prompt)
+        if entry is not None:
+            return entry
+
+        text = self._render([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": _PLACEHOLDER}
+        ])
+        head_text, _, tail_text = text.partition(_PLACEHOLDER)
+        head_ids = self.tokenizer(head_text, return_tensors="pt")["input_ids"][0]
+
+        # 따로 토크나이징해도 결과가 같은지 한 번 확인
+        joint = self._tokenize_full([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": _PROBE}
+        ])
+        split = torch.cat([head_ids, self._tokenize_rest(_PROBE + tail_text)])
+
+        entry = {
+            "head_text": head_text,
+            "head_ids": head_ids,
+            "tail_text": tail_text,
+            "safe": torch.equal(joint, split),
+            "past": None,
+        }
+        self.entries[system_prompt] = entry
+        return entry
+
+    def _count(self, cached, entry):
+        if cached:
+            self.hits += 1
+            self.saved_tokens += len(entry["head_ids"])
+        else:
+            self.misses += 1
+
+    def head_ids(self, system_prompt):
+        """시스템 프롬프트 head 토큰 (캐시할 수 없는 경우 None)"""
+        entry = self._entry(system_prompt)
+        return entry["head_ids"] if entry["safe"] else None
+
+    def encode(self, system_prompt, user_input):
+        """
+        [system, user] 한 턴짜리 입력 토큰 생성
+
+        Returns:
+            torch.LongTensor: 1차원 input_ids
+        """
+        cached = system_prompt in self.entries
+        entry = self._entry(system_prompt)
+        if not entry["safe"]:
+            self.misses += 1
+            return self._tokenize_full([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input}
+            ])
+
+        self._count(cached, entry)
+        return torch.cat([entry["head_ids"], self._tokenize_rest(user_input + entry["tail_text"])])
+
+    def encode_messages(self, messages):
+        """
+        system 으로 시작하는 여러 턴짜리 messages 입력 토큰 생성
+        (템플릿은 렌더링하지만 시스템 프롬프트 부분은 다시 토크나이징하지 않음)
+        """
+        system_prompt = messages[0]["content"]
+        if len(messages) == 2:
+            return self.encode(system_prompt, messages[1]["content"])
+
+        cached = system_prompt in self.entries
+        entry = self._entry(system_prompt)
+        text = self._render(messages)
+        if not entry["safe"] or not text.startswith(entry["head_text"]):
+            self.misses += 1
+            return self.tokenizer(text, return_tensors="pt")["input_ids"][0]
+
+        self._count(cached, entry)
+        return torch.cat([entry["head_ids"], self._tokenize_rest(text[len(entry["head_text"]):])])
+
+    def prefill(self, system_prompt):
+        """
+        시스템 프롬프트 head 까지 계산된 KV 캐시의 복사본
+
+        generate(past_key_values=...) 에 넘기면 head 부분은 다시 계산하지 않는다.
+        generate 가 캐시를 제자리에서 늘리므로 매번 복사본을 돌려준다.
+        """
+        if self.model is None:
+            raise ValueError("prefill() 을 쓰려면 PromptCache(tokenizer, model) 로 생성하세요.")
+
+        entry = self._entry(system_prompt)
+        if entry["past"] is None:
+            self.prefill_misses += 1
+            cache = DynamicCache()
+            with torch.no_grad():
+                self.model(
+                    input_ids=entry["head_ids"].unsqueeze(0).to(self.model.device),
+                    past_key_values=cache,
+                    use_cache=True
+                )
+            entry["past"] = cache
+        else:
+            self.prefill_hits += 1
+            self.saved_prefill_tokens += len(entry["head_ids"])
+        return copy.deepcopy(entry["past"])
+
+    def stats(self):
+        """캐시 적중 / 절약량 통계"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "saved_tokens": self.saved_tokens,
+            "prefill_hits": self.prefill_hits,
+            "prefill_misses": self.prefill_misses,
+            "saved_prefill_tokens": self.saved_prefill_tokens,
+            "system_prompts": len(self.entries),
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"📦 프롬프트 캐시: 토큰 hit {s['hits']} / miss {s['misses']} "
+                f"(절약 {s['saved_tokens']} 토큰), "
+                f"prefill hit {s['prefill_hits']} / miss {s['prefill_misses']} "
+                f"(절약 {s['saved_prefill_tokens']} 토큰)")
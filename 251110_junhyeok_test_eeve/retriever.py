@@ -0,0 +1,199 @@
+"""
+FAISS RAG 검색 (질의 여러 개를 한 번에)
+
+3_use_vecotr.py 의 retrieve(query) 는 질의마다 임베딩 한 번 + index.search 한 번을 했다.
+평가처럼 질문이 수천 개면 forward / search 호출 오버헤드가 질의 수만큼 쌓인다.
+Retriever.retrieve_many() 는 질의를 chunk_size 개씩 묶어
+
+1. embedder.encode_many() 로 한 번에 임베딩 (길이 정렬 배치)
+2. (chunk_size, dim) 행렬로 index.search 한 번 (faiss 가 질의를 스레드로 나눠 처리)
+
+하고 질의마다 (문장, 거리) top_k 개를 돌려준다.
+
+질의 임베딩은 manifest 에 기록된 DB 의 임베딩 설정 (모델 / max_length / backend) 과 같아야 한다.
+embedder 를 넘기지 않으면 그 설정으로 만들고, 다른 설정의 embedder 를 넘기면 ValueError
+(예: onnx-int8 로 만든 DB 를 torch 질의 벡터로 검색하지 않음).
+
+사용 예:
+    retriever = Retriever()
+    for hits in retriever.retrieve_many(["질문1", "질문2"], top_k=3):
+        print(hits)   # [(문장, L2 거리), ...]
+
+    # 질문 파일 → 프롬프트 JSONL (LLM 없이)
+    python retriever.py prompts --questions questions.txt --out rag_prompts.jsonl
+
+    # 질의 하나씩 vs 묶어서 질의/s 비교
+    python retriever.py benchmark --num-queries 1000
+"""
+
+import argparse
+import json
+import time
+
+from ann_index import open_index, set_search_params
+from embedding_service import get_embedder
+from vector_store import DB_PREFIX, TextStore, generation_paths, read_embedder_info
+
+
+class Retriever:
+    """mmap 으로 연 FAISS 인덱스 + 문장 파일 + 임베딩으로 질의 검색"""
+
+    def __init__(self, prefix=DB_PREFIX, embedder=None, nprobe=16, ef_search=64):
+        """
+        Args:
+            prefix (str): 2_generate_vecotor_db.py 가 만든 Vector DB ({prefix}.current 가 가리키는 세대를 엶)
+            embedder: encode_many() / info() 가 있는 임베딩
+                (None 이면 manifest 의 임베딩 설정으로 embedding_service.get_embedder())
+            nprobe / ef_search: 근사 인덱스(ivf-*, hnsw) 의 질의 설정 (flat 이면 무시)
+
+        Raises:
+            ValueError: embedder 설정이 DB 를 만든 임베딩 설정과 다를 때
+        """
+        # .current 를 한 번만 읽어서 인덱스 / 문장 / manifest 를 모두 같은 세대에서 엶
+        paths = generation_paths(prefix)
+        self.index = open_index(paths["index"])
+        self.texts = TextStore(paths)
+        info = read_embedder_info(paths["manifest.jsonl"])
+        if embedder is None:
+            embedder = get_embedder(model_name=info["model"], max_length=info["max_length"],
+                                    backend=info["backend"]) if info else get_embedder()
+        elif info is not None and embedder.info() != info:
+            raise ValueError(f"Vector DB 는 {info} 로 임베딩했는데 질의를 {embedder.info()} 로 임베딩하려고 합니다.")
+        self.embedder = embedder
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+
+    def retrieve_many(self, queries, top_k=3, chunk_size=1024):
+        """
+        Args:
+            queries (list[str]): 질의들
+            top_k (int): 질의마다 가져올 문장 수
+            chunk_size (int): 한 번에 임베딩 / 검색할 질의 수
+
+        Returns:
+            list[list[tuple]]: 질의마다 [(문장, L2 거리), ...] (가까운 순, 문서 수가 top_k 보다 적으면 짧음)
+        """
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            vectors = self.embedder.encode_many(queries[start:start + chunk_size])
+            distances, indices = self.index.search(vectors, top_k)
+            for row_distances, row_ids in zip(distances.tolist(), indices.tolist()):
+                # 빈 자리는 -1
+                results.append([(self.texts[i], d) for i, d in zip(row_ids, row_distances) if i != -1])
+        return results
+
+    def retrieve(self, query, top_k=3):
+        """질의 하나 → [(문장, L2 거리), ...]"""
+        return self.retrieve_many([query], top_k)[0]
+
+
+def build_rag_prompt(query, retrieved_texts):
+    """검색한 문장을 참고 정보로 넣은 프롬프트"""
+    context = "\n".join([f"- {t}" for t in retrieved_texts])
+    return f"다음 정보를 참고하여 질문에 답하세요:\n{context}\n\n질문: {query}\n답변:"
+
+
+def build_prompts(retriever, questions, top_k=3, chunk_size=1024):
+    """
+    질문들을 chunk_size 개씩 retrieve_many 로 검색해서 프롬프트를 만듦 (질문 파일 전체를 메모리에 올리지 않음)
+
+    Args:
+        questions (iterable[str]): 질문 (리스트 또는 corpus_encoder.iter_texts 같은 제너레이터)
+
+    Yields:
+        dict: {"question", "contexts", "distances", "prompt"}
+    """
+    chunk = []
+    for question in questions:
+        chunk.append(question)
+        if len(chunk) == chunk_size:
+            yield from _prompt_records(retriever, chunk, top_k)
+            chunk = []
+    if chunk:
+        yield from _prompt_records(retriever, chunk, top_k)
+
+
+def _prompt_records(retriever, questions, top_k):
+    for question, hits in zip(questions, retriever.retrieve_many(questions, top_k, chunk_size=len(questions))):
+        contexts = [text for text, _ in hits]
+        yield {"question": question, "contexts": contexts, "distances": [d for _, d in hits],
+               "prompt": build_rag_prompt(question, contexts)}
+
+
+# ============================================================================
+# 벤치마크
+# ============================================================================
+def benchmark_retrieval(retriever, queries, top_k=3, chunk_sizes=(64, 1024)):
+    """
+    질의를 하나씩 retrieve() 하는 경우와 retrieve_many() 로 묶는 경우의 질의/s 비교
+
+    Returns:
+        dict: {"loop": 질의/s, chunk_size: 질의/s, ...}
+    """
+    results = {}
+    retriever.retrieve_many(queries[:8], top_k)  # 모델 로딩 + 워밍업
+
+    start = time.perf_counter()
+    expected = [retriever.retrieve(q, top_k) for q in queries]
+    results["loop"] = len(queries) / (time.perf_counter() - start)
+    print(f"✅ 질의 하나씩       {results['loop']:8.1f} 질의/s")
+
+    for chunk_size in chunk_sizes:
+        start = time.perf_counter()
+        hits = retriever.retrieve_many(queries, top_k, chunk_size=chunk_size)
+        results[chunk_size] = len(queries) / (time.perf_counter() - start)
+        # 배치 안 패딩 때문에 거리 소수점 끝자리는 다를 수 있으므로 문장만 비교
+        same = sum([t for t, _ in a] == [t for t, _ in b] for a, b in zip(hits, expected)) / len(queries)
+        print(f"✅ 묶어서 (chunk {chunk_size:<5}) {results[chunk_size]:8.1f} 질의/s  "
+              f"(x{results[chunk_size] / results['loop']:.1f}, 결과 일치 {same * 100:.1f}%)")
+    return results
+
+
+def main():
+    from corpus_encoder import iter_texts
+    from embedding_service import BACKEND, MAX_LENGTH, MODEL_NAME, Embedder
+
+    parser = argparse.ArgumentParser(description="FAISS RAG 여러 질의 검색")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    prompts = sub.add_parser("prompts", help="질문 파일 → 프롬프트 JSONL")
+    prompts.add_argument("--questions", required=True, help=".txt (한 줄에 하나) / .jsonl / .json")
+    prompts.add_argument("--text-key", default="question", help=".jsonl / .json 원소가 dict 일 때 질문 필드")
+    prompts.add_argument("--out", default="rag_prompts.jsonl")
+    prompts.add_argument("--top-k", type=int, default=3)
+
+    bench = sub.add_parser("benchmark", help="질의 하나씩 vs 묶어서 질의/s")
+    bench.add_argument("--questions", default=None, help="없으면 onnx_encoder 의 고정 한국어 문장")
+    bench.add_argument("--text-key", default="question")
+    bench.add_argument("--num-queries", type=int, default=1000)
+    bench.add_argument("--top-k", type=int, default=3)
+
+    for p in (prompts, bench):
+        p.add_argument("--db", default=DB_PREFIX, help="Vector DB 파일 이름 앞부분 ({db}.current)")
+    args = parser.parse_args()
+
+    if args.command == "prompts":
+        retriever = Retriever(args.db)
+        count = 0
+        with open(args.out, "w", encoding="utf-8") as f:
+            for record in build_prompts(retriever, iter_texts(args.questions, args.text_key), args.top_k):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        print(f"✅ 프롬프트 {count}개 저장: {args.out}")
+        return
+
+    if args.questions:
+        queries = list(iter_texts(args.questions, args.text_key))[:args.num_queries]
+    else:
+        from onnx_encoder import sample_texts
+        queries = sample_texts(args.num_queries)
+    # 같은 질의를 여러 번 보내므로 임베딩 캐시를 쓰지 않음 (캐시 적중이 아니라 임베딩 + 검색 시간을 잼)
+    info = read_embedder_info(generation_paths(args.db)["manifest.jsonl"]) or \
+        {"model": MODEL_NAME, "max_length": MAX_LENGTH, "backend": BACKEND}
+    embedder = Embedder(info["model"], cache_path=None, max_length=info["max_length"], backend=info["backend"])
+    retriever = Retriever(args.db, embedder=embedder)
+    print(f"🔥 질의 {len(queries)}개, top_k {args.top_k}, 문서 {len(retriever.texts)}개")
+    benchmark_retrieval(retriever, queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+SFT 학습용 데이터 파이프라인 (동적 패딩 + 길이 버킷 배치)
+
+4_SFT_DPO_test.py 는 모든 예제를 max_length=32 로 패딩하고 batch_size=1 로 학습했다.
+예제가 많아지면 패딩 토큰 계산과 step 당 오버헤드가 대부분을 차지하므로
+
+- tokenize_sft_example(): "입력 + 출력 + eos" 를 한 시퀀스로 만들고 입력 부분은 loss 에서 제외
+- SFTCollator: 배치 안에서 가장 긴 시퀀스 길이까지만 패딩 (패딩 위치는 loss 제외)
+- LengthBucketSampler: 길이가 비슷한 예제끼리 배치로 묶어 패딩을 최소화
+- ShardedBatchSampler: 배치를 DDP rank 별로 나눔 (ddp_train.py)
+
+를 제공한다. DataLoader 는 num_workers=0 (메인 프로세스) 으로 써서
+커널 5.4 환경의 멀티스레드 segfault 를 피한다.
+"""
+
+import random
+
+import torch
+from torch.utils.data import Sampler
+
+IGNORE_INDEX = -100
+
+
+def tokenize_sft_example(tokenizer, example, max_length=128):
+    """
+    {"input", "output"} 예제를 causal LM 학습용 토큰으로 변환
+
+    Returns:
+        dict: input_ids, labels (입력 부분은 IGNORE_INDEX)
+    """
+    prompt_ids = tokenizer(example["input"], add_special_tokens=False)["input_ids"]
+    output_ids = tokenizer(example["output"], add_special_tokens=False)["input_ids"]
+    output_ids = output_ids + [tokenizer.eos_token_id]
+
+    input_ids = (prompt_ids + output_ids)[:max_length]
+    labels = ([IGNORE_INDEX] * len(prompt_ids) + output_ids)[:max_length]
+    return {"input_ids": input_ids, "labels": labels}
+
+
+class SFTCollator:
+    """배치 안의 최대 길이까지만 오른쪽 패딩하는 collate_fn"""
+
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, examples):
+        max_len = max(len(e["input_ids"]) for e in examples)
+
+        input_ids, attention_mask, labels = [], [], []
+        for e in examples:
+            pad = max_len - len(e["input_ids"])
+            input_ids.append(e["input_ids"] + [self.pad_token_id] * pad)
+            attention_mask.append([1] * len(e["input_ids"]) + [0] * pad)
+            labels.append(e["labels"] + [IGNORE_INDEX] * pad)
+
+        self.real_tokens += sum(len(e["input_ids"]) for e in examples)
+        self.padded_tokens += max_len * len(examples)
+        return {
+            "input_ids": torch.tensor(input_ids),
+            "attention_mask": torch.tensor(attention_mask),
+            "labels": torch.tensor(labels),
+        }
+
+    def padding_ratio(self):
+        """지금까지 만든 배치에서 패딩 토큰이 차지한 비율"""
+        if not self.padded_tokens:
+            return 0.0
+        return 1 - self.real_tokens / self.padded_tokens
+
+
+class LengthBucketSampler(Sampler):
+    """
+    길이가 비슷한 예제끼리 묶은 배치의 인덱스를 내보내는 batch sampler
+
+    전체를 섞은 뒤 batch_size * bucket_multiplier 개씩 잘라 그 안에서 길이순으로 정렬하고
+    배치로 나눈 다음, 배치 순서를 다시 섞는다. (완전 정렬보다 에폭마다 구성이 바뀜)
+    """
+
+    def __init__(self, lengths, batch_size, bucket_multiplier=50, shuffle=True, seed=42):
+        """
+        Args:
+            lengths (list[int]): 예제별 토큰 길이
+            batch_size (int): 배치 크기
+            bucket_multiplier (int): 버킷 크기 = batch_size * bucket_multiplier
+            shuffle (bool): 에폭마다 섞을지 여부
+            seed (int): 셔플 시드
+        """
+        self.lengths = lengths
+        self.batch_size = batch_size
+        self.bucket_size = batch_size * bucket_multiplier
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.start_batch = 0
+
+    def set_epoch(self, epoch, start_batch=0):
+        """
+        Args:
+            start_batch (int): 체크포인트에서 재개할 때 이 epoch 에서 건너뛸 앞쪽 배치 수
+        """
+        self.epoch = epoch
+        self.start_batch = start_batch
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        indices = list(range(len(self.lengths)))
+        if self.shuffle:
+            rng.shuffle(indices)
+
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = sorted(indices[start:start + self.bucket_size], key=lambda i: self.lengths[i])
+            batches += [bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size)]
+
+        if self.shuffle:
+            rng.shuffle(batches)
+        return iter(batches[self.start_batch:])
+
+    def __len__(self):
+        # step 번호가 재개 전과 이어지도록 건너뛴 배치도 포함한 epoch 전체 배치 수
+        # 버킷마다 마지막 배치가 덜 찰 수 있으므로 버킷 단위로 셈
+        n = len(self.lengths)
+        return sum(-(-min(self.bucket_size, n - start) // self.batch_size)
+                   for start in range(0, n, self.bucket_size))
+
+
+class ShardedBatchSampler(Sampler):
+    """
+    분산 학습용: 모든 rank 가 같은 시드로 만든 배치 목록을 rank 별로 나눠 가짐
+
+    DDP 는 rank 마다 step 수가 같아야 하므로 world_size 로 나누어떨어지지 않는
+    마지막 배치들은 버린다.
+    """
+
+    def __init__(self, batch_sampler, rank, world_size):
+        self.batch_sampler = batch_sampler
+        self.rank = rank
+        self.world_size = world_size
+
+    def set_epoch(self, epoch):
+        self.batch_sampler.set_epoch(epoch)
+
+    def __iter__(self):
+        batches = list(self.batch_sampler)
+        usable = len(batches) - len(batches) % self.world_size
+        return iter(batches[self.rank:usable:self.world_size])
+
+    def __len__(self):
+        return len(self.batch_sampler) // self.world_size
@@ -0,0 +1,56 @@
+"""
+줄 수 / 글자 수 예산에 도달하면 생성을 멈추는 StoppingCriteria
+
+generate_response_a/b 는 답변을 2줄, 100자까지만 쓰는데 예전에는
+max_new_tokens 를 전부 생성한 뒤 잘라냈다. 여기서는 새로 생성된 토큰만
+디코딩해서 예산이 다 차는 순간 (배치라면 해당 행만) 생성을 끝낸다.
+"""
+
+import torch
+from transformers import StoppingCriteria
+
+
+def truncate_response(text, max_lines=2, max_chars=100):
+    """앞뒤 공백을 지우고 max_lines 줄, max_chars 글자까지만 남긴다"""
+    lines = text.strip().split('\n')[:max_lines]
+    return '\n'.join(lines)[:max_chars]
+
+
+def strip_control_chars(text):
+    """줄바꿈/탭을 제외한 제어 문자 제거"""
+    return ''.join(c for c in text if ord(c) >= 0x20 or c in '\n\t')
+
+
+class LineBudgetCriteria(StoppingCriteria):
+    """생성된 텍스트가 줄 수 또는 글자 수 예산을 채우면 멈춤"""
+
+    def __init__(self, tokenizer, prompt_length, max_lines=2, max_chars=100, normalize=None):
+        """
+        Args:
+            tokenizer: 디코딩에 쓸 토크나이저
+            prompt_length (int): 입력(프롬프트) 토큰 길이 (패딩 포함)
+            max_lines (int): 남길 최대 줄 수 (None 이면 제한 없음)
+            max_chars (int): 남길 최대 글자 수 (None 이면 제한 없음)
+            normalize (callable): 예산 계산 전에 텍스트에 적용할 함수
+                (예: strip_control_chars)
+        """
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.normalize = normalize
+
+    def is_full(self, text):
+        """truncate_response() 결과가 더 이상 바뀌지 않으면 True"""
+        if self.normalize is not None:
+            text = self.normalize(text)
+        text = text.lstrip()
+        if self.max_lines is not None and text.count('\n') >= self.max_lines:
+            return True
+        return self.max_chars is not None and len(text) >= self.max_chars
+
+    def __call__(self, input_ids, scores, **kwargs):
+        texts = self.tokenizer.batch_decode(
+            input_ids[:, self.prompt_length:], skip_special_tokens=True
+        )
+        return torch.tensor([self.is_full(t) for t in texts], dtype=torch.bool, device=input_ids.device)
@@ -0,0 +1,260 @@
+"""
+SFT/DPO 코퍼스용 사전 토크나이징 + 메모리 맵 토큰 저장소
+
+4_SFT_DPO_test.py 는 데이터를 파이썬 리스트로 전부 올리고 시작할 때마다 모든 예제를
+토크나이징했다. 여기서는
+
+1. sft_dataset.json (JSON 배열) / .jsonl 을 한 예제씩 스트리밍으로 읽고
+2. 워커 프로세스들이 청크 단위로 병렬 토크나이징해서
+3. 토큰 id 를 tokens.bin (int32) 에 이어 쓰고, 예제별 (offset, 길이, 프롬프트 길이) 를
+   index.bin 에 기록한다.
+
+저장 위치는 "토크나이저 해시 + 원본 파일 + 설정" 으로 정해지므로 다시 실행하면
+토크나이징을 건너뛰고 바로 메모리 맵으로 연다. 학습 중 메모리는 코퍼스 크기와 무관하다.
+
+사용 예:
+    store = build_token_store("sft_dataset.json", tokenizer, max_length=128)
+    store[0]  # {"input_ids": [...], "labels": [...]}
+    LengthBucketSampler(store.lengths, batch_size=16)
+
+DPO 코퍼스 ({"prompt", "chosen", "rejected"}) 는 input_key / output_key 로
+chosen / rejected 저장소를 따로 만든다.
+"""
+
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sft_data import IGNORE_INDEX, tokenize_sft_example
+
+CACHE_DIR = "./token_cache"
+CHUNK_SIZE = 1000
+
+
+# ============================================================================
+# 스트리밍 읽기
+# ============================================================================
+def _iter_json_array(f, buffer_size=1 << 20):
+    """JSON 배열 파일을 전부 올리지 않고 원소를 하나씩 읽음"""
+    decoder = json.JSONDecoder()
+    buffer, pos = "", 0
+    started = eof = False
+    while True:
+        # 공백 / 구분자 건너뛰기
+        while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ",")):
+            pos += 1
+
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("JSON 배열 형식이 아닙니다.")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+                # 버퍼 끝에서 끝난 원소는 잘렸을 수 있으므로 더 읽고 다시 해석
+                if end < len(buffer) or eof:
+                    pos = end
+                    yield obj
+                    continue
+            except json.JSONDecodeError:
+                # 원소가 청크 경계에 걸림 → 더 읽어서 다시 시도
+                if eof:
+                    raise
+
+        if eof:
+            raise ValueError("JSON 배열이 끝나지 않았습니다.")
+        chunk = f.read(buffer_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_examples(path):
+    """.jsonl 은 줄 단위, .json 은 배열 원소 단위로 예제를 하나씩 읽음"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+
+# ============================================================================
+# 캐시 키
+# ============================================================================
+def tokenizer_hash(tokenizer):
+    """어휘 / 병합 규칙 / 특수 토큰이 같으면 같은 해시"""
+    h = hashlib.sha256(type(tokenizer).__name__.encode())
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        h.update(backend.to_str().encode())
+    else:
+        h.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode())
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def _store_key(path, tokenizer, max_length, input_key, output_key):
+    stat = os.stat(path)
+    h = hashlib.sha256()
+    for part in (tokenizer_hash(tokenizer), os.path.abspath(path), stat.st_size, stat.st_mtime_ns,
+                 max_length, input_key, output_key):
+        h.update(str(part).encode())
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{name}-{h.hexdigest()[:16]}"
+
+
+# ============================================================================
+# 병렬 토크나이징
+# ============================================================================
+_worker = {}
+
+
+def _init_worker(tokenizer, max_length, input_key, output_key):
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker.update({"tokenizer": tokenizer, "max_length": max_length,
+                    "input_key": input_key, "output_key": output_key})
+
+
+def _tokenize_chunk(examples):
+    tokenizer = _worker["tokenizer"]
+    results = []
+    for e in examples:
+        example = {"input": e[_worker["input_key"]], "output": e[_worker["output_key"]]}
+        tokens = tokenize_sft_example(tokenizer, example, max_length=_worker["max_length"])
+        prompt_len = sum(1 for label in tokens["labels"] if label == IGNORE_INDEX)
+        results.append((tokens["input_ids"], prompt_len))
+    return results
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _tokenized_chunks(path, tokenizer, max_length, input_key, output_key, workers=None):
+    """청크별 토크나이징 결과를 원본 순서대로 내보냄"""
+    initargs = (tokenizer, max_length, input_key, output_key)
+    chunks = _chunks(iter_examples(path), CHUNK_SIZE)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(*initargs)
+        yield from map(_tokenize_chunk, chunks)
+        return
+
+    # 모델 / OpenMP 스레드가 이미 올라간 학습 프로세스를 fork 하지 않도록 항상 spawn
+    # (spawn 워커는 호출한 스크립트를 다시 import 하므로 스크립트 본문은 __main__ 가드 안에 있어야 함)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=initargs) as pool:
+        # 한 번에 workers * 2 개 청크만 띄워 두고 순서대로 기록 (파일 전체를 올리지 않음)
+        pending = collections.deque()
+        while True:
+            for chunk in itertools.islice(chunks, workers * 2 - len(pending)):
+                pending.append(pool.submit(_tokenize_chunk, chunk))
+            if not pending:
+                return
+            yield pending.popleft().result()
+
+
+def _memmap(path, dtype):
+    # 빈 파일은 mmap 할 수 없음 (예제가 0개인 경우)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class TokenStore:
+    """tokens.bin / index.bin 을 메모리 맵으로 여는 읽기 전용 데이터셋"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.tokens = _memmap(os.path.join(store_dir, "tokens.bin"), np.int32)
+        self.index = _memmap(os.path.join(store_dir, "index.bin"), np.int64).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        offset, length, prompt_len = (int(x) for x in self.index[i])
+        input_ids = self.tokens[offset:offset + length].tolist()
+        labels = [IGNORE_INDEX] * prompt_len + input_ids[prompt_len:]
+        return {"input_ids": input_ids, "labels": labels}
+
+    @property
+    def lengths(self):
+        """예제별 토큰 길이 (LengthBucketSampler 용)"""
+        return self.index[:, 1].tolist()
+
+
+def build_token_store(path, tokenizer, max_length=128, cache_dir=CACHE_DIR, workers=None,
+                      input_key="input", output_key="output"):
+    """
+    데이터 파일을 토크나이징해서 메모리 맵 저장소로 만든다 (이미 있으면 바로 연다)
+
+    Args:
+        path (str): .json (배열) 또는 .jsonl 파일
+        tokenizer: 토크나이저 (해시가 캐시 키에 들어감)
+        max_length (int): 예제 최대 토큰 수
+        cache_dir (str): 저장소를 만들 디렉터리
+        workers (int): 토크나이징 워커 프로세스 수 (None 이면 CPU 수)
+        input_key / output_key (str): 입력 / 출력 필드 이름
+
+    Returns:
+        TokenStore
+    """
+    store_dir = os.path.join(cache_dir, _store_key(path, tokenizer, max_length, input_key, output_key))
+    if os.path.exists(os.path.join(store_dir, "meta.json")):
+        store = TokenStore(store_dir)
+        print(f"✅ 토큰 캐시 사용: {store_dir} (예제 {len(store)}개, 토큰 {store.meta['tokens']}개)")
+        return store
+
+    print(f"🔄 토크나이징 중: {path} → {store_dir}")
+    start = time.perf_counter()
+    tmp_dir = store_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    count, offset = 0, 0
+    with open(os.path.join(tmp_dir, "tokens.bin"), "wb") as tokens_file, \
+            open(os.path.join(tmp_dir, "index.bin"), "wb") as index_file:
+        for results in _tokenized_chunks(path, tokenizer, max_length, input_key, output_key, workers):
+            for input_ids, prompt_len in results:
+                tokens_file.write(np.asarray(input_ids, dtype=np.int32).tobytes())
+                index_file.write(np.asarray([offset, len(input_ids), prompt_len], dtype=np.int64).tobytes())
+                offset += len(input_ids)
+                count += 1
+
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "source": os.path.abspath(path),
+            "tokenizer_hash": tokenizer_hash(tokenizer),
+            "max_length": max_length,
+            "input_key": input_key,
+            "output_key": output_key,
+            "examples": count,
+            "tokens": offset,
+        }, f, ensure_ascii=False, indent=2)
+    # 다 쓴 뒤에 이름을 바꿔서 중간에 끊긴 저장소를 캐시로 쓰지 않게 함
+    os.replace(tmp_dir, store_dir)
+
+    print(f"✅ 토크나이징 완료: 예제 {count}개, 토큰 {offset}개, {time.perf_counter() - start:.1f}초")
+    return TokenStore(store_dir)
@@ -0,0 +1,187 @@
+"""
+학습 step 별 처리량 / 시간 분해 기록 + torch.profiler 구간
+
+4_SFT_DPO_test.py 는 step 마다 Loss 만 출력해서 느린 원인이 패딩인지, 스레드인지,
+optimizer 인지 알 수 없었다. StepMetrics 는 step 마다
+
+- tokens/sec (패딩 제외 실제 토큰 기준), 패딩 비율
+- step 시간 = data (배치 만들기) + forward + backward + optimizer
+- 최대 RSS
+
+를 JSONL 로 한 줄씩 기록하고, 끝나면 구간별 시간 비중을 요약한다.
+profile=(건너뛸 step 수, 기록할 step 수) 를 주면 그 구간만 torch.profiler 로 기록해서
+Chrome trace (chrome://tracing, https://ui.perfetto.dev) 로 내보낸다.
+
+시간은 CPU 기준이다 (GPU 처럼 비동기 실행이 없으므로 구간 끝에서 바로 잼).
+
+사용 예:
+    metrics = StepMetrics("sft_metrics.jsonl", profile=(5, 3))
+    for step, batch in enumerate(metrics.timed(loader)):
+        with metrics.phase("forward"):
+            loss = model(**batch).loss
+        with metrics.phase("backward"):
+            loss.backward()
+        with metrics.phase("optimizer"):
+            optimizer.step()
+        metrics.end_step(batch, loss.item(), epoch=0, step=step + 1)
+    metrics.close()
+"""
+
+import contextlib
+import json
+import os
+import time
+
+import torch
+
+from perf_utils import peak_rss_mb
+
+PHASES = ("data", "forward", "backward", "optimizer")
+
+
+class StepMetrics:
+    """step 구간별 시간 측정 + JSONL 기록 (+ 선택적으로 profiler)"""
+
+    def __init__(self, path=None, profile=None, profile_dir="./profiles"):
+        """
+        Args:
+            path (str): 기록할 JSONL 파일 (None 이면 파일에 쓰지 않음, 이어서 씀)
+            profile (tuple): (건너뛸 step 수, 기록할 step 수). 이 구간만 profiler 로 기록 (None 이면 사용 안 함)
+            profile_dir (str): Chrome trace 저장 디렉터리
+        """
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+        self.run = time.strftime("%Y%m%d-%H%M%S")
+
+        self.steps = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+        self.total_sec = 0.0
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self._times = dict.fromkeys(PHASES, 0.0)
+        self._step_start = None
+
+        self.profiler = None
+        if profile:
+            self.profiler = _make_profiler(profile[0], profile[1], profile_dir, self.run)
+            self.profiler.start()
+
+    def timed(self, loader):
+        """배치를 꺼내는 시간을 data 구간으로 재면서 loader 를 순회"""
+        it = iter(loader)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(it)
+            except StopIteration:
+                return
+            now = time.perf_counter()
+            self._times = dict.fromkeys(PHASES, 0.0)
+            self._times["data"] = now - start
+            self._step_start = start
+            yield batch
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """with 블록 시간을 name 구간에 더함 (profiler 사용 중이면 trace 에도 이름을 남김)"""
+        start = time.perf_counter()
+        with torch.profiler.record_function(name) if self.profiler else contextlib.nullcontext():
+            yield
+        self._times[name] += time.perf_counter() - start
+
+    def end_step(self, batch, loss, **fields):
+        """
+        한 step 을 마치고 기록
+
+        Args:
+            batch (dict): attention_mask 로 실제 / 패딩 토큰 수를 셈
+            loss (float): 이 step 의 loss
+            **fields: epoch, step 등 함께 기록할 값
+
+        Returns:
+            dict: 기록한 값
+        """
+        step_sec = time.perf_counter() - self._step_start
+        mask = batch["attention_mask"]
+        tokens = int(mask.sum())
+        padded = mask.numel()
+
+        self.steps += 1
+        self.tokens += tokens
+        self.padded_tokens += padded
+        self.total_sec += step_sec
+        for name in PHASES:
+            self.totals[name] += self._times[name]
+
+        record = dict(fields, run=self.run, loss=loss, tokens=tokens, padded_tokens=padded,
+                      padding_ratio=1 - tokens / padded, tokens_per_sec=tokens / step_sec,
+                      step_sec=step_sec, peak_rss_mb=peak_rss_mb())
+        for name in PHASES:
+            record[f"{name}_sec"] = self._times[name]
+        if self._file:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+        if self.profiler:
+            self.profiler.step()
+        return record
+
+    def summary(self):
+        """
+        Returns:
+            dict: 전체 tokens/sec, 패딩 비율, 구간별 시간 비중 (other: 체크포인트 / 출력 등 나머지)
+        """
+        total = self.total_sec
+        totals = dict(self.totals, other=max(0.0, total - sum(self.totals.values())))
+        return {
+            "steps": self.steps,
+            "tokens_per_sec": self.tokens / total if total else 0.0,
+            "padding_ratio": 1 - self.tokens / self.padded_tokens if self.padded_tokens else 0.0,
+            "share": {name: (sec / total if total else 0.0) for name, sec in totals.items()},
+        }
+
+    def print_summary(self):
+        s = self.summary()
+        shares = ", ".join(f"{name} {share * 100:.0f}%" for name, share in s["share"].items())
+        print(f"⏱️ 학습 처리량: {s['tokens_per_sec']:.0f} tokens/s ({s['steps']} step, "
+              f"패딩 {s['padding_ratio'] * 100:.1f}%)")
+        print(f"⏱️ step 시간 비중: {shares}")
+
+    def close(self):
+        if self.profiler:
+            # 구간이 끝나기 전에 학습이 끝났어도 지금까지 기록한 것은 내보냄
+            self.profiler.stop()
+            self.profiler = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def _make_profiler(start_step, num_steps, profile_dir, run):
+    os.makedirs(profile_dir, exist_ok=True)
+    trace_path = os.path.join(profile_dir, f"trace-{run}.json")
+
+    def on_trace_ready(prof):
+        prof.export_chrome_trace(trace_path)
+        print(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=10))
+        print(f"✅ Chrome trace 저장: {trace_path} (step {start_step + 1} ~ {start_step + num_steps})")
+
+    # 시작 step 전까지는 기록하지 않고 (wait), 한 step 은 워밍업으로 버림
+    warmup = 1 if start_step > 0 else 0
+    return torch.profiler.profile(
+        activities=[torch.profiler.ProfilerActivity.CPU],
+        schedule=torch.profiler.schedule(wait=start_step - warmup, warmup=warmup, active=num_steps, repeat=1),
+        on_trace_ready=on_trace_ready,
+        record_shapes=True,
+        with_stack=False,
+    )
+
+
+def parse_profile(value):
+    """환경 변수 "건너뛸 step 수,기록할 step 수" (예: "5,3") → (5, 3). 빈 값이면 None"""
+    if not value:
+        return None
+    start, steps = (int(x) for x in value.split(","))
+    return start, steps
@@ -0,0 +1,387 @@
+"""
+FAISS biased DB 증분 업데이트 (추가 / 수정 / 삭제)
+
+2_generate_vecotor_db.py 는 실행할 때마다 모든 문장을 다시 임베딩해서 인덱스를 새로 만들었다.
+VectorStore 는 문서마다 고정 id 를 주고 내용 해시를 함께 기록해 두어서
+
+- diff(): 현재 코퍼스와 비교해 새로 생겼거나 내용이 바뀐 문서 / 사라진 문서를 찾고
+- upsert(): 그 문서들만 임베딩해서 같은 id 로 인덱스에 넣고 (수정이면 기존 벡터를 지움)
+- delete(): 문서를 인덱스에서 지운다.
+
+인덱스 종류는 ann_index 의 flat / ivf-flat / ivf-pq / hnsw 중 하나다. IVF 계열은 처음 추가하는
+벡터 중 앞쪽 train_size 개로 군집을 학습하고, 이후 추가분은 학습된 군집에 넣는다.
+
+파일 (저장할 때마다 세대 NNNNNN 을 하나 늘려 새 이름으로 씀):
+- biased_db.NNNNNN.index: FAISS 인덱스, 벡터 id = 문서 id (3_use_vecotr.py 는 mmap 으로 엶)
+- biased_db.NNNNNN.bin / .idx: 문장 utf-8 을 이어 붙인 파일 + id 순 (id, offset, 길이) int64 배열
+  (TextStore 가 메모리 맵으로 열어서 검색된 문장만 읽음)
+- biased_db.NNNNNN.manifest.jsonl: 첫 줄은 {"embedder": 임베딩 설정 (Embedder.info())}, 이후 문서마다
+  {"id", "key", "hash"} 한 줄 (증분 업데이트용). 임베딩 모델 / max_length 등이 바뀌면 이전 벡터와
+  섞이지 않도록 Vector DB 를 새로 만든다
+- biased_db.current: 지금 세대 번호. 새 세대 파일 네 개를 다 쓴 뒤 이 파일 하나만 이름 변경으로
+  바꾸므로, 중간에 끊기거나 그 순간 여는 프로세스도 항상 같은 세대의 인덱스 / 문장 / manifest 를 본다
+
+문서 key 는 원본에 id 필드가 있으면 그 값, 없으면 내용 해시다 (같은 문장은 한 번만 저장).
+
+사용 예:
+    embedder = embedding_service.get_embedder()
+    store = VectorStore(embedder_info=embedder.info())
+    changed, removed = store.diff(iter_documents("biased_corpus.jsonl"), delete_missing=True)
+    store.delete(removed)
+    store.upsert(changed, embedder)
+    store.save()
+"""
+
+import hashlib
+import json
+import os
+
+import faiss
+import numpy as np
+
+from ann_index import create_index, index_kind, remove_ids, train_size
+from token_store import iter_examples
+
+DB_PREFIX = "biased_db"
+# 세대 하나를 이루는 파일 확장자 ({prefix}.NNNNNN.{확장자})
+GENERATION_FILES = ("index", "manifest.jsonl", "bin", "idx")
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def iter_documents(path, text_key="text", key_field="id"):
+    """
+    .txt 는 줄 단위, .json (배열) / .jsonl 은 원소 단위로 (key, 문장) 을 하나씩 읽음
+
+    Args:
+        text_key (str): 원소가 dict 일 때 문장 필드
+        key_field (str): 원소가 dict 이고 이 필드가 있으면 문서 key 로 사용 (없으면 내용 해시)
+    """
+    if path.endswith(".txt"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    text = line.rstrip("\n")
+                    yield content_hash(text), text
+        return
+    for item in iter_examples(path):
+        if isinstance(item, str):
+            yield content_hash(item), item
+        elif key_field in item:
+            yield str(item[key_field]), item[text_key]
+        else:
+            yield content_hash(item[text_key]), item[text_key]
+
+
+def _memmap(path, dtype):
+    # 빈 파일은 mmap 할 수 없음 (문서가 0개인 경우)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def current_generation(prefix=DB_PREFIX):
+    """{prefix}.current 가 가리키는 세대 번호 (아직 저장한 적 없으면 None)"""
+    try:
+        with open(prefix + ".current", "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def generation_paths(prefix=DB_PREFIX, generation=None):
+    """
+    세대 하나의 파일 경로 {"index", "manifest.jsonl", "bin", "idx"} (generation 이 None 이면 지금 세대)
+
+    Raises:
+        FileNotFoundError: 아직 저장한 세대가 없을 때
+    """
+    if generation is None:
+        generation = current_generation(prefix)
+        if generation is None:
+            raise FileNotFoundError(f"{prefix}.current 가 없습니다 (Vector DB 를 먼저 만드세요).")
+    return {ext: f"{prefix}.{generation:06d}.{ext}" for ext in GENERATION_FILES}
+
+
+def _publish(prefix, generation):
+    """{prefix}.current 를 generation 으로 바꾸고 직전 세대보다 오래된 세대 파일을 지움
+
+    직전 세대는 막 .current 를 읽은 프로세스가 열 수 있도록 남겨 둔다
+    (이미 mmap 으로 연 프로세스는 파일을 지워도 계속 읽음).
+    """
+    with open(prefix + ".current.tmp", "w", encoding="utf-8") as f:
+        f.write(str(generation))
+    os.replace(prefix + ".current.tmp", prefix + ".current")
+
+    directory, base = os.path.split(prefix)
+    for name in os.listdir(directory or "."):
+        number, _, ext = name[len(base) + 1:].partition(".")
+        if name.startswith(base + ".") and ext in GENERATION_FILES and number.isdigit() \
+                and int(number) < generation - 1:
+            os.remove(os.path.join(directory, name))
+
+
+class TextStore:
+    """세대 하나의 .bin / .idx 를 메모리 맵으로 여는 읽기 전용 id → 문장 조회"""
+
+    def __init__(self, paths):
+        """
+        Args:
+            paths (dict): generation_paths() 결과 (세대 파일은 한 번 쓰면 바뀌지 않으므로 두 파일은 항상 짝이 맞음)
+        """
+        self.data = _memmap(paths["bin"], np.uint8)
+        self.index = _memmap(paths["idx"], np.int64).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _row(self, doc_id):
+        # .idx 는 id 순으로 정렬돼 있으므로 이진 탐색
+        row = int(np.searchsorted(self.index[:, 0], doc_id))
+        if row < len(self.index) and self.index[row, 0] == doc_id:
+            return row
+        return None
+
+    def __contains__(self, doc_id):
+        return self._row(doc_id) is not None
+
+    def __getitem__(self, doc_id):
+        row = self._row(doc_id)
+        if row is None:
+            raise KeyError(doc_id)
+        _, offset, length = (int(x) for x in self.index[row])
+        return bytes(self.data[offset:offset + length]).decode("utf-8")
+
+
+def read_embedder_info(manifest_path):
+    """manifest 에 기록된 임베딩 설정 (없으면 None)"""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        record = json.loads(f.readline() or "null")
+    return record.get("embedder") if isinstance(record, dict) else None
+
+
+def write_texts(paths, items):
+    """
+    (id, 문장) 을 id 순서대로 받아 paths["bin"] / paths["idx"] 로 저장
+
+    Returns:
+        int: 저장한 문장 수
+    """
+    count, offset = 0, 0
+    with open(paths["bin"], "wb") as data_file, open(paths["idx"], "wb") as index_file:
+        for doc_id, text in items:
+            data = text.encode("utf-8")
+            data_file.write(data)
+            index_file.write(np.asarray([doc_id, offset, len(data)], dtype=np.int64).tobytes())
+            offset += len(data)
+            count += 1
+    return count
+
+
+class VectorStore:
+    """문서 key → 고정 id / 내용 해시 를 관리하는 FAISS 인덱스"""
+
+    def __init__(self, prefix=DB_PREFIX, index_type="flat", nlist=1024, pq_m=64, hnsw_m=32, embedder_info=None):
+        """
+        Args:
+            prefix (str): Vector DB 파일 이름 앞부분 ({prefix}.current 와 세대별 파일, 있으면 불러옴)
+            index_type (str): flat / ivf-flat / ivf-pq / hnsw (기존 인덱스와 다르면 새로 만듦)
+            nlist / pq_m / hnsw_m: ann_index.create_index 설정
+            embedder_info (dict): 이번에 쓸 임베딩의 info() (저장된 설정과 다르면 새로 만듦,
+                None 이면 저장된 설정을 그대로 씀)
+        """
+        self.prefix = prefix
+        self.index_type = index_type
+        self.index_options = {"nlist": nlist, "pq_m": pq_m, "hnsw_m": hnsw_m}
+        self.embedder_info = embedder_info
+        self.index = None
+        self.docs = {}
+        self.next_id = 0
+        # 저장된 문장 (메모리 맵) + 아직 저장하지 않은 새 문장
+        self.texts = None
+        self.new_texts = {}
+
+        if current_generation(prefix) is not None:
+            self._load(generation_paths(prefix))
+
+    def _load(self, paths):
+        # .current 를 한 번만 읽어서 얻은 세대의 파일만 열므로 인덱스 / 문장 / manifest 는 같은 세대
+        docs, saved_info = {}, None
+        with open(paths["manifest.jsonl"], "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if "embedder" in record:
+                    saved_info = record["embedder"]
+                    continue
+                docs[record["key"]] = record
+
+        if self.embedder_info is not None and saved_info != self.embedder_info:
+            # 설정을 기록하지 않은 이전 manifest 도 어떤 설정으로 만들었는지 모르므로 새로 만듦
+            print(f"⚠️ 임베딩 설정이 {saved_info} → {self.embedder_info} 로 바뀌어 Vector DB 를 새로 만듭니다.")
+            return
+
+        texts = TextStore(paths)
+        if len(texts) != len(docs):
+            print(f"⚠️ 문장 파일({paths['bin']}) 이 manifest 와 맞지 않아 Vector DB 를 새로 만듭니다.")
+            return
+
+        index = faiss.read_index(paths["index"])
+        if index.ntotal != len(docs):
+            print(f"⚠️ 인덱스({index.ntotal}개) 와 문서({len(docs)}개) 수가 달라 Vector DB 를 새로 만듭니다.")
+            return
+        if index_kind(index) != self.index_type:
+            print(f"⚠️ 인덱스 종류가 {index_kind(index)} → {self.index_type} 로 바뀌어 Vector DB 를 새로 만듭니다.")
+            return
+        self.index = index
+        self.docs = docs
+        self.texts = texts
+        self.next_id = max((d["id"] for d in docs.values()), default=-1) + 1
+        self.embedder_info = saved_info
+        print(f"✅ Vector DB 로드: {paths['index']} (문서 {len(docs)}개)")
+
+    def __len__(self):
+        return len(self.docs)
+
+    def diff(self, documents, delete_missing=False):
+        """
+        현재 문서 목록과 비교
+
+        Args:
+            documents (iterable): (key, 문장)
+            delete_missing (bool): True 면 documents 에 없는 기존 문서를 삭제 대상으로 돌려줌
+
+        Returns:
+            tuple: (새로 생겼거나 바뀐 [(key, 문장)], 삭제할 [key])
+        """
+        changed, seen = {}, set()
+        for key, text in documents:
+            seen.add(key)
+            doc = self.docs.get(key)
+            if doc is None or doc["hash"] != content_hash(text):
+                changed[key] = text
+            else:
+                changed.pop(key, None)
+        removed = [key for key in self.docs if key not in seen] if delete_missing else []
+        print(f"🔎 변경 확인: 새로 추가/수정 {len(changed)}개, 삭제 {len(removed)}개, "
+              f"그대로 {len(seen) - len(changed)}개")
+        return list(changed.items()), removed
+
+    def upsert(self, documents, embedder, chunk_size=3200):
+        """
+        문서를 임베딩해서 추가 (이미 있는 key 는 같은 id 로 교체, 내용이 같으면 건너뜀)
+
+        Args:
+            documents (list): (key, 문장)
+            embedder: encode_many() 가 있는 embedding_service.Embedder / EmbeddingClient
+            chunk_size (int): encode_many() 한 번에 넘길 문장 수 (메모리에는 이만큼의 벡터만 올라감)
+
+        Returns:
+            tuple: (추가 수, 수정 수)
+
+        Raises:
+            ValueError: embedder 설정이 이미 저장된 벡터의 임베딩 설정과 다를 때
+        """
+        info = embedder.info()
+        if self.docs and self.embedder_info is not None and info != self.embedder_info:
+            raise ValueError(f"Vector DB 는 {self.embedder_info} 로 임베딩했는데 {info} 로 추가하려고 합니다. "
+                             f"VectorStore(embedder_info=embedder.info()) 로 열면 새로 만듭니다.")
+        self.embedder_info = info
+
+        pending = {}
+        for key, text in documents:
+            doc = self.docs.get(key)
+            if doc is None or doc["hash"] != content_hash(text):
+                pending[key] = text
+        if not pending:
+            return 0, 0
+
+        keys = list(pending)
+        updated = [self.docs[key]["id"] for key in keys if key in self.docs]
+        ids = []
+        for key in keys:
+            if key in self.docs:
+                ids.append(self.docs[key]["id"])
+            else:
+                ids.append(self.next_id)
+                self.next_id += 1
+        ids = np.asarray(ids, dtype=np.int64)
+
+        if updated and self.index is not None:
+            self.index = remove_ids(self.index, updated)
+        texts = [pending[key] for key in keys]
+        # 인덱스가 아직 없으면 학습에 쓸 만큼 모았다가 만들고 나서 추가 (flat / hnsw 는 첫 배치에서 바로)
+        buffer, needed = [], train_size(self.index_type, self.index_options["nlist"])
+        for start in range(0, len(texts), chunk_size):
+            embeddings = embedder.encode_many(texts[start:start + chunk_size])
+            chunk_ids = ids[start:start + chunk_size]
+            if self.index is not None:
+                self.index.add_with_ids(embeddings, chunk_ids)
+                continue
+            buffer.append((chunk_ids, embeddings))
+            if sum(len(e) for _, e in buffer) >= needed:
+                self._create(buffer)
+                buffer = []
+        if buffer:
+            self._create(buffer)
+
+        for key, doc_id, text in zip(keys, ids.tolist(), texts):
+            self.docs[key] = {"id": doc_id, "key": key, "hash": content_hash(text)}
+            self.new_texts[doc_id] = text
+        print(f"✅ 임베딩 반영: 추가 {len(keys) - len(updated)}개, 수정 {len(updated)}개")
+        return len(keys) - len(updated), len(updated)
+
+    def _create(self, buffer):
+        ids = np.concatenate([i for i, _ in buffer])
+        vectors = np.concatenate([e for _, e in buffer])
+        self.index = create_index(self.index_type, vectors.shape[1], train_vectors=vectors, **self.index_options)
+        self.index.add_with_ids(vectors, ids)
+
+    def delete(self, keys):
+        """
+        Returns:
+            int: 삭제한 문서 수
+        """
+        ids = [self.docs.pop(key)["id"] for key in keys if key in self.docs]
+        for doc_id in ids:
+            self.new_texts.pop(doc_id, None)
+        if ids and self.index is not None:
+            self.index = remove_ids(self.index, ids)
+        if ids:
+            print(f"🗑️ 문서 삭제: {len(ids)}개")
+        return len(ids)
+
+    def text(self, doc_id):
+        """id 의 문장 (아직 저장하지 않은 새 문장 포함)"""
+        if doc_id in self.new_texts:
+            return self.new_texts[doc_id]
+        return self.texts[doc_id]
+
+    def save(self):
+        """
+        인덱스 / 문장 / manifest 를 새 세대 파일에 다 쓴 뒤 {prefix}.current 를 바꿔서 한 번에 공개
+
+        중간에 끊기면 .current 가 이전 세대를 그대로 가리키고, 이전 세대 파일은 바꾸지 않으므로
+        이미 mmap 으로 열어 둔 프로세스도 계속 안전하게 읽는다.
+        """
+        if self.index is None:
+            raise ValueError("저장할 문서가 없습니다.")
+        previous = current_generation(self.prefix)
+        generation = 0 if previous is None else previous + 1
+        paths = generation_paths(self.prefix, generation)
+        docs = sorted(self.docs.values(), key=lambda d: d["id"])
+        # 바뀌지 않은 문장은 이전 세대 파일에서 한 건씩 읽어서 옮겨 씀 (전체를 메모리에 올리지 않음)
+        write_texts(paths, ((d["id"], self.text(d["id"])) for d in docs))
+        faiss.write_index(self.index, paths["index"])
+        with open(paths["manifest.jsonl"], "w", encoding="utf-8") as f:
+            if self.embedder_info is not None:
+                f.write(json.dumps({"embedder": self.embedder_info}, ensure_ascii=False) + "\n")
+            for doc in docs:
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+        _publish(self.prefix, generation)
+        self.texts = TextStore(paths)
+        self.new_texts = {}
+        print(f"✅ Vector DB 저장 완료: {paths['index']} (문서 {len(self.docs)}개)")
@@ -9,10 +9,19 @@ import os
 import json
 import time
 from datetime import datetime
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 
 load_dotenv()
 API_KEY = os.getenv("CLOVA_API_KEY")
+# 로컬 서버(251110_junhyeok_test_eeve/local_llm_server.py)를 쓰려면 이 URL 만 바꾸면 됨
+API_URL = os.getenv(
+    "CLOVA_API_URL",
+    "https://clovastudio.stream.ntruss.com/testapp/v1/chat-completions/HCX-003"
+)
+# 로컬 서버는 API 키를 확인하지 않으므로 키 없이도 호출 (그 외에는 키가 없으면 시뮬레이션)
+IS_LOCAL_API = urlparse(API_URL).hostname in ("localhost", "127.0.0.1", "::1")
+USE_API = bool(API_KEY) or IS_LOCAL_API
 
 
 class DialogueAgent:
@@ -81,17 +90,17 @@ class DialogueAgent:
         })
         
         # API 호출 (실제 구현)
-        if not API_KEY:
-            # API 키가 없으면 시뮬레이션
+        if not USE_API:
+            # API 키가 없고 로컬 서버도 아니면 시뮬레이션
             return self._simulate_response(opponent_message)
         
         try:
             import requests
             
             response = requests.post(
-                "https://clovastudio.stream.ntruss.com/testapp/v1/chat-completions/HCX-003",
+                API_URL,
                 headers={
-                    "Authorization": f"Bearer {API_KEY}",
+                    "Authorization": f"Bearer {API_KEY or 'local'}",
                     "Content-Type": "application/json"
                 },
                 json={
@@ -352,7 +361,7 @@ def main():
     print("🤖 2-Agent 대화 시스템 데모")
     print("="*80)
     
-    if not API_KEY:
+    if not USE_API:
         print("\n⚠️ API 키가 설정되지 않았습니다.")
         print("시뮬레이션 모드로 실행됩니다.\n")
     